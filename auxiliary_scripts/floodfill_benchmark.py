@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+###############################################################################
+#                                                                             #
+#    This file is part of 3d Brain Atlas Reconstructor                        #
+#                                                                             #
+#    Copyright (C) 2010-2012 Piotr Majka, Jakub M. Kowalski                   #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is free software: you can redistribute      #
+#    it and/or modify it under the terms of the GNU General Public License    #
+#    as published by the Free Software Foundation, either version 3 of        #
+#    the License, or (at your option) any later version.                      #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is distributed in the hope that it          #
+#    will be useful, but WITHOUT ANY WARRANTY; without even the implied       #
+#    warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.         #
+#    See the GNU General Public License for more details.                     #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along  with  3d  Brain  Atlas  Reconstructor.   If  not,  see            #
+#    http://www.gnu.org/licenses/.                                            #
+#                                                                             #
+###############################################################################
+
+"""
+Compare the scanline flood fill (C{floodFillScanlineStack}) with the vectorised
+one (C{floodFillEngine}) on contour slides.
+
+Usage::
+    python floodfill_benchmark.py <contour slide> [<contour slide> ...]
+
+Contour slides are either pretraced SVG slides (seeds are taken from their
+regular labels) or bitmaps (seeds are placed on a regular grid of white
+pixels). As during tracing, every seed is flooded in every image of the gap
+filling cache. Flooded images of both algorithms are compared and the time
+of flooding is reported.
+"""
+
+import sys
+import time
+import numpy as np
+from PIL import Image, ImageFilter
+
+from bar.base import barPretracedSlideRenderer, BAR_TRACER_DEFAULT_SETTINGS
+from bar.image_process import floodFillScanlineStack, floodFillEngine
+
+# Distance (in pixels) between seeds placed in bitmaps
+SEED_GRID_STEP = 25
+
+
+def loadContourSlide(filename):
+    """
+    @return: rendered contour slide (non-white pixels replaced by boundary
+             colour) and seeds coordinates
+    @rtype: (PIL.Image.Image, [(int, int), ...])
+    """
+    boundaryColour = BAR_TRACER_DEFAULT_SETTINGS['GrowDefaultBoundaryColor']
+
+    if filename.lower().endswith('.svg'):
+        slide = barPretracedSlideRenderer.fromXML(filename)
+        image = slide.renderSlide()
+        seeds = [slide._toImageCoordinates(label.Location)\
+                 for label in slide.getRegularLabels()]
+    else:
+        image = Image.open(filename).convert('L')
+        seeds = [(x, y) for y in xrange(0, image.size[1], SEED_GRID_STEP)\
+                        for x in xrange(0, image.size[0], SEED_GRID_STEP)]
+
+    image = Image.eval(image, lambda x: 255 if x == 255 else boundaryColour)
+    return (image, [xy for xy in seeds if image.getpixel(xy) == 255])
+
+def getImageCache(image):
+    """
+    @return: images with consecutively grown contours (as in the tracer)
+    @rtype: [PIL.Image.Image, ...]
+    """
+    intensity  = BAR_TRACER_DEFAULT_SETTINGS['MinFiterTimesApplication']
+    cacheLevel = BAR_TRACER_DEFAULT_SETTINGS['CacheLevel']
+
+    imageCache = [image]
+    for l in range(cacheLevel):
+        imageCache.append(imageCache[-1].filter(ImageFilter.MinFilter(intensity)))
+    return imageCache
+
+def benchmarkSlide(filename):
+    """
+    @return: number of fills, time of scanline fills, time of vectorised fills
+             and the number of fills with different results
+    @rtype: (int, float, float, int)
+    """
+    image, seeds = loadContourSlide(filename)
+    imageCache = getImageCache(image)
+
+    scanlineResults = []
+    start = time.time()
+    for cachedImage in imageCache:
+        for xy in seeds:
+            flooded = cachedImage.copy()
+            npix = floodFillScanlineStack(flooded, xy, 0)
+            scanlineResults.append((flooded, npix))
+    scanlineTime = time.time() - start
+
+    engineResults = []
+    start = time.time()
+    for cachedImage in imageCache:
+        engine = floodFillEngine(cachedImage)
+        for xy in seeds:
+            engineResults.append(engine.fill(xy, 0))
+    engineTime = time.time() - start
+
+    mismatches = 0
+    for ((scanline, n1), (engine, n2)) in zip(scanlineResults, engineResults):
+        if n1 != n2 or not np.array_equal(np.asarray(scanline), engine):
+            mismatches += 1
+
+    return (len(engineResults), scanlineTime, engineTime, mismatches)
+
+def main(filenames):
+    print "%-40s %6s %12s %12s %8s %10s" %\
+            ('slide', 'fills', 'scanline [s]', 'engine [s]', 'speedup', 'mismatches')
+
+    total = [0, 0., 0., 0]
+    for filename in filenames:
+        result = benchmarkSlide(filename)
+        total = map(lambda x, y: x + y, total, result)
+        print "%-40s %6d %12.3f %12.3f %8.1f %10d" %\
+                ((filename[-40:],) + result[:3] +\
+                 (result[1] / max(result[2], 1e-9), result[3]))
+
+    print "%-40s %6d %12.3f %12.3f %8.1f %10d" %\
+            (('total',) + tuple(total[:3]) +\
+             (total[1] / max(total[2], 1e-9), total[3]))
+
+    return total[3] == 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+###############################################################################
+#                                                                             #
+#    This file is part of 3d Brain Atlas Reconstructor                        #
+#                                                                             #
+#    Copyright (C) 2010-2012 Piotr Majka, Jakub M. Kowalski                   #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is free software: you can redistribute      #
+#    it and/or modify it under the terms of the GNU General Public License    #
+#    as published by the Free Software Foundation, either version 3 of        #
+#    the License, or (at your option) any later version.                      #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is distributed in the hope that it          #
+#    will be useful, but WITHOUT ANY WARRANTY; without even the implied       #
+#    warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.         #
+#    See the GNU General Public License for more details.                     #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along  with  3d  Brain  Atlas  Reconstructor.   If  not,  see            #
+#    http://www.gnu.org/licenses/.                                            #
+#                                                                             #
+###############################################################################
+
+"""
+Check that parallel parsing (L{barGenericParser.processes}) produces the same
+CAF slides as serial parsing.
+
+Usage::
+    python parallel_parsing_check.py <parsing module> <source directory>
+                                     <first slide> <last slide> [<processes>]
+
+The script has to be run from the main directory of the repository: the
+parsing module is imported from C{bin/parsers} (as in C{parser_pax.py})
+and its C{AtlasParser} parses the slide range twice: serially and with given
+number of worker processes (4 by default), each time into a new temporary
+directory. All files of both output directories are compared byte by byte,
+as well as slide records of the CAF slides indexed during parsing. Output
+directories are removed only if the results are identical.
+"""
+
+import os
+import sys
+import shutil
+import filecmp
+import tempfile
+
+# Number of worker processes used if not given
+DEFAULT_PROCESSES = 4
+
+
+def parseSlides(atlasparser, sourceDirectory, slideRange, processes):
+    """
+    @return: output directory and records of slides indexed by the parser
+    @rtype: (str, {int : tuple})
+    """
+    outputDirectory = tempfile.mkdtemp(prefix = 'parsing%d_' % processes)
+    parser = atlasparser.AtlasParser(sourceDirectory, outputDirectory)
+    parser.processes = processes
+    parser.parseRange(slideRange[0], slideRange[-1])
+    return (outputDirectory, parser.indexer.getSlideRecords())
+
+def compareDirectories(serialDirectory, parallelDirectory):
+    """
+    @return: names of files which are missing in any directory or differ
+    @rtype: [str, ...]
+    """
+    serialFiles = set(os.listdir(serialDirectory))
+    parallelFiles = set(os.listdir(parallelDirectory))
+    common = sorted(serialFiles & parallelFiles)
+    (match, mismatch, errors) = filecmp.cmpfiles(serialDirectory,
+                                                 parallelDirectory,
+                                                 common, shallow = False)
+    return sorted(serialFiles ^ parallelFiles) + mismatch + errors
+
+def main(parsingModule, sourceDirectory, firstSlide, lastSlide,
+         processes = DEFAULT_PROCESSES):
+    sys.path.append('bin/parsers')
+    atlasparser = __import__(parsingModule, globals(), locals(), [], -1)
+    slideRange = range(firstSlide, lastSlide + 1)
+
+    (serialDirectory, serialRecords) =\
+            parseSlides(atlasparser, sourceDirectory, slideRange, 1)
+    (parallelDirectory, parallelRecords) =\
+            parseSlides(atlasparser, sourceDirectory, slideRange, processes)
+
+    differences = compareDirectories(serialDirectory, parallelDirectory)
+    for filename in differences:
+        print "Files differ: %s" % filename
+    if serialRecords != parallelRecords:
+        print "Indexed slides differ"
+
+    print "%d files compared, %d differ" %\
+            (len(os.listdir(serialDirectory)), len(differences))
+    if differences or serialRecords != parallelRecords:
+        print "Results left in %s and %s" % (serialDirectory, parallelDirectory)
+        return False
+
+    shutil.rmtree(serialDirectory)
+    shutil.rmtree(parallelDirectory)
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (5, 6):
+        print __doc__
+        sys.exit(1)
+
+    if not main(sys.argv[1], sys.argv[2], *map(int, sys.argv[3:])):
+        sys.exit(1)
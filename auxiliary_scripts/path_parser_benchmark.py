@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+###############################################################################
+#                                                                             #
+#    This file is part of 3d Brain Atlas Reconstructor                        #
+#                                                                             #
+#    Copyright (C) 2010-2012 Piotr Majka, Jakub M. Kowalski                   #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is free software: you can redistribute      #
+#    it and/or modify it under the terms of the GNU General Public License    #
+#    as published by the Free Software Foundation, either version 3 of        #
+#    the License, or (at your option) any later version.                      #
+#                                                                             #
+#    3d Brain Atlas Reconstructor is distributed in the hope that it          #
+#    will be useful, but WITHOUT ANY WARRANTY; without even the implied       #
+#    warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.         #
+#    See the GNU General Public License for more details.                     #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along  with  3d  Brain  Atlas  Reconstructor.   If  not,  see            #
+#    http://www.gnu.org/licenses/.                                            #
+#                                                                             #
+###############################################################################
+
+
+"""
+Compare the list based path parser (C{parsePath} + C{UnparsePath}) with the
+array based one (C{parsePathArrays} + C{formatPathArrays}) on path
+definitions of SVG slides.
+
+Usage::
+    python path_parser_benchmark.py <svg slide> [<svg slide> ...]
+
+All C{d} attributes of C{path} elements found in given slides are parsed and
+formatted with both parsers. Formatted definitions are compared and
+throughput of both parsers is reported.
+"""
+
+import sys
+import time
+import xml.dom.minidom as dom
+
+from bar.svgpathparse import parsePath, UnparsePath,\
+                             parsePathArrays, formatPathArrays
+
+
+def loadPathDefinitions(filename):
+    """
+    @return: definitions of all paths in given slide
+    @rtype: [str, ...]
+    """
+    svgdom = dom.parse(filename)
+    return [str(path.getAttribute('d'))\
+            for path in svgdom.getElementsByTagName('path')]
+
+def benchmarkSlide(filename):
+    """
+    @return: number of paths, number of bytes of path definitions, time of
+             list based parsing, time of array based parsing and the number
+             of paths with different results
+    @rtype: (int, int, float, float, int)
+    """
+    pathDefs = loadPathDefinitions(filename)
+
+    start = time.time()
+    listResults = [UnparsePath(parsePath(d)) for d in pathDefs]
+    listTime = time.time() - start
+
+    start = time.time()
+    arrayResults = [formatPathArrays(*parsePathArrays(d)) for d in pathDefs]
+    arrayTime = time.time() - start
+
+    mismatches = sum(1 for (a, b) in zip(listResults, arrayResults) if a != b)
+    size = sum(map(len, pathDefs))
+    return (len(pathDefs), size, listTime, arrayTime, mismatches)
+
+def main(filenames):
+    print "%-40s %6s %10s %10s %10s %8s %10s" %\
+            ('slide', 'paths', 'MB', 'list [s]', 'array [s]', 'speedup', 'mismatches')
+
+    total = [0, 0, 0., 0., 0]
+    for filename in filenames:
+        result = benchmarkSlide(filename)
+        total = map(lambda x, y: x + y, total, result)
+        print "%-40s %6d %10.3f %10.3f %10.3f %8.1f %10d" %\
+                ((filename[-40:], result[0], result[1] / 1e6) + result[2:4] +\
+                 (result[2] / max(result[3], 1e-9), result[4]))
+
+    print "%-40s %6d %10.3f %10.3f %10.3f %8.1f %10d" %\
+            (('total', total[0], total[1] / 1e6) + tuple(total[2:4]) +\
+             (total[2] / max(total[3], 1e-9), total[4]))
+    print "throughput: list %.0f paths/s (%.2f MB/s), array %.0f paths/s (%.2f MB/s)" %\
+            (total[0] / max(total[2], 1e-9), total[1] / 1e6 / max(total[2], 1e-9),
+             total[0] / max(total[3], 1e-9), total[1] / 1e6 / max(total[3], 1e-9))
+
+    return total[4] == 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -148,6 +148,25 @@ class batchInterface(object):
                           bounding box. Volumes for all structures will always\
                           have the same size and origin. This feature increases\
                           memory usage and reconstruction time.')
+        parser.add_option('--labelledVolume', action='store_const',
+                          const=True, dest='labelledVolume', default=False,
+                          help='Generate a single labelled volume of all\
+                          structures in one sweep over slides and extract\
+                          reconstructed structures from it. Implies\
+                          --ignoreBoundingBox.')
+        parser.add_option('--processes', '-j', type='int',
+                          dest='processes', default=1,
+                          help='number of worker processes performing reconstructions in parallel; implies --offScreen unless --exportToWindow is given; defaults to 1')
+        parser.add_option('--memoryBudget', type='float', dest='memoryBudget',
+                          help='maximum memory [MB] estimated to be used by reconstructions performed in parallel, including raster caches of all worker processes')
+        parser.add_option('--offScreen', action='store_const',
+                          const=True, dest='offScreen', default=False,
+                          help='render reconstructions off screen')
+        parser.add_option('--rasterCacheMemory', type='float',
+                          dest='rasterCacheMemory',
+                          help='cache rasterised slides shared between reconstructions in memory of given size [MB]')
+        parser.add_option('--rasterCacheDir', dest='rasterCacheDir',
+                          help='cache rasterised slides shared between reconstructions also in given directory')
         self.parser = parser
 
     def parseArgs(self):
@@ -203,6 +222,16 @@ class batchInterface(object):
             print "  --exportToWindow"
         if self.rm.composite:
             print "  --composite"
+        if self.rm.labelledVolume:
+            print "  --labelledVolume"
+        if self.rm.processes > 1:
+            print "  --processes:", self.rm.processes
+        if self.rm.memoryBudget != None:
+            print "  --memoryBudget:", self.rm.memoryBudget
+        if self.options.rasterCacheMemory != None:
+            print "  --rasterCacheMemory:", self.options.rasterCacheMemory
+        if self.options.rasterCacheDir != None:
+            print "  --rasterCacheDir:", self.options.rasterCacheDir
 
 
     def setup(self):
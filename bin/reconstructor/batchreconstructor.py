@@ -33,8 +33,11 @@ G{importgraph}
 """
 
 import os
+import copy
 import random
 import math
+import traceback
+import multiprocessing
 import vtk
 from batchinterface import batchInterface
 
@@ -44,9 +47,15 @@ import bar.rec.structure_holder as structureHolder
 from bar.rec.barreconstructor import barReconstructionModule, HTMLColorToRGB,\
                              barPipeline, BAR_DEFAULT_RECONSTRUCTION_DIR,\
                              BAR_TEMPLATE, BAR_ATLAS_INDEX_FILENAME,\
-                             BAR_BRAIN_OUTLINE_PROPS, SCENE_EXPORT_FORMAT_MASK
+                             BAR_BRAIN_OUTLINE_PROPS, SCENE_EXPORT_FORMAT_MASK,\
+                             BAR_RASTER_CACHE_MEMORY
 from zlib import crc32
 
+# Estimated memory (in bytes) required by the reconstruction of a single
+# voxel of the structure volume (the volume itself, its VTK copy and
+# intermediate results of the default pipeline)
+BAR_RECONSTRUCTION_BYTES_PER_VOXEL = 16
+
 def rotateY(a, (x, y, z)):
     return (math.sin(a) * z + math.cos(a) * x,
             y,
@@ -120,6 +129,23 @@ class barBatchReconstructor(object):
                    directory.
     @type outline: set([str, ...])
 
+    @ivar labelledVolume: True if volumes of reconstructed structures are
+                          extracted from a single labelled volume of all
+                          structures (generated once, in one sweep over
+                          slides), False otherwise.
+    @type labelledVolume: bool
+
+    @ivar processes: number of worker processes performing simple
+                     reconstructions; if 1, reconstructions are performed
+                     in the main process
+    @type processes: int
+
+    @ivar memoryBudget: maximum memory (in MB) estimated to be used
+                        by reconstructions performed at the same time by
+                        worker processes (including raster caches of the
+                        workers) or C{None} if unlimited
+    @type memoryBudget: float
+
     @ivar _simpleQueue: the queue of simple reconstructions to perform; each queue
                         element is a pair of structure name and a set of export
                         formats
@@ -134,7 +160,7 @@ class barBatchReconstructor(object):
 
     MAX_HIERARCHY_DEPTH = 999
 
-    def __init__(self, vtkapp, index, options):
+    def __init__(self, vtkapp, index, options, sh = None):
         """
         @param vtkapp: C{self.L{vtkapp}} value
         @type vtkapp: L{barReconstructionModule} object
@@ -168,20 +194,47 @@ class barBatchReconstructor(object):
                                                    and origin. This feature
                                                    increases memory usage and
                                                    reconstruction time.
+                          - C{labelledVolume} - C{self.L{labelledVolume}} value,
+                          - C{processes} - C{self.L{processes}} value,
+                          - C{memoryBudget} - C{self.L{memoryBudget}} value,
+                          - C{offScreen} - if True, the render window is
+                                           created off screen (no interaction
+                                           possible); forced if reconstructions
+                                           are performed by worker processes,
+                          - C{rasterCacheMemory} - memory limit (in MB) of
+                                                   the L{slideRasterCache}
+                                                   shared by reconstructions,
+                          - C{rasterCacheDir} - directory for rasterised slides
+                                                stored on the disk by
+                                                the L{slideRasterCache}.
+                                                Rasterised slides are cached
+                                                only if any of the raster cache
+                                                options is given.
 
         @type options: optparse.Values object
 
         @param index: the path to a CAF dataset index file
         @type index: str
 
+        @param sh: C{self.L{sh}} value - the CAF dataset already loaded from
+                   the C{index} file; the dataset is loaded if not given
+        @type sh: L{structureHolder} object
+
         @note: C{L{options}.attribute == None} means that the value of the
                constructor option was not given, so its default value is
                assumed. Word "attribute" mean any of the attributes of
                the option object.
         """
+        # remembered for the worker processes
+        self._index = index
+        self._options = options
+
         # load CAF dataset
         atlasDir, indexFilename = os.path.split(index)
-        self.loadAtlas(atlasDir, indexFilename)
+        if sh == None:
+            self.loadAtlas(atlasDir, indexFilename)
+        else:
+            self._setAtlas(sh, atlasDir)
 
         self._basicSetup(vtkapp, options)
 
@@ -226,6 +279,22 @@ class barBatchReconstructor(object):
                                                    and origin. This feature
                                                    increases memory usage and
                                                    reconstruction time.
+                          - C{labelledVolume} - C{self.L{labelledVolume}} value,
+                          - C{processes} - C{self.L{processes}} value,
+                          - C{memoryBudget} - C{self.L{memoryBudget}} value,
+                          - C{offScreen} - if True, the render window is
+                                           created off screen (no interaction
+                                           possible); forced if reconstructions
+                                           are performed by worker processes,
+                          - C{rasterCacheMemory} - memory limit (in MB) of
+                                                   the L{slideRasterCache}
+                                                   shared by reconstructions,
+                          - C{rasterCacheDir} - directory for rasterised slides
+                                                stored on the disk by
+                                                the L{slideRasterCache}.
+                                                Rasterised slides are cached
+                                                only if any of the raster cache
+                                                options is given.
 
         @type options: optparse.Values object
         """
@@ -268,7 +337,18 @@ class barBatchReconstructor(object):
 
         self.show = options.show
         self.composite = options.composite
-        self.ignoreBoundingBox = options.ignoreBoundingBox
+        self.labelledVolume = options.labelledVolume
+        self.processes = max(1, options.processes)
+        self.memoryBudget = options.memoryBudget
+        self.ignoreBoundingBox = options.ignoreBoundingBox or self.labelledVolume
+
+        if options.rasterCacheMemory != None or options.rasterCacheDir != None:
+            cacheMemory = options.rasterCacheMemory
+            if cacheMemory == None:
+                cacheMemory = BAR_RASTER_CACHE_MEMORY
+            self.sh.rasterCache = structureHolder.slideRasterCache(\
+                    maxMemory = int(cacheMemory * 1024 ** 2),
+                    cacheDirectory = options.rasterCacheDir)
 
         #---------------------- done with options
 
@@ -278,9 +358,16 @@ class barBatchReconstructor(object):
         self.renWin.SetSize(800,600)
         self.vtkapp.addRenderWindow(self.renWin)
 
-        self.iren = vtk.vtkRenderWindowInteractor()
-        self.iren.SetRenderWindow(self.renWin)
-        self.iren.Initialize()
+        # Worker processes are forked with the render window of the main
+        # process, so it must not be bound to the display.
+        if options.offScreen or (self.processes > 1 and not self.show):
+            self.renWin.SetOffScreenRendering(1)
+            self.iren = None
+
+        else:
+            self.iren = vtk.vtkRenderWindowInteractor()
+            self.iren.SetRenderWindow(self.renWin)
+            self.iren.Initialize()
 
         self._simpleQueue = []
         self._compositeQueue = []
@@ -451,6 +538,9 @@ class barBatchReconstructor(object):
         self._generateOutlineActors()
 
         # perform simple reconstructions
+        if self.processes > 1 and not self.show:
+            self._runSimpleQueueInParallel()
+
         for name, formats in self._simpleQueue:
             self.generateModel(name)
             self._appendOutlineActors()
@@ -479,6 +569,102 @@ class barBatchReconstructor(object):
         # flush the queue
         self._compositeQueue = []
 
+    def _runSimpleQueueInParallel(self):
+        """
+        Perform reconstructions from L{_simpleQueue} in L{processes} worker
+        processes, each with its own off screen L{barReconstructionModule}.
+
+        Reconstructions are started in the queue order as long as the sum of
+        their estimated memory usage does not exceed L{memoryBudget} (a single
+        reconstruction is always allowed). Every worker process grows its own
+        copy of the raster cache, so the memory limit of the cache is charged
+        against the budget once per worker. Results are reported in the queue
+        order; failed reconstructions are reported after all reconstructions
+        are finished by raising RuntimeError.
+        """
+        global _parallelReconstructor
+
+        queue = self._simpleQueue
+        self._simpleQueue = []
+
+        if self.labelledVolume and self.sh.LabelledVol == None:
+            # generated once, then inherited by the workers
+            self.sh.handleLabelledVolumeGeneration(self.xyres, self.zres)
+
+        memoryNeeded = map(self._estimateMemoryUsage,
+                           (name for (name, formats) in queue))
+        memoryBudget = self.memoryBudget
+        if memoryBudget != None:
+            memoryBudget *= 1024 ** 2
+            if self.sh.rasterCache != None:
+                memoryBudget -= self.processes * self.sh.rasterCache.maxMemory
+
+        failed = []
+        _parallelReconstructor = self
+        pool = multiprocessing.Pool(self.processes, _initReconstructionWorker)
+        try:
+            running = {}
+            finished = {}
+            memoryUsed = 0
+            nextToStart = 0
+            for nextToReport in xrange(len(queue)):
+                while nextToReport not in finished:
+                    # start as many reconstructions as possible
+                    while nextToStart < len(queue) and \
+                          len(running) < self.processes and \
+                          (len(running) == 0 or memoryBudget == None or \
+                           memoryUsed + memoryNeeded[nextToStart] <= memoryBudget):
+                        running[nextToStart] = pool.apply_async(\
+                                _reconstructInWorker, (queue[nextToStart],))
+                        memoryUsed += memoryNeeded[nextToStart]
+                        nextToStart += 1
+
+                    running[min(running)].wait(0.1)
+                    for i in [i for i in running if running[i].ready()]:
+                        finished[i] = running.pop(i).get()
+                        memoryUsed -= memoryNeeded[i]
+
+                name, error = finished.pop(nextToReport)
+                if error != None:
+                    debugOutput("Reconstruction of %s failed:\n%s" % (name, error),
+                                error = True)
+                    failed.append(name)
+                else:
+                    debugOutput("Reconstruction of %s finished." % name)
+
+            pool.close()
+
+        except:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+            _parallelReconstructor = None
+
+        if len(failed) > 0:
+            raise RuntimeError, "Reconstruction failed for: %s" % ', '.join(failed)
+
+    def _estimateMemoryUsage(self, structureName):
+        """
+        @param structureName: the name of the structure
+        @type structureName: str
+
+        @return: estimated memory (in bytes) used by the reconstruction of
+                 the structure
+        @rtype: int
+        """
+        if not type(self.sh.getSlidesSpan(structureName)) == type(("",)):
+            return 0
+
+        if self.labelledVolume:
+            voxels = self.sh.LabelledVol.vol.size
+        else:
+            voxels = self.sh.estimateVolumeSize(structureName,
+                            self.xyres, self.zres,
+                            ignoreBoundingBox=self.ignoreBoundingBox)
+        return voxels * BAR_RECONSTRUCTION_BYTES_PER_VOXEL
+
     def _compositeReconstruction(self, name, structures):
         """
         Perform composite reconstruction.
@@ -538,6 +724,11 @@ class barBatchReconstructor(object):
 
         @return: a volumetric representation of requested structure
         """
+        if self.labelledVolume:
+            if self.sh.LabelledVol == None:
+                self.sh.handleLabelledVolumeGeneration(self.xyres, self.zres)
+            return self.sh.getLabelledStructureVolume(structureName)
+
         self.sh.handleAllModelGeneration(\
                 structureName, self.xyres, self.zres,\
                 ignoreBoundingBox=self.ignoreBoundingBox)
@@ -599,8 +790,21 @@ class barBatchReconstructor(object):
         Loads CAF dataset defined by provided index directory.
         """
         indexFile = os.path.join(indexDirectory, indexFile)
-        self.sh = structureHolder.structureHolder(\
-                indexFile, indexDirectory)
+        self._setAtlas(structureHolder.structureHolder(\
+                indexFile, indexDirectory), indexDirectory)
+
+    def _setAtlas(self, sh, indexDirectory):
+        """
+        @type  sh: L{structureHolder}
+        @param sh: loaded CAF dataset
+
+        @type  indexDirectory: C{str}
+        @param indexDirectory: CAF dataset directory
+
+        Sets the loaded CAF dataset as C{self.L{sh}} and updates default
+        reconstruction parameters.
+        """
+        self.sh = sh
 
         self.__atlasDirectory   = indexDirectory
 
@@ -701,6 +905,57 @@ class barBatchReconstructor(object):
     """
 
 
+# The reconstructor requesting parallel reconstructions; inherited by worker
+# processes and used as a template of their own reconstructors.
+_parallelReconstructor = None
+
+# The reconstructor of the worker process.
+_workerReconstructor = None
+
+def _initReconstructionWorker():
+    """
+    Create the reconstructor of the worker process rendering off screen.
+    """
+    global _workerReconstructor
+
+    options = copy.copy(_parallelReconstructor._options)
+    options.show = False
+    options.offScreen = True
+    options.processes = 1
+
+    # Settings possibly modified after the reconstructor was created
+    options.voxelDimensions = (_parallelReconstructor.xyres,
+                               _parallelReconstructor.zres)
+    options.exportDir = _parallelReconstructor.exportDir
+
+    # The raster cache of the shared CAF dataset is inherited as well
+    options.rasterCacheMemory = None
+    options.rasterCacheDir = None
+
+    # Share already loaded (and possibly labelled) CAF dataset
+    _workerReconstructor = _parallelReconstructor.__class__(\
+            barReconstructionModule(), _parallelReconstructor._index, options,
+            _parallelReconstructor.sh)
+
+def _reconstructInWorker((name, formats)):
+    """
+    Perform simple reconstruction in the worker process.
+
+    @return: name of the structure and formatted traceback if the reconstruction
+             failed or C{None} otherwise
+    @rtype: (str, str)
+    """
+    try:
+        _workerReconstructor.generateModel(name)
+        _workerReconstructor._appendOutlineActors()
+        _workerReconstructor._exportToFormats(name, formats)
+
+    except Exception:
+        return (name, traceback.format_exc())
+
+    return (name, None)
+
+
 if __name__ == '__main__':
     bi = batchInterface(barBatchReconstructor)
     bi.main()
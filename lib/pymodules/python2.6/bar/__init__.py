@@ -28,5 +28,6 @@ barCoordinateMarker, barCoronalMarker, barPath, barGenericStructure,\
 barBoundingBox, barTracedSlideRenderer, barPretracedSlideRenderer, barCafSlide,\
 barContourSlide
 from atlas_indexer import barIndexer, barIndexerPropertyElement,\
-barIndexerGroupElement, barIndexerSlideElement, barIndexerStructureElement, barIndexerObject, barIndexerElement
+barIndexerGroupElement, barIndexerSlideElement, barIndexerStructureElement, barIndexerObject, barIndexerElement,\
+barIndexerSpatialIndex
 
@@ -37,8 +37,11 @@ CONF_ALIGNER_REFERENCE_COORDS = ( 1.0, -6.0, 0.01, -0.01)
 
 import os
 import sys
+import hashlib
+import tempfile
 import unicodedata
 import xml.dom.minidom as dom
+import numpy as np
 import base
 from string import *
 
@@ -46,6 +49,33 @@ def remove_accents(input_str):
     nkfd_form = unicodedata.normalize('NFKD', unicode(input_str))
     return u"".join([c for c in nkfd_form if not unicodedata.combining(c)])
 
+def _packOptional(values, dtype=unicode):
+    """
+    @param values: values to be stored in an array; C{None} denotes a missing
+                   value
+    @type values: [object, ...]
+
+    @param dtype: type of the array elements
+    @type dtype: type
+
+    @return: array of values (missing values replaced by a default one) and
+             a mask of present values
+    @rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    mask = np.array([x != None for x in values], dtype=bool)
+    array = np.array([x if x != None else dtype() for x in values], dtype=dtype)
+    return array, mask
+
+def _unpackOptional(array, mask):
+    """
+    Reverse L{_packOptional}.
+
+    @rtype: [object, ...]
+    @return: values stored in the array; C{None} for the missing ones
+    """
+    return [x if present else None\
+            for (x, present) in zip(array.tolist(), mask.tolist())]
+
 class barIndexerObject(base.barObject):
     """
     Virtual class parental to all classes defined in the module.
@@ -997,6 +1027,16 @@ class barIndexerStructureElement(barIndexerElement):
             slidesToAppend = [slidesToAppend]
         self._slides.update((x.slidenumber, x) for x in slidesToAppend)
 
+    def removeSlide(self, slideNumber):
+        """
+        Unassign 'slide' element from the represented element.
+
+        @param slideNumber: value of the 'slidenumber' attribute of the 'slide'
+                            element to be unassigned
+        @type slideNumber: int
+        """
+        self._slides.pop(slideNumber, None)
+
     def __getSlideSpan(self):
         """
         @rtype: (int, int)
@@ -1060,6 +1100,398 @@ class barIndexerStructureElement(barIndexerElement):
     """
 
 
+class barIndexerHierarchyIntervals(barIndexerObject):
+    """
+    Interval encoding of the hierarchy tree of 'group' elements.
+
+    Groups are numbered in preorder, so every subtree occupies a contiguous
+    range of numbers starting at its root. Queries about a subtree (its UIDs,
+    visible groups, slide span) are answered with slices of arrays computed
+    once for the whole tree instead of recursive walks.
+
+    Results are the same as the ones of recursive methods of
+    L{barIndexerGroupElement}:
+
+    >>> index = barIndexer()
+    >>> m = [0.1, -6, -0.1, 5]
+    >>> index.restoreSlide(1, (None, 1.0, m, [('Cx', (0, 0, 5, 5))]))
+    >>> index.restoreSlide(2, (None, 2.0, m, [('Cx', (0, 0, 5, 5)),
+    ...                                       ('M1', (1, 1, 2, 2))]))
+    >>> index.restoreSlide(3, (None, 3.0, m, [('Hp', (0, 0, 5, 5))]))
+    >>> index.restoreSlide(4, (None, 4.0, m, [('Th', (0, 0, 5, 5))]))
+    >>> index.hierarchy = {'Fb': 'Brain', 'Hb': 'Brain', 'Cx': 'Fb',
+    ...                    'Hp': 'Fb', 'Str': 'Fb', 'M1': 'Cx', 'Th': 'Hb',
+    ...                    'Xx': 'Hb', 'Yy': 'Xx'}
+    >>> intervals = index.hierarchyIntervals
+    >>> [x.name for x in intervals.getVisibleGroups('Brain')]
+    ['M1', 'Cx', 'Hp', 'Fb', 'Th', 'Hb', 'Brain']
+    >>> [x.name for x in intervals.getVisibleGroups('Brain', 2, True)]
+    ['Cx', 'Hp', 'Th']
+    >>> intervals.getUidList('Fb'), intervals.getSlideSpan('Fb')
+    ([100001, 100002, 100003], (1, 3))
+    >>> print intervals.getUidList('Xx'), intervals.getSlideSpan('Xx')
+    [] None
+    >>> all([x.name for x in intervals.getVisibleGroups(name, depth, leaves)] ==
+    ...     [x.name for x in group.getVisibleGroupIterator(depth, leaves)] and
+    ...     intervals.getUidList(name) == group.uidList
+    ...     for (name, group) in index.groups.items()
+    ...     for depth in range(4) for leaves in (False, True))
+    True
+
+    @ivar _groups: hierarchy groups in preorder
+    @type _groups: [L{barIndexerGroupElement}, ...]
+
+    @ivar _position: hierarchy group name to its preorder number mapping
+    @type _position: {str : int}
+
+    @ivar _end: number following the last group of every subtree
+    @type _end: numpy.ndarray
+
+    @ivar _depth: depth of every group in the tree
+    @type _depth: numpy.ndarray
+
+    @ivar _uidOffset: number of groups with UID assigned preceding every group
+                      (one additional element for the end of the tree)
+    @type _uidOffset: numpy.ndarray
+
+    @ivar _uids: UIDs of groups with UID assigned in preorder
+    @type _uids: numpy.ndarray
+
+    @ivar _visible: indicates groups with any UID assigned in their subtree
+    @type _visible: numpy.ndarray
+
+    @ivar _hasVisibleChild: indicates groups with any visible child
+    @type _hasVisibleChild: numpy.ndarray
+
+    @ivar _slideSpan: the lowest and the highest slide number of structures
+                      in every subtree (row); C{-1} if no slides
+    @type _slideSpan: numpy.ndarray
+    """
+    def __init__(self, groups, structures):
+        """
+        @param groups: name to 'group' element representation mapping
+        @type groups: {str : L{barIndexerGroupElement}}
+
+        @param structures: name to 'structure' element representation mapping
+        @type structures: {str : L{barIndexerStructureElement}}
+        """
+        # Flatten every hierarchy tree in preorder preserving order of children
+        self._groups = []
+        parents, depths = [], []
+        stack = [(x, -1, 0) for x in groups.itervalues() if x.parent == None]
+        while stack:
+            (group, parent, depth) = stack.pop()
+            stack.extend((x, len(self._groups), depth + 1)\
+                         for x in reversed(group.children))
+            self._groups.append(group)
+            parents.append(parent)
+            depths.append(depth)
+
+        number = dict((id(x), i) for (i, x) in enumerate(self._groups))
+        self._position = dict((name, number[id(group)])\
+                              for (name, group) in groups.iteritems()\
+                              if id(group) in number)
+
+        n = len(self._groups)
+        parents = np.array(parents, dtype=int)
+        self._depth = np.array(depths, dtype=int)
+
+        uids = [x.uid for x in self._groups]
+        hasUid = np.array([x != None for x in uids], dtype=bool)
+        self._uids = np.array([x for x in uids if x != None], dtype=int)
+        self._uidOffset = np.concatenate(([0], np.cumsum(hasUid)))
+
+        uidToStructure = dict((x.uid, x) for x in structures.itervalues())
+        slideSpan = np.empty((n, 2), dtype=int)
+        slideSpan[:, 0] = sys.maxint
+        slideSpan[:, 1] = -1
+        for i in np.flatnonzero(hasUid):
+            structure = uidToStructure.get(uids[i])
+            if structure != None and structure.slideList:
+                slideSpan[i] = structure.slideSpan
+
+        # Propagate subtree sizes and slide spans from leaves to roots level
+        # by level
+        size = np.ones(n, dtype=int)
+        for depth in xrange(self._depth.max() if n else 0, 0, -1):
+            level = np.flatnonzero(self._depth == depth)
+            np.add.at(size, parents[level], size[level])
+            np.minimum.at(slideSpan[:, 0], parents[level], slideSpan[level, 0])
+            np.maximum.at(slideSpan[:, 1], parents[level], slideSpan[level, 1])
+        slideSpan[slideSpan[:, 1] < 0] = -1
+
+        self._end = np.arange(n) + size
+        self._slideSpan = slideSpan
+        self._visible = self._uidOffset[self._end] > self._uidOffset[:-1]
+        self._hasVisibleChild = np.zeros(n, dtype=bool)
+        self._hasVisibleChild[parents[self._visible & (parents >= 0)]] = True
+
+    def getUidList(self, name):
+        """
+        @param name: name of the hierarchy group
+        @type name: str
+
+        @return: UIDs assigned to groups of the subtree rooted in the group
+                 (in the order of
+                 L{barIndexerGroupElement.uidList<barIndexerGroupElement.uidList>})
+        @rtype: [int, ...]
+        """
+        i = self._position[name]
+        return self._uids[self._uidOffset[i]:self._uidOffset[self._end[i]]].tolist()
+
+    def getUidLists(self):
+        """
+        @return: hierarchy group name to UIDs of assigned structures mapping
+        @rtype: {str : [int, ...]}
+        """
+        return dict((name, self.getUidList(name)) for name in self._position)
+
+    def getVisibleGroups(self, name, depth=999, leavesOnly=False):
+        """
+        @param name: name of the root of the subtree
+        @type name: str
+
+        @param depth: depth of the subtree; negative value means unlimited
+        @type depth: int
+
+        @param leavesOnly: True if requested only the leaves of the subtree,
+                           False otherwise
+        @type leavesOnly: bool
+
+        @return: groups of the subtree with any UID assigned in their
+                 subtrees, in the order of
+                 L{barIndexerGroupElement.getVisibleGroupIterator<barIndexerGroupElement.getVisibleGroupIterator>}
+        @rtype: [L{barIndexerGroupElement}, ...]
+        """
+        start = self._position[name]
+        stop = self._end[start]
+        relativeDepth = self._depth[start:stop] - self._depth[start]
+
+        mask = self._visible[start:stop].copy()
+        if depth >= 0:
+            mask &= relativeDepth <= depth
+
+        if leavesOnly:
+            leaves = ~self._hasVisibleChild[start:stop]
+            if depth >= 0:
+                leaves |= relativeDepth == depth
+            mask &= leaves
+
+        # postorder: descendants precede their ancestors
+        selected = np.flatnonzero(mask) + start
+        order = np.lexsort((-self._depth[selected], self._end[selected]))
+        return [self._groups[i] for i in selected[order]]
+
+    def getSlideSpan(self, name):
+        """
+        @param name: name of the hierarchy group
+        @type name: str
+
+        @return: the lowest and the highest slide number of structures
+                 of the subtree rooted in the group; C{None} if none of them
+                 is present on any slide
+        @rtype: (int, int)
+        """
+        (first, last) = self._slideSpan[self._position[name]].tolist()
+        if last < 0:
+            return None
+        return (first, last)
+
+    def __contains__(self, name):
+        return name in self._position
+
+
+class barIndexerSpatialIndex(barIndexerObject):
+    """
+    Spatial index of bounding boxes of structures on CAF slides.
+
+    Bounding boxes are stored in arrays sorted by the slide number, both in
+    the SVG (drawing) coordinates and in the stereotaxic coordinates (obtained
+    with the transformation matrix of the slide), so box, point and nearest
+    structure queries are vectorised tests over rows of the queried slide
+    (or of all slides).
+
+    @ivar _rowSlides: slide number of every row
+    @type _rowSlides: numpy.ndarray
+
+    @ivar _rowNames: structure name of every row
+    @type _rowNames: [str, ...]
+
+    @ivar _boxes: C{(x1, y1, x2, y2)} bounding box of every row in the SVG
+                  (key C{False}) and stereotaxic (key C{True}) coordinates
+    @type _boxes: {bool : numpy.ndarray}
+
+    Results agree with brute force tests over the slide records, also for
+    slides with flipped stereotaxic axes:
+
+    >>> import math
+    >>> index = barIndexer()
+    >>> index.restoreSlide(1, (None, 1.0, [0.1, -6, -0.1, 5],
+    ...                        [('Cx', (0, 0, 50, 40)), ('Hp', (60, 10, 80, 30))]))
+    >>> index.restoreSlide(2, (None, 2.0, [-0.1, 6, 0.1, -5],
+    ...                        [('Cx', (0, 0, 50, 40)), ('Th', (40, 30, 90, 70))]))
+    >>> spatial = index.spatialIndex
+    >>> spatial.queryBox((45, 5, 65, 35), 1)
+    [(1, 'Cx'), (1, 'Hp')]
+    >>> spatial.queryPoint((-3, 2), stereotaxic=True)
+    [(1, 'Cx'), (2, 'Th')]
+    >>> spatial.nearest((100, 0), 1)
+    (1, 'Hp', 22.360679774997898)
+    >>> print spatial.nearest((0, 0), 3)
+    None
+    >>> def rows(stereotaxic):
+    ...     records = index.getSlideRecords()
+    ...     for slideNumber in sorted(records):
+    ...         (a, b, c, d) = records[slideNumber][2]
+    ...         for (name, (x1, y1, x2, y2)) in records[slideNumber][3]:
+    ...             if stereotaxic:
+    ...                 (x1, x2) = sorted([a * x1 + b, a * x2 + b])
+    ...                 (y1, y2) = sorted([c * y1 + d, c * y2 + d])
+    ...             yield (slideNumber, name, (x1, y1, x2, y2))
+    >>> def bruteBox((p1, q1, p2, q2), stereotaxic):
+    ...     return [(s, n) for (s, n, (x1, y1, x2, y2)) in rows(stereotaxic)
+    ...             if x1 <= p2 and x2 >= p1 and y1 <= q2 and y2 >= q1]
+    >>> def bruteNearest((x, y), stereotaxic):
+    ...     return min([(s, n, math.hypot(max(x1 - x, x - x2, 0),
+    ...                                   max(y1 - y, y - y2, 0)))
+    ...                 for (s, n, (x1, y1, x2, y2)) in rows(stereotaxic)],
+    ...                key = lambda r: r[2])
+    >>> grid = ([(False, 7 * i - 10, 7 * j - 10, 5 * w)
+    ...          for i in range(16) for j in range(13) for w in range(2)] +
+    ...         [(True, 0.7 * i - 8, 0.7 * j - 7, 0.5 * w)
+    ...          for i in range(23) for j in range(20) for w in range(2)])
+    >>> all(spatial.queryBox((x, y, x + w, y + w), None, st) ==
+    ...     bruteBox((x, y, x + w, y + w), st) and
+    ...     spatial.nearest((x, y), None, st) == bruteNearest((x, y), st)
+    ...     for (st, x, y, w) in grid)
+    True
+    """
+    def __init__(self, records):
+        """
+        @param records: slide number to slide record mapping (as returned by
+                        L{barIndexer.getSlideRecords} or
+                        L{barIndexer.readSlideRecords})
+        @type records: {int : (str, float, [float, ...], [(str, (float, float, float, float)), ...])}
+        """
+        rowSlides, rowMatrices, rowBoxes = [], [], []
+        self._rowNames = []
+        for slideNumber in sorted(records):
+            (digest, coronalcoord, transformationmatrix, structures) =\
+                                                         records[slideNumber]
+            for (name, bbx) in structures:
+                rowSlides.append(slideNumber)
+                rowMatrices.append(transformationmatrix)
+                rowBoxes.append(bbx)
+                self._rowNames.append(name)
+
+        self._rowSlides = np.array(rowSlides, dtype=int)
+        svgBoxes = np.array(rowBoxes, dtype=float).reshape(-1, 4)
+        (a, b, c, d) = np.array(rowMatrices, dtype=float).reshape(-1, 4).T
+
+        # x' = a * x + b, y' = c * y + d; axes may be flipped
+        x = a[:, np.newaxis] * svgBoxes[:, [0, 2]] + b[:, np.newaxis]
+        y = c[:, np.newaxis] * svgBoxes[:, [1, 3]] + d[:, np.newaxis]
+        stereotaxicBoxes = np.column_stack((x.min(axis=1), y.min(axis=1),
+                                            x.max(axis=1), y.max(axis=1)))
+
+        self._boxes = {False: svgBoxes, True: stereotaxicBoxes}
+
+    @classmethod
+    def fromFile(cls, filename):
+        """
+        @param filename: path to the file saved with
+                         L{barIndexer.writeSlideRecords}
+        @type filename: str
+
+        @return: spatial index of slide records stored in the file
+        @rtype: cls
+        """
+        return cls(barIndexer.readSlideRecords(filename))
+
+    def __getRows(self, slideNumber):
+        """
+        @return: range of rows of given slide (all rows if C{None})
+        @rtype: slice
+        """
+        if slideNumber == None:
+            return slice(0, len(self._rowNames))
+        (start, stop) = np.searchsorted(self._rowSlides,
+                                        [slideNumber, slideNumber + 1])
+        return slice(start, stop)
+
+    def __getResult(self, rows, selected):
+        """
+        @return: slide numbers and structure names of selected rows
+        @rtype: [(int, str), ...]
+        """
+        indexes = np.flatnonzero(selected) + rows.start
+        return [(int(self._rowSlides[i]), self._rowNames[i]) for i in indexes]
+
+    def queryBox(self, box, slideNumber=None, stereotaxic=False):
+        """
+        @param box: C{(x1, y1, x2, y2)} box
+        @type box: (float, float, float, float)
+
+        @param slideNumber: number of the slide to query; C{None} for all
+                            slides
+        @type slideNumber: int
+
+        @param stereotaxic: True if the box is given in stereotaxic
+                            coordinates, False if in SVG coordinates
+        @type stereotaxic: bool
+
+        @return: slide numbers and names of structures which bounding boxes
+                 intersect the box
+        @rtype: [(int, str), ...]
+        """
+        (x1, y1, x2, y2) = box
+        rows = self.__getRows(slideNumber)
+        boxes = self._boxes[bool(stereotaxic)][rows]
+        selected = (boxes[:, 0] <= max(x1, x2)) & (boxes[:, 2] >= min(x1, x2)) &\
+                   (boxes[:, 1] <= max(y1, y2)) & (boxes[:, 3] >= min(y1, y2))
+        return self.__getResult(rows, selected)
+
+    def queryPoint(self, point, slideNumber=None, stereotaxic=False):
+        """
+        @param point: C{(x, y)} point
+        @type point: (float, float)
+
+        @return: slide numbers and names of structures which bounding boxes
+                 contain the point
+        @rtype: [(int, str), ...]
+
+        @note: For description of other arguments see L{queryBox}.
+        """
+        (x, y) = point
+        return self.queryBox((x, y, x, y), slideNumber, stereotaxic)
+
+    def nearest(self, point, slideNumber=None, stereotaxic=False):
+        """
+        @param point: C{(x, y)} point
+        @type point: (float, float)
+
+        @return: slide number and name of the structure which bounding box is
+                 the nearest to the point and the distance between them
+                 (C{0} if the bounding box contains the point); C{None} if
+                 there is no structure on the slide
+        @rtype: (int, str, float)
+
+        @note: For description of other arguments see L{queryBox}.
+        """
+        (x, y) = point
+        rows = self.__getRows(slideNumber)
+        boxes = self._boxes[bool(stereotaxic)][rows]
+        if len(boxes) == 0:
+            return None
+
+        dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+        dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+        distance = np.hypot(dx, dy)
+        i = rows.start + int(distance.argmin())
+        return (int(self._rowSlides[i]), self._rowNames[i],
+                float(distance[i - rows.start]))
+
+
 class barIndexer(barIndexerObject):
     """
     Class of objects representing whole CAF dataset index.
@@ -1124,6 +1556,19 @@ class barIndexer(barIndexerObject):
     @cvar _structureElement: class of objects representing 'structure' elements
     @type _structureElement: class
 
+    @cvar _sidecarSuffix: suffix appended to the path of CAF dataset index file
+                          to get the path of its binary sidecar; C{None}
+                          disables the sidecar
+    @type _sidecarSuffix: str
+
+    @cvar _sidecarVersion: version of the binary sidecar format
+    @type _sidecarVersion: int
+
+    @cvar _slideRecordsFilename: name of the file (in the CAF dataset
+                                 directory) with slide records saved by
+                                 L{writeSlideRecords}
+    @type _slideRecordsFilename: str
+
     @ivar _uid: current value of UID sequence
     @type _uid: int
 
@@ -1156,6 +1601,19 @@ class barIndexer(barIndexerObject):
                                      gathering all structures
     @type _hierarchyRootElementName: str
 
+    @ivar _hierarchyIntervals: cached interval encoding of the hierarchy;
+                               C{None} if outdated
+    @type _hierarchyIntervals: L{barIndexerHierarchyIntervals}
+
+    @ivar _slideRecords: CAF slide number to the digest of the CAF slide file
+                         (C{None} if unknown) and the names and bounding boxes
+                         of structures contributed by the slide mapping
+    @type _slideRecords: {int : (str, [(str, (float, float, float, float)), ...])}
+
+    @ivar _spatialIndex: cached spatial index of bounding boxes of structures
+                         on slides; C{None} if outdated
+    @type _spatialIndex: L{barIndexerSpatialIndex}
+
     @ivar cafDirectory: path to the directory where the CAF dataset index file
                         is located
     @type cafDirectory: str
@@ -1180,6 +1638,10 @@ class barIndexer(barIndexerObject):
     _slideElement = barIndexerSlideElement
     _structureElement = barIndexerStructureElement
 
+    _sidecarSuffix = '.npz'
+    _sidecarVersion = 1
+    _slideRecordsFilename = 'index.slides.npz'
+
     def __init__(self, hierarchyRootElementName=CONF_HIERARCHY_ROOT_NAME):
         """
         @type  hierarchyRootElementName: str
@@ -1199,24 +1661,40 @@ class barIndexer(barIndexerObject):
         self._slides     = {}
         self._properties = {}
         self._structures = {}
+        self._slideRecords = {}
+        self._spatialIndex = None
 
         self._fullNameMapping = None #Ultimately dict
         self._colorMapping    = None #Ultimately dict
 
         self._hierarchyRootElementName = hierarchyRootElementName
+        self._hierarchyIntervals = None
 
         # CAF dataset location
         self.cafDirectory = None
 
     def __fromXML(cls, sourceXMLElement):
         cafdirectory = None
+        filename = None
+        signature = None
 
         # Argument type chcecking
         if type(sourceXMLElement) is str or type(sourceXMLElement) is unicode:
             if os.path.exists(sourceXMLElement):
                 # sourceXMLElement is a valid file path
-                slideindexElement = dom.parse(sourceXMLElement)
                 cafdirectory = os.path.dirname(sourceXMLElement)
+
+                # The binary sidecar (if up to date) is much faster to load
+                # than the XML document
+                if cls._sidecarSuffix != None:
+                    result = cls._fromSidecar(sourceXMLElement)
+                    if result != None:
+                        result.cafDirectory = cafdirectory
+                        return result
+                    filename = sourceXMLElement
+                    signature = cls._getFileSignature(filename)
+
+                slideindexElement = dom.parse(sourceXMLElement)
             else:
                 # sourceXMLElement is assumed to be an XML string
                 slideindexElement = dom.parseString(sourceXMLElement)
@@ -1263,16 +1741,267 @@ class barIndexer(barIndexerObject):
                     # warning - may violate encapsulation of barIndexerPropertyElement
                     destination[newElement.name] = newElement
 
+        result.__bindHierarchy()
+
+        if signature != None:
+            try:
+                result.writeSidecar(filename, signature)
+            except (IOError, OSError, ValueError), e:
+                print >>sys.stderr, "Unable to write the index sidecar: %s" % e
+        return result
+
+    def __bindHierarchy(self):
+        """
+        Bind the hierarchy tree stored in C{self.L{_hierarchyGroups}} (as its
+        only element) with the indexed structures.
+        """
         # According to CAF specification, the <hierarchy> XML node contains one
         # <group> node, that is the root element of the hierarchy tree.
-        (result.hierarchyRootElementName, group) =\
-                                          result._hierarchyGroups.items()[0]
+        (self.hierarchyRootElementName, group) =\
+                                          self._hierarchyGroups.items()[0]
 
         # The group hierarchy tree contains important information about
         # color mapping, fullname mapping, hierarchy and UID/GID maximum value.
         # The information has to be copied to the result object.
-        result.__addGroup(group)
-        result.__normaliseIDs()
+        self.__addGroup(group)
+        self.__normaliseIDs()
+
+    @staticmethod
+    def _getFileDigest(filename):
+        """
+        @type  filename: str
+        @param filename: path to the file
+
+        @return: MD5 digest of the file content
+        @rtype: str
+        """
+        digest = hashlib.md5()
+        fh = open(filename, 'rb')
+        try:
+            for chunk in iter(lambda: fh.read(1 << 20), ''):
+                digest.update(chunk)
+        finally:
+            fh.close()
+        return digest.hexdigest()
+
+    @classmethod
+    def _getFileSignature(cls, filename):
+        """
+        @type  filename: str
+        @param filename: path to the file
+
+        @return: modification time, size and MD5 digest of the file
+        @rtype: (float, int, str)
+        """
+        stat = os.stat(filename)
+        return (stat.st_mtime, stat.st_size, cls._getFileDigest(filename))
+
+    @classmethod
+    def _isSidecarValid(cls, sidecar, filename):
+        """
+        @type  sidecar: numpy.lib.npyio.NpzFile
+        @param sidecar: loaded binary sidecar
+
+        @type  filename: str
+        @param filename: path to the CAF dataset index file
+
+        @return: True if the sidecar describes the current content of the CAF
+                 dataset index file, False otherwise
+        @rtype: bool
+
+        @note: Size, modification time and MD5 digest of the index file have
+               to match the ones stored in the sidecar. The digest is always
+               compared as the modification time may be too coarse (or
+               copied from another file) to reveal a same-size edit.
+        """
+        if sidecar['version'].item() != cls._sidecarVersion:
+            return False
+
+        stat = os.stat(filename)
+        if sidecar['size'].item() != stat.st_size or\
+           sidecar['mtime'].item() != stat.st_mtime:
+            return False
+
+        return sidecar['md5'].item() == cls._getFileDigest(filename)
+
+    def writeSidecar(self, filename, signature=None):
+        """
+        Write the binary sidecar of the CAF dataset index file.
+
+        The sidecar is a numpy C{.npz} archive storing the index as arrays:
+        a property table, a slide table, a structure table (with slides of
+        the structures stored as offsets into a flat array of slide numbers)
+        and the hierarchy tree flattened in preorder with parent indexes.
+        It is stored next to the index file and is valid as long as the index
+        file is not modified.
+
+        @type  filename: str
+        @param filename: path to the CAF dataset index file the sidecar
+                         is describing (the file has to be a result of
+                         serialisation of the object)
+
+        @type  signature: (float, int, str)
+        @param signature: modification time, size and MD5 digest of the CAF
+                          dataset index file; computed if not given
+        """
+        if signature == None:
+            signature = self._getFileSignature(filename)
+        (mtime, size, md5) = signature
+
+        properties = [self._properties[x] for x in sorted(self._properties)]
+        slides = [self._slides[x] for x in sorted(self._slides)]
+        structures = [self._structures[x] for x in sorted(self._structures)]
+
+        # Flatten the hierarchy tree in preorder preserving order of children
+        groups, parents = [], []
+        stack = [(self._hierarchyGroups[self._hierarchyRootElementName], -1)]
+        while stack:
+            (group, parent) = stack.pop()
+            stack.extend((x, len(groups)) for x in reversed(group.children))
+            groups.append(group)
+            parents.append(parent)
+
+        structureSlides = [x.slideList for x in structures]
+        slideOffsets = np.cumsum([0] + map(len, structureSlides))
+
+        arrays = {
+            'version': np.array(self._sidecarVersion),
+            'mtime': np.array(mtime, dtype=float),
+            'size': np.array(size, dtype=np.int64),
+            'md5': np.array(md5, dtype=unicode),
+            'propertyNames': np.array([x.type for x in properties], dtype=unicode),
+            'propertyValues': np.array([x.value for x in properties], dtype=unicode),
+            'slideNumbers': np.array([x.slidenumber for x in slides], dtype=np.int64),
+            'slideCoords': np.array([x.coronalcoord for x in slides], dtype=unicode),
+            'slideMatrices': np.array([x.transformationmatrix for x in slides], dtype=float),
+            'structureNames': np.array([x.name for x in structures], dtype=unicode),
+            'structureUids': np.array([x.uid for x in structures], dtype=np.int64),
+            'structureBbxs': np.array([x.bbx.boundaries for x in structures], dtype=float),
+            'structureSlideOffsets': slideOffsets.astype(np.int64),
+            'structureSlides': np.array(base.flatten(structureSlides), dtype=np.int64),
+            'groupParents': np.array(parents, dtype=np.int64),
+            'groupNames': np.array([x.name for x in groups], dtype=unicode),
+            'groupIds': np.array([x.id for x in groups], dtype=np.int64)}
+
+        optionalColumns = [
+            ('structureTypes', [x.type for x in structures], unicode),
+            ('groupUids', [x.uid for x in groups], np.int64),
+            ('groupFills', [x.fill for x in groups], unicode),
+            ('groupFullnames', [getattr(x, 'fullname', None) for x in groups], unicode),
+            ('groupOntologyIds', [x.ontologyid for x in groups], unicode)]
+
+        for (name, values, dtype) in optionalColumns:
+            arrays[name], arrays[name + 'Mask'] = _packOptional(values, dtype)
+
+        # Write to a temporary file first, so concurrently loading processes
+        # never see an incomplete sidecar
+        sidecarFilename = filename + self._sidecarSuffix
+        (fd, tmpFilename) = tempfile.mkstemp(dir=os.path.dirname(sidecarFilename))
+        try:
+            fh = os.fdopen(fd, 'wb')
+            try:
+                np.savez(fh, **arrays)
+            finally:
+                fh.close()
+            os.chmod(tmpFilename, 0644)
+            if os.path.exists(sidecarFilename):
+                os.remove(sidecarFilename)
+            os.rename(tmpFilename, sidecarFilename)
+        except:
+            if os.path.exists(tmpFilename):
+                os.remove(tmpFilename)
+            raise
+
+    @classmethod
+    def _fromSidecar(cls, filename):
+        """
+        Create object from the binary sidecar of the CAF dataset index file.
+
+        @type  filename: str
+        @param filename: path to the CAF dataset index file
+
+        @return: created object or C{None} if the sidecar does not exist or is
+                 out of date
+        @rtype: cls
+        """
+        sidecarFilename = filename + cls._sidecarSuffix
+        if not os.path.exists(sidecarFilename):
+            return None
+
+        try:
+            sidecar = np.load(sidecarFilename)
+            try:
+                if not cls._isSidecarValid(sidecar, filename):
+                    return None
+                return cls.__fromArrays(sidecar)
+            finally:
+                sidecar.close()
+
+        except Exception, e:
+            print >>sys.stderr, "Unable to load the index sidecar: %s" % e
+            return None
+
+    @classmethod
+    def __fromArrays(cls, sidecar):
+        """
+        Create object from arrays stored in the binary sidecar.
+
+        @type  sidecar: numpy.lib.npyio.NpzFile
+        @param sidecar: loaded binary sidecar
+
+        @rtype: cls
+        """
+        result = cls()
+
+        for (name, value) in zip(sidecar['propertyNames'].tolist(),
+                                 sidecar['propertyValues'].tolist()):
+            result._properties[name] = cls._propertyElement(name, value)
+
+        for (number, coord, matrix) in zip(sidecar['slideNumbers'].tolist(),
+                                           sidecar['slideCoords'].tolist(),
+                                           sidecar['slideMatrices'].tolist()):
+            result._slides[number] = cls._slideElement(coronalcoord=coord,
+                                       slidenumber=number,
+                                       transformationmatrix=tuple(matrix))
+
+        offsets = sidecar['structureSlideOffsets'].tolist()
+        structureSlides = sidecar['structureSlides'].tolist()
+        types = _unpackOptional(sidecar['structureTypes'],
+                                sidecar['structureTypesMask'])
+
+        for (i, (name, uid, bbx, structureType)) in\
+                enumerate(zip(sidecar['structureNames'].tolist(),
+                              sidecar['structureUids'].tolist(),
+                              sidecar['structureBbxs'].tolist(), types)):
+            slideList = [result._slides[x]\
+                         for x in structureSlides[offsets[i]:offsets[i + 1]]]
+            result._structures[name] =\
+                    cls._structureElement(name,
+                                          cls._clsBoundingBox(tuple(bbx)),
+                                          uid, type=structureType,
+                                          slideList=slideList)
+
+        columns = [('name', sidecar['groupNames'].tolist()),
+                   ('id', sidecar['groupIds'].tolist())]
+        for (attribute, name) in [('uid', 'groupUids'),
+                                  ('fill', 'groupFills'),
+                                  ('fullname', 'groupFullnames'),
+                                  ('ontologyid', 'groupOntologyIds')]:
+            columns.append((attribute,
+                            _unpackOptional(sidecar[name], sidecar[name + 'Mask'])))
+
+        # Groups are stored in preorder, so every parent precedes its children
+        groups = []
+        for (i, parent) in enumerate(sidecar['groupParents'].tolist()):
+            attrs = dict((attribute, values[i]) for (attribute, values) in columns\
+                                                if values[i] != None)
+            group = cls._groupElement(**attrs)
+            if parent >= 0:
+                groups[parent].children.append(group)
+            groups.append(group)
+
+        result._hierarchyGroups[groups[0].name] = groups[0]
+        result.__bindHierarchy()
         return result
 
     def normaliseIDs(self):
@@ -1288,6 +2017,7 @@ class barIndexer(barIndexerObject):
 
         # reset ID generators
         (self._gid, self._uid) = map(lambda x: self._initialIDs[x], ['gid', 'uid'])
+        self._hierarchyIntervals = None
         # list of touples (attrName, idGenerator, src, dst) controlling iteration of top-level for loop.
         # attrName is the name of object ID attribute to be normalised, idGenerator - ID generator
         # for barIndexer object, src - list of objects containing every ID value in the object,
@@ -1384,30 +2114,43 @@ class barIndexer(barIndexerObject):
         assert self._uid <= val, "uid can not be reduced"
         self._uid = max(self._uid, val)
 
-    def __indexStructures(self, structure, slide):
+    def __indexStructures(self, name, bbx, slide):
         """
         Index provided structure with slide. If structure already exists
         in index only new path are appended to it, otherwise new index entry
         for this structure is created.
 
-        @type  structure: L{barGenericStructure}
-        @param structure: structure to index
+        @type  name: str
+        @param name: name of the structure to index
+
+        @type  bbx: (float, float, float, float)
+        @param bbx: bounding box of the structure on the slide
 
         @type  slide: L{_slideElement}
         @param slide: slide to be indexed with the structure
         """
         # If given structure exists:
-        if structure.name not in self._structures:
-            self._structures[structure.name] =\
+        if name not in self._structures:
+            self._structures[name] =\
                  self._structureElement(\
-                    structure.name,
-                    self._clsBoundingBox(structure.bbx),
+                    name,
+                    self._clsBoundingBox(bbx),
                     self.uid,
                     slideList = slide)
+
+            # Relink hierarchy group left without its structure by
+            # L{unindexSlide}
+            group = self._hierarchyGroups.get(name)
+            if group != None and group.structure == None:
+                group.structure = self._structures[name]
+        # Structure retained by L{unindexSlide} while reindexing the slide:
+        elif not self._structures[name].slideList:
+            self._structures[name].addSlide(slide)
+            self._structures[name].bbx = self._clsBoundingBox(bbx)
         # Otherwise:
         else:
-            self._structures[structure.name].addSlide(slide)
-            self._structures[structure.name].bbx+=self._clsBoundingBox(structure.bbx)
+            self._structures[name].addSlide(slide)
+            self._structures[name].bbx+=self._clsBoundingBox(bbx)
 
     def __getFullNameMapping(self):
         """
@@ -1594,6 +2337,7 @@ class barIndexer(barIndexerObject):
         childGroup  = self._hierarchyGroups[child]
         parentGroup.children.append(childGroup)
         childGroup.parent = parentGroup
+        self._hierarchyIntervals = None
 
     def __setHierarchy(self, sourceDictionary):
         """
@@ -1614,6 +2358,7 @@ class barIndexer(barIndexerObject):
         if len(self._hierarchyGroups):
             del self._hierarchyGroups
             self._hierarchyGroups = {}
+        self._hierarchyIntervals = None
 
         # Define unique list of hierarchy elements basing on provided dict
         uniqeNames = list(set(base.flatten(sourceDictionary.items())))
@@ -1701,31 +2446,254 @@ class barIndexer(barIndexerObject):
                         "Required index property not provided: %s.",\
                         (dataElement,))
 
-    def indexSingleSlide(self, tracedSlide, slideNumber):
+    def indexSingleSlide(self, tracedSlide, slideNumber, digest=None):
         """
         Register given CAF slide to the CAF dataset index.
 
+        If a slide of the same number has already been registered with the
+        object, its contribution to the index is replaced.
+
         @type  slideNumber: int
         @param slideNumber: slide number
 
         @type  tracedSlide: L{base.barTracedSlide}
         @param tracedSlide: CAF slide representation
+
+        @type  digest: str
+        @param digest: digest of the CAF slide file (see L{getSlideDigest})
         """
 
         print >>sys.stderr, "Indexer: indexing slide %d" % (slideNumber,)
 
-        slide = self._slideElement(\
+        self.__indexSlide(slideNumber,
                 tracedSlide.metadata[base.BAR_BREGMA_METADATA_TAGNAME].value,
-                slideNumber,
-                tracedSlide.metadata[base.BAR_TRAMAT_METADATA_TAGNAME].value)
+                tracedSlide.metadata[base.BAR_TRAMAT_METADATA_TAGNAME].value,
+                [(x.name, x.bbx) for x in tracedSlide.values()],
+                digest)
+
+    def __indexSlide(self, slideNumber, coronalcoord, transformationmatrix,
+                     structures, digest):
+        """
+        Register CAF slide described by its metadata and structures to the CAF
+        dataset index.
+
+        @type  structures: [(str, (float, float, float, float)), ...]
+        @param structures: names and bounding boxes of structures of the slide
+
+        @note: For description of other arguments see L{indexSingleSlide}.
+        """
+        # Structures present on the reindexed slide are retained (together
+        # with their UIDs and hierarchy groups) even if the slide was the only
+        # one they were present on.
+        if slideNumber in self._slideRecords:
+            self.__unindexSlide(slideNumber, set(name for (name, bbx) in structures))
+
+        slide = self._slideElement(coronalcoord, slideNumber,
+                                   transformationmatrix)
 
         # Iterate over all structures in given slide and create index entry for
         # each of the structure:
-        map(lambda struct: self.__indexStructures(struct, slide),\
-                tracedSlide.values())
+        for (name, bbx) in structures:
+            self.__indexStructures(name, bbx, slide)
 
         # Extract metadata from the slide
         self._slides[slideNumber] = slide
+        self._slideRecords[slideNumber] = (digest, structures)
+        self._hierarchyIntervals = None
+        self._spatialIndex = None
+
+    def unindexSlide(self, slideNumber):
+        """
+        Remove contribution of given CAF slide from the CAF dataset index.
+
+        Bounding boxes of structures are recomputed from bounding boxes
+        contributed by remaining slides; structures not present on any
+        remaining slide are removed.
+
+        @type  slideNumber: int
+        @param slideNumber: number of the slide registered with
+                            L{indexSingleSlide}
+        """
+        self.__unindexSlide(slideNumber)
+
+    def __unindexSlide(self, slideNumber, retained=()):
+        """
+        Remove contribution of given CAF slide from the CAF dataset index.
+
+        @type  slideNumber: int
+        @param slideNumber: number of the slide registered with
+                            L{indexSingleSlide}
+
+        @type  retained: set
+        @param retained: names of structures not to be removed even if not
+                         present on any remaining slide
+        """
+        (digest, structures) = self._slideRecords.pop(slideNumber)
+        del self._slides[slideNumber]
+
+        for (name, bbx) in structures:
+            structure = self._structures[name]
+            structure.removeSlide(slideNumber)
+
+            if not structure.slideList:
+                if name in retained:
+                    continue
+                del self._structures[name]
+                group = self._hierarchyGroups.get(name)
+                if group != None and group.structure is structure:
+                    group.structure = None
+                continue
+
+            # Bounding boxes can be recomputed only if contributions of all
+            # remaining slides are known
+            remaining = structure.slideList
+            if all(x in self._slideRecords for x in remaining):
+                structure.bbx = reduce(lambda x, y: x + y,
+                         (self._clsBoundingBox(b)\
+                          for x in remaining\
+                          for (n, b) in self._slideRecords[x][1] if n == name))
+
+        self._hierarchyIntervals = None
+        self._spatialIndex = None
+
+    def getSlideDigest(self, slideNumber):
+        """
+        @type  slideNumber: int
+        @param slideNumber: slide number
+
+        @return: digest of the CAF slide file given when the slide was
+                 registered to the index; C{None} if unknown
+        @rtype: str
+        """
+        record = self._slideRecords.get(slideNumber)
+        if record == None:
+            return None
+        return record[0]
+
+    def restoreSlide(self, slideNumber, record):
+        """
+        Register CAF slide to the CAF dataset index using its record (as
+        returned by L{readSlideRecords}) instead of the slide itself.
+
+        @type  slideNumber: int
+        @param slideNumber: slide number
+
+        @type  record: (str, float, [float, ...], [(str, (float, float, float, float)), ...])
+        @param record: digest of the CAF slide file, coronal coordinate and
+                       transformation matrix of the slide and names and
+                       bounding boxes of structures of the slide
+
+        Reindexing a slide preserves UIDs of its structures and their links
+        to hierarchy groups:
+
+        >>> index = barIndexer()
+        >>> index.restoreSlide(1, ('a', 1.0, [0.1, -6, -0.1, 5],
+        ...                        [('Hp', (10, 10, 20, 20)), ('Cx', (0, 0, 5, 5))]))
+        >>> index.createFlatHierarchy()
+        >>> sorted(index.uidList.items())
+        [('Brain', [100001, 100002]), ('Cx', [100002]), ('Hp', [100001])]
+        >>> index.restoreSlide(1, ('b', 1.0, [0.1, -6, -0.1, 5],
+        ...                        [('Hp', (12, 10, 30, 20))]))
+        >>> print index.groups['Hp'].uid, index.structures['Hp'].bbx
+        100001 12,10,30,20
+        >>> sorted(index.uidList.items())
+        [('Brain', [100001]), ('Cx', []), ('Hp', [100001])]
+        >>> index.restoreSlide(1, ('c', 1.0, [0.1, -6, -0.1, 5],
+        ...                        [('Hp', (12, 10, 30, 20)), ('Cx', (0, 0, 5, 5))]))
+        >>> sorted(index.uidList.items())
+        [('Brain', [100001, 100003]), ('Cx', [100003]), ('Hp', [100001])]
+        """
+        (digest, coronalcoord, transformationmatrix, structures) = record
+        self.__indexSlide(slideNumber, coronalcoord, transformationmatrix,
+                          structures, digest)
+
+    def getSlideRecords(self):
+        """
+        @return: slide number to slide record (see L{restoreSlide}) mapping
+                 for slides registered with L{indexSingleSlide} or
+                 L{restoreSlide}
+        @rtype: {int : (str, float, [float, ...], [(str, (float, float, float, float)), ...])}
+        """
+        return dict((slideNumber, (digest,
+                                   self._slides[slideNumber].coronalcoord,
+                                   self._slides[slideNumber].transformationmatrix,
+                                   structures))\
+                    for (slideNumber, (digest, structures))\
+                    in self._slideRecords.iteritems())
+
+    def writeSlideRecords(self, filename):
+        """
+        Save records of slides registered with L{indexSingleSlide} or
+        L{restoreSlide} as a numpy C{.npz} archive.
+
+        @type  filename: str
+        @param filename: path to the file
+        """
+        records = self.getSlideRecords()
+        slideNumbers = sorted(records)
+        digests, coords, matrices = [], [], []
+        rowSlides, rowNames, rowBbxs = [], [], []
+        for slideNumber in slideNumbers:
+            (digest, coronalcoord, transformationmatrix, structures) =\
+                                                         records[slideNumber]
+            digests.append(digest)
+            coords.append(coronalcoord)
+            matrices.append(transformationmatrix)
+            for (name, bbx) in structures:
+                rowSlides.append(slideNumber)
+                rowNames.append(name)
+                rowBbxs.append(bbx)
+
+        (digests, digestsMask) = _packOptional(digests)
+        fh = open(filename, 'wb')
+        try:
+            np.savez(fh,
+                     slideNumbers=np.array(slideNumbers, dtype=np.int64),
+                     slideDigests=digests,
+                     slideDigestsMask=digestsMask,
+                     slideCoords=np.array(coords, dtype=float),
+                     slideMatrices=np.array(matrices, dtype=float).reshape(-1, 4),
+                     rowSlides=np.array(rowSlides, dtype=np.int64),
+                     rowNames=np.array(rowNames, dtype=unicode),
+                     rowBbxs=np.array(rowBbxs, dtype=float).reshape(-1, 4))
+        finally:
+            fh.close()
+
+    @staticmethod
+    def readSlideRecords(filename):
+        """
+        Load slide records saved with L{writeSlideRecords}.
+
+        @type  filename: str
+        @param filename: path to the file
+
+        @return: slide number to slide record (see L{restoreSlide}) mapping
+        @rtype: {int : (str, float, [float, ...], [(str, (float, float, float, float)), ...])}
+        """
+        records = np.load(filename)
+        try:
+            slideNumbers = records['slideNumbers'].tolist()
+            digests = _unpackOptional(records['slideDigests'],
+                                      records['slideDigestsMask'])
+            coords = records['slideCoords'].tolist()
+            matrices = records['slideMatrices'].tolist()
+            rowSlides = records['rowSlides']
+            rowNames = records['rowNames'].tolist()
+            rowBbxs = records['rowBbxs']
+        finally:
+            records.close()
+
+        # rows of every slide are stored contiguously in the slide order
+        bounds = np.searchsorted(rowSlides, slideNumbers).tolist() +\
+                 [len(rowNames)]
+
+        result = {}
+        for (i, slideNumber) in enumerate(slideNumbers):
+            structures = [(rowNames[j], tuple(rowBbxs[j]))\
+                          for j in xrange(bounds[i], bounds[i + 1])]
+            result[slideNumber] = (digests[i], coords[i], matrices[i],
+                                   structures)
+        return result
 
     def getXMLelement(self):
         """
@@ -1779,6 +2747,7 @@ class barIndexer(barIndexerObject):
         """
         name = group.name
         self._hierarchyGroups[name] = group
+        self._hierarchyIntervals = None
         group.parent = parent
         for grp in group.children:
             self.__addGroup(grp, group)
@@ -1786,14 +2755,54 @@ class barIndexer(barIndexerObject):
         if name in self._structures:
             group.structure = self._structures[name]
 
+    def __getHierarchyIntervals(self):
+        """
+        @return: interval encoding of the hierarchy
+        @rtype: L{barIndexerHierarchyIntervals}
+
+        @note: Result of the method is cached in L{_hierarchyIntervals}.
+        """
+        if self._hierarchyIntervals == None:
+            self._hierarchyIntervals =\
+                barIndexerHierarchyIntervals(self._hierarchyGroups,
+                                             self._structures)
+        return self._hierarchyIntervals
+
+    def __getSpatialIndex(self):
+        """
+        @return: spatial index of bounding boxes of structures on slides
+                 registered with L{indexSingleSlide} or L{restoreSlide}
+        @rtype: L{barIndexerSpatialIndex}
+
+        @note: Result of the method is cached in L{_spatialIndex}.
+
+        @note: If no slide was registered and L{cafDirectory} is given, the
+               spatial index is loaded from the L{_slideRecordsFilename} file
+               in L{cafDirectory}; ValueError is raised if there is no such
+               file.
+        """
+        if self._spatialIndex == None:
+            # Slide records of index loaded from file are not known; they are
+            # stored next to the index by L{writeSlideRecords}
+            if not self._slideRecords and self.cafDirectory != None:
+                filename = os.path.join(self.cafDirectory,
+                                        self._slideRecordsFilename)
+                if not os.path.exists(filename):
+                    raise ValueError, "Spatial index unavailable: no slide records file %s." % filename
+                self._spatialIndex = barIndexerSpatialIndex.fromFile(filename)
+            else:
+                self._spatialIndex = barIndexerSpatialIndex(self.getSlideRecords())
+        return self._spatialIndex
+
     def visibleGroups(self, depth = 999, leavesOnly = False):
         """
-        An alias for C{self.L{groups}[self.L{hierarchyRootElementName}].L{getVisibleGroupIterator<barIndexerGroupElement.getVisibleGroupIterator>}()}.
+        Equivalent of C{self.L{groups}[self.L{hierarchyRootElementName}].L{getVisibleGroupIterator<barIndexerGroupElement.getVisibleGroupIterator>}()}.
         """
         group = self.hierarchyRootElementName
 
-        return self.groups[group].getVisibleGroupIterator(depth = depth,
-                                                          leavesOnly = leavesOnly)
+        return iter(self.hierarchyIntervals.getVisibleGroups(group,
+                                                             depth = depth,
+                                                             leavesOnly = leavesOnly))
 
     def unfoldSubtrees(self, rootStructures, defaultDepth=0, leavesOnly=False):
         """
@@ -1818,10 +2827,9 @@ class barIndexer(barIndexerObject):
             else:
                 root, depth = arg, defaultDepth
 
-            group = self.groups[root]
-
             return set(x.name\
-                       for x in group.getVisibleGroupIterator(depth = depth,
+                       for x in self.hierarchyIntervals.getVisibleGroups(root,
+                                                              depth = depth,
                                                               leavesOnly=leavesOnly))
 
         return reduce(lambda x, y: x | y, (unfoldSubtree(z) for z in rootStructures))
@@ -1906,8 +2914,7 @@ class barIndexer(barIndexerObject):
         @return: hierarchy group name to UIDs of assigned structures mapping
         """
 
-        return dict(map(lambda x: (x.name, x.uidList),
-                        self._hierarchyGroups.values()))
+        return self.hierarchyIntervals.getUidLists()
 
     def __setUidList(self, newList):
         """
@@ -2033,6 +3040,27 @@ class barIndexer(barIndexerObject):
     @type: {str : [int, ...]}
     """
 
+    spatialIndex = property(__getSpatialIndex)
+    """
+    Spatial index of bounding boxes of structures on slides registered with
+    L{indexSingleSlide} or L{restoreSlide} (recomputed after slides are
+    registered or removed).
+
+    Read-only property.
+
+    @type: L{barIndexerSpatialIndex}
+    """
+
+    hierarchyIntervals = property(__getHierarchyIntervals)
+    """
+    Interval encoding of the hierarchy (recomputed after the hierarchy,
+    structures or slides are modified by the object methods).
+
+    Read-only property.
+
+    @type: L{barIndexerHierarchyIntervals}
+    """
+
 
 if __name__=='__main__':
     pass
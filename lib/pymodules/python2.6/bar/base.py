@@ -82,13 +82,21 @@ G{importgraph}
     12. C{BestFillAlgorithm}: (C{function}) reference for function for
     defining best gap filling level. This setting may be used to
     provide custom 'selectBestGapFillingLevel' function
+    13. C{TracingProcesses}: (C{int}) optional number of processes tracing
+    labels of a single slide in parallel (C{None} for the number of CPUs);
+    labels are traced one after another if C{1} or not given or if the slide
+    is traced by a daemonic process (e.g. a worker of a parser parsing many
+    slides in parallel)
 """
 
 import os,  sys, re
+import multiprocessing
 from string import *
 
 import xml.dom.minidom as dom
 import xml.dom
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
 import numpy as np
 import cairo,  rsvg
 from PIL import Image, ImageFilter, ImageChops, ImageOps, ImageDraw
@@ -96,10 +104,13 @@ from PIL import Image, ImageFilter, ImageChops, ImageOps, ImageDraw
 import svgfix
 from defaults import re_CoordinateMarker, re_CoronalCoord
 from svgpathparse import parsePath,UnparsePath, extractBoundingBox,_mergeBoundingBox,\
-                         modifyContour, parseStyle, formatStyle
+                         modifyContour, parseStyle, formatStyle, flattenPathArrays,\
+                         parsePathArrays, formatPathArrays, extractBoundingBoxArrays
 import slides_aligner
-from image_process import performTracing, getBestLabelLocation, massCentre,\
-        floodFillScanlineStack, selectBestGapFillingLevel
+from image_process import performTracing, performTracingBatch,\
+        getBestLabelLocation, getPolygonsLabelLocations, massCentre,\
+        floodFillEngine, greyErosionEngine, getPatches,\
+        selectBestGapFillingLevel
 
 
 BAR_XML_NAMESPACE = 'http://www.3dbar.org'
@@ -217,6 +228,7 @@ BAR_TRACER_DEFAULT_SETTINGS['RegionAlreadyTraced']      = 100
 BAR_TRACER_DEFAULT_SETTINGS['UnlabelledTreshold']       = 500
 BAR_TRACER_DEFAULT_SETTINGS['PoTraceConf'] = CONF_DEFAULT_POTRACE_PROPERTIES
 BAR_TRACER_DEFAULT_SETTINGS['NewPathIdTemplate'] = 'structure%d_%s_%s'
+BAR_TRACER_DEFAULT_SETTINGS['TracingProcesses']  = 1
 #}
 
 #GrowLevel - gap filling algorithm constants
@@ -573,14 +585,6 @@ class barStructureLabel(barAtlasSlideElement):
         if not svgTextElement.tagName == 'text':
             raise TypeError, "Invalid SVG element provided"
 
-        # Extract all attributes from given element:
-        propertiesDict =\
-        cls._getAttributesDict(svgTextElement)
-
-        # Extract label's coordinates, caption and id which will be used in
-        # label's constructor.
-        x, y = map(lambda x: float(propertiesDict[x]), ['x','y'])
-
         # Now it's a bit tricky. Text elements may contain a number of nested
         # tspan tags. We will check if such tags exist and, it they are,
         # text will be extcracted from all of them and merged after all.
@@ -588,6 +592,31 @@ class barStructureLabel(barAtlasSlideElement):
         labelCaption = _recurseTextNodeExtract(svgTextElement)
 
         #labelCaption = strip(svgTextElement.firstChild.nodeValue)
+        return cls.fromAttributes(cls._getAttributesDict(svgTextElement),
+                                  labelCaption)
+
+    @classmethod
+    def fromAttributes(cls, propertiesDict, labelCaption):
+        """
+        Create label object from attributes and text of its XML
+        representation.
+
+        @note: The method returns object of the proper class (according to
+               the type of the given label representation).
+
+        @type  propertiesDict: {str : str, ...}
+        @param propertiesDict: attribute name to value mapping of the C{text}
+                               element
+
+        @type  labelCaption: str
+        @param labelCaption: merged text of the C{text} element
+
+        @return: created label object
+        @rtype: L{barStructureLabel}
+        """
+        # Extract label's coordinates, caption and id which will be used in
+        # label's constructor.
+        x, y = map(lambda x: float(propertiesDict[x]), ['x','y'])
         labelID = propertiesDict['id']
 
         # Extract growlevel attribute
@@ -883,6 +912,21 @@ class barMetadataElement(barAtlasSlideElement):
         # Extract all attributes from given element:
         propertiesDict =\
           cls._clsStructureLabel._getAttributesDict(svgMetadataElement)
+        return cls.fromAttributes(propertiesDict)
+
+    @classmethod
+    def fromAttributes(cls, propertiesDict):
+        """
+        Create metadata element from attributes of XML representation of 3dBAR
+        metadata element. Determine which type of metadata is parsed and
+        return proper subclass for L{barMetadataElement}.
+
+        @type  propertiesDict: {str : str, ...}
+        @param propertiesDict: attribute name to value mapping of the element
+
+        @return: created metadata element
+        @rtype: L{barMetadataElement}
+        """
         metadataElType    = propertiesDict['name']
         metadataElContent = propertiesDict['content']
 
@@ -1158,7 +1202,7 @@ class barMarker(barAtlasSlideElement):
         """
         An alias for C{self.L{__affineTransform}(M)}.
         """
-        return self.affineTransform(M)
+        return self.__affineTransform(M)
 
     spatialLocation = property(_getSpatialLocation, _setSpatialLocation)
     """
@@ -1254,27 +1298,47 @@ class barPath(barAtlasSlideElement):
         @type svgPathElement: xml.dom.node
         @param svgPathElement: XML representation of the object
 
+        @return: created object
+        @rtype: cls
+        """
+        attributes = cls._getAttributesDict(svgPathElement)
+        for attribName in ['growlevel', 'type']:
+            attributes[BAR_XML_NAMESPACE_PREFIX + attribName] =\
+                svgPathElement.getAttributeNS(BAR_XML_NAMESPACE, attribName)
+
+        return cls.fromAttributes(attributes, clearPathDef = clearPathDef)
+
+    @classmethod
+    def fromAttributes(cls, attributes, clearPathDef = False):
+        """
+        Create path object from attributes of its XML representation.
+
+        @type attributes: {str : str, ...}
+        @param attributes: attribute name to value mapping; names of
+                           attributes from 3dBAR namespace are prefixed with
+                           L{BAR_XML_NAMESPACE_PREFIX}
+
         @return: created object
         @rtype: cls
         """
         # Extract id, definition and color from path
-        pathDefinition = svgPathElement.getAttribute('d')
-        pathID = svgPathElement.getAttribute('id')
+        pathDefinition = attributes.get('d', '')
+        pathID = attributes.get('id', '')
         if clearPathDef:
             pathDefinition = cls.simplifyPathDef(pathDefinition)
 
         # If path element has defined fill color remove it and overwrite it with
         # inline style
-        if svgPathElement.hasAttribute('fill'):
-            fillColor = svgPathElement.getAttribute('fill')
+        if attributes.has_key('fill'):
+            fillColor = attributes['fill']
         else:
-            styleDict = parseStyle(svgPathElement.getAttribute('style'))
+            styleDict = parseStyle(attributes.get('style', ''))
             fillColor = styleDict.get('fill',"#000000")
 
         # we treat growlevel as optional parameter
         try:
-            growlevel = int(svgPathElement.getAttributeNS(\
-                    BAR_XML_NAMESPACE, 'growlevel'))
+            growlevel = int(attributes.get(\
+                    BAR_XML_NAMESPACE_PREFIX + 'growlevel', ''))
         except:
             growlevel = 0
             if __debug__:
@@ -1287,8 +1351,7 @@ class barPath(barAtlasSlideElement):
         # Try to extract feature type and assign it to the path.
         # Skip it, if the feature type is undefined.
         try:
-            strType = svgPathElement.getAttributeNS(\
-                        BAR_XML_NAMESPACE, 'type')
+            strType = attributes.get(BAR_XML_NAMESPACE_PREFIX + 'type', '')
 
             retPath.type = strType
 
@@ -1312,13 +1375,18 @@ class barPath(barAtlasSlideElement):
 
         # Convert incompatible path format (relative coordinates, long curve segments)
         # to more legible format compatible with parser
-        return  UnparsePath(parsePath(pathDefinition))
+        return  formatPathArrays(*parsePathArrays(pathDefinition))
 
     def _getPathDefinition(self):
         """
         @return: SVG path definition
         @rtype: str
+
+        @note: If the path geometry has been modified as arrays (see
+               L{pathArrays}) the definition is serialised here.
         """
+        if self._attributes['d'] == None:
+            self._attributes['d'] = formatPathArrays(*self._pathArrays)
         return self._attributes['d']
 
     def _setPathDefinition(self, newPathDefinition, clearPathDef = False):
@@ -1335,13 +1403,39 @@ class barPath(barAtlasSlideElement):
                              invalid raise ValueError
         """
         if clearPathDef:
-            if not self._validatePath(newPathDefinition):
+            pathArrays = parsePathArrays(newPathDefinition)
+            if not self._validatePath(newPathDefinition, pathArrays[0]):
                 raise ValueError, "Invalid path definition provided"
-            self._attributes['d'] = self.simplifyPathDef(newPathDefinition)
+            self._setPathArrays(pathArrays)
         else:
             self._attributes['d'] = newPathDefinition
+            self._pathArrays = None
+            self._bbox = None
+
+    def _getPathArrays(self):
+        """
+        @return: commands and parameters of the path (see
+                 L{parsePathArrays<svgpathparse.parsePathArrays>})
+        @rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        if self._pathArrays == None:
+            self._pathArrays = parsePathArrays(self._attributes['d'])
+        return self._pathArrays
+
+    def _setPathArrays(self, newPathArrays):
+        """
+        Assign the path geometry. The path definition is not serialised until
+        it is requested.
+
+        @type  newPathArrays: (numpy.ndarray, numpy.ndarray)
+        @param newPathArrays: commands and parameters of the path in format
+                              of L{parsePathArrays<svgpathparse.parsePathArrays>}
+        """
+        self._pathArrays = tuple(newPathArrays)
+        self._attributes['d'] = None
+        self._bbox = None
 
-    def _validatePath(self, pathDefinition):
+    def _validatePath(self, pathDefinition, commands = None):
         """
         Validate SVG path definition: Path definition has to contain at least
         three points and 'closepath'command in order to be considered as valid
@@ -1350,11 +1444,18 @@ class barPath(barAtlasSlideElement):
         @type  pathDefinition: str
         @param pathDefinition: SVG path definition to be validated.
 
+        @type  commands: numpy.ndarray
+        @param commands: commands of already parsed L{pathDefinition}; if not
+                         given L{pathDefinition} is parsed
+
         @return: True, if path definition is correct, False otherwise
         @rtype: bool
         """
+        if commands is None:
+            commands = parsePathArrays(pathDefinition)[0]
+
         # Validate length:
-        if len(parsePath(pathDefinition)) <= 3:
+        if len(commands) <= 3:
             return False
 
         # Search for 'closepath' command
@@ -1465,12 +1566,15 @@ class barPath(barAtlasSlideElement):
 
     def _getBbox(self):
         """
-        Return value of the 'L{boundingBox}' property.
+        Return value of the 'L{boundingBox}' property. The bounding box is
+        computed once and cached until the path geometry is changed.
 
         @return: the bounding box description (x1, y1, x2, y2)
         @rtype: (int, int, int, int)
         """
-        return extractBoundingBox(self._attributes['d'])
+        if self._bbox == None:
+            self._bbox = extractBoundingBoxArrays(*self._getPathArrays())
+        return self._bbox
 
     def _setBbox(self, newBBox):
         """
@@ -1535,7 +1639,7 @@ class barPath(barAtlasSlideElement):
         @param M: transformation matrix
         @type M: numpy 3x3 array
         """
-        self.pathDef = svgfix.fixPathDefinition(self.pathDef,  M)
+        self.affineTransformPaths([self], M)
 
     def affineTransform(self, M):
         """
@@ -1543,6 +1647,40 @@ class barPath(barAtlasSlideElement):
         """
         return self.__affineTransform(M)
 
+    @staticmethod
+    def affineTransformPaths(paths, M):
+        """
+        Transform the location of given paths in SVG coordinate system. Points
+        of all paths are transformed at once (see
+        L{transformPathArrays<svgfix.transformPathArrays>}).
+
+        @param paths: paths to be transformed
+        @type paths: [L{barPath}, ...]
+
+        @param M: transformation matrix
+        @type M: numpy 3x3 array
+        """
+        pathArrays = [path._getPathArrays() for path in paths]
+        transformed = svgfix.transformPathArrays(pathArrays, M)
+
+        for (path, (commands, parameters), newParameters) in\
+                                        zip(paths, pathArrays, transformed):
+            path._setPathArrays((commands, newParameters))
+
+    def getXMLelement(self, useBarNS = False):
+        """
+        Generate XML DOM representation of the path. Serialise the path
+        definition if necessary.
+
+        @type  useBarNS: bool
+        @param useBarNS: determines, if element uses 3dBAR XML namespace
+
+        @rtype: xml.dom.minidom.Node
+        @return: XML representation of the path
+        """
+        self._getPathDefinition()
+        return barAtlasSlideElement.getXMLelement(self, useBarNS)
+
     def __setCrispEdges(self, boolValue):
         """
         Set the value of 'shape-rendering' attribute.
@@ -1611,15 +1749,22 @@ class barPath(barAtlasSlideElement):
     @type: str
     """
 
+    pathArrays = property(_getPathArrays, _setPathArrays)
+    """
+    The path geometry as commands and parameters arrays (see
+    L{parsePathArrays<svgpathparse.parsePathArrays>}).
+
+    @type: (numpy.ndarray, numpy.ndarray)
+    """
+
     boundingBox= property(_getBbox, _setBbox)
     """
     The path bounding box description (x1, y1, x2, y2), where x1, y2 are
     coordinates of top-left corner of bounding box and x2, y2 are coordinates
     of bottom-right corner of bounding box.
 
-    Please note that bounding box is only approximation of actual bounding box
-    and may be slightly larger as it is based on extreme coordinated of control
-    points creating given path. However, the difference is neglectable.
+    The bounding box includes extrema of Bezier curves of the path (see
+    L{extractBoundingBoxArrays<svgpathparse.extractBoundingBoxArrays>}).
 
     Read-only property.
 
@@ -1902,7 +2047,7 @@ class barGenericStructure(barAtlasSlideElement):
         @param M: transformation matrix
         @type M: numpy 3x3 array
         """
-        map(lambda x: x.affineTransform(M),  self.paths)
+        self._clsPath.affineTransformPaths(self.paths, M)
 
     def affineTransform(self, M):
         """
@@ -2338,12 +2483,19 @@ class barVectorSlide(barObject):
 
     def __affineTransform(self, M):
         """
-        Transform the location of all paths in SVG coordinate system.
+        Transform the location of all labels in SVG coordinate system.
 
         @param M: transformation matrix
         @type M: numpy 3x3 array
         """
-        map(lambda x: x.affineTransform(M),  self.labels)
+        labels = self.labels
+        if not labels:
+            return
+
+        locations = np.array([label.Location for label in labels])
+        locations = svgfix.transformPoints(locations, M).tolist()
+        for (label, location) in zip(labels, locations):
+            label.Location = location
 
     def affineTransform(self, M):
         """
@@ -2530,8 +2682,20 @@ class barVectorSlide(barObject):
             except:
                 pass
 
-        # Use extracted metadata elements to define tracing and rendering
-        # properties:
+        cls._fromXML_LoadConfiguration(slide)
+
+    @classmethod
+    def _fromXML_LoadConfiguration(cls, slide):
+        """
+        Use extracted metadata elements to define tracing and rendering
+        properties of the slide.
+
+        @type  slide: L{barVectorSlide}
+        @param slide: Slide which metadata has been already loaded
+
+        @rtype: None
+        @return: None
+        """
         slide._tracingConf  = eval(slide._metadata['tracingConf'].value)
         slide._rendererConf = eval(slide._metadata['rendererConf'].value)
 
@@ -2708,6 +2872,8 @@ class barSlideRenderer(barVectorSlide):
             - C{'npy'} - returns NumPy array,
             - C{'rec'} - returns NumPy array rendered according to reconstruction
               module requirements
+            - C{'lbl'} - returns NumPy array of colour codes (white background
+              is replaced by 0) cropped and flipped as in C{'rec'} protocol
 
         @type  svgdoc: xml.dom.minidom.Document
         @param svgdoc: SVG document to render
@@ -2718,11 +2884,11 @@ class barSlideRenderer(barVectorSlide):
 
         @type  boundingBox: (int, int, int, int)
         @param boundingBox: cropping coordinates (left, top, right, bottom);
-                            applies only to 'rec' protocol
+                            applies only to 'rec' and 'lbl' protocols
 
         @type  otype: str
         @param otype: requested rendering protocol - one of C{'pil'}, C{'npy'},
-                      C{'rec'}
+                      C{'rec'}, C{'lbl'}
 
         @type  grayscale: bool
         @param grayscale: determines if returned image would be in grayscale
@@ -2757,67 +2923,131 @@ class barSlideRenderer(barVectorSlide):
         # Save snapshot of rendered image for debug purposes
         #if __debug__: surface.write_to_png ('debugfilename.png')
 
-        # Now we need generate PIL image from raw data extracted
-        # from cairo surface. The workflow is following:
-        # Dump raw image data to numpy, correct channels sequence
-        # And then convert NumPy array to PIL image object.
-
-        # Dump image information to NumPy array
-        # surface.get_data() returns RGBA array thus we have to
-        # reshape this array manually
-        a = np.frombuffer(surface.get_data(), np.uint8)
-        a.shape = (height, width, 4) ###XXX TODO: width and height are reversed!
-
-        # Swap channels (orig) [B,G,R,A] -> [R,G,B,A]
-        b=a.copy()
-        a[:,:,0]=b[:,:,2]
-        a[:,:,2]=b[:,:,0]
-        t=(255-a[:,:,3])
-
-        # TODO: Optimize it
-        a[:,:,0]+=t
-        a[:,:,1]+=t
-        a[:,:,2]+=t
-
-        # Remove unnecessary arrays
-        del b
-        del t
-
-        # TODO: Perhaps desaturation should be done manually (using numpy)
-        # Put final image into cache
-        # Ok, we convert numpy array to image, then we convert it to indexed
-        # colour and then every color that is not white is set to 200 and after
-        # that we have indexed image with 255 colors in which only white and 200
-        # are used
+        # Now we need generate PIL image or NumPy array from raw data
+        # extracted from cairo surface. The surface data is only viewed (not
+        # copied) as a (height, width, 4) array of [B,G,R,A] pixels. Colours
+        # stored by cairo are premultiplied by alpha thus compositing over white
+        # background is reduced to adding (255 - A) to every colour channel
+        # (which never overflows).
+        a = np.ndarray(shape = (height, width, 4), dtype = np.uint8,
+                       buffer = surface.get_data(),
+                       strides = (surface.get_stride(), 4, 1))
 
         # Returns color or grayscaled PIL image
         if otype == 'pil':
+            # [B,G,R] -> [R,G,B] channel swap is only a view
+            rgb = a[:, :, 2::-1] + (255 - a[:, :, 3:4])
+            image = Image.fromarray(rgb, 'RGB')
             if grayscale == True:
-                image = Image.fromarray(a,'RGBA').convert("L")
-            else:
-                image = Image.fromarray(a,'RGBA').convert("RGB")
+                image = image.convert("L")
             return image
 
         # Returns grayscale npy array
         if otype == 'npy':
-            a = 0.2989*a[:, :, 0] + 0.5870*a[:, :, 1] + 0.1140*a[:, :, 2]
+            t = 255 - a[:, :, 3]
+            a = 0.2989*(a[:, :, 2] + t) +\
+                0.5870*(a[:, :, 1] + t) +\
+                0.1140*(a[:, :, 0] + t)
             return a.astype(np.uint8)
 
         # Returns scaled and cropped np. array.
         if otype[0:3] == 'rec':
-            # Convert bitmap to grayscale
-            image = Image.fromarray(a.astype(np.uint8),'RGBA').convert("L")
+            return self._getVolumeSlice(a, boundingBox, otype)
+
+        # Returns cropped np. array of colour codes.
+        if otype[0:3] == 'lbl':
+            return self._getLabelSlice(a, boundingBox, otype)
+
+    @staticmethod
+    def _getVolumeSlice(bgra, boundingBox, otype):
+        """
+        Crop, desaturate, invert and flip rendered image according to
+        reconstruction module requirements.
+
+        Only the region of interest of the image is processed. Parts of the
+        cropping box laying outside the image are treated as black pixels
+        (the way C{PIL.Image.crop} does) thus they became white after
+        inversion. Desaturation follows PIL's C{RGB -> L} integer formula.
+
+        @type  bgra: numpy.ndarray
+        @param bgra: (height, width, 4) array of premultiplied [B,G,R,A] pixels
+
+        @type  boundingBox: (int, int, int, int)
+        @param boundingBox: cropping coordinates (left, top, right, bottom)
+
+        @type  otype: str
+        @param otype: C{'rec'} protocol string with optional flipping flags
+
+        @rtype: numpy.ndarray
+        @return: uint8 array of (cropped width, cropped height, 1) shape
+                 holding cropped image data in row-major order.
+        """
+        height, width = bgra.shape[:2]
+        x1, y1, x2, y2 = map(int, boundingBox)
+
+        volumeSlice = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+
+        # Copy the part of cropping box that overlaps the image
+        cx1, cy1 = max(x1, 0), max(y1, 0)
+        cx2, cy2 = min(x2, width), min(y2, height)
+        if cx1 < cx2 and cy1 < cy2:
+            crop = bgra[cy1:cy2, cx1:cx2]
+            t = 255 - crop[:, :, 3].astype(np.uint32)
+            volumeSlice[cy1-y1:cy2-y1, cx1-x1:cx2-x1] =\
+                ((crop[:, :, 2] + t) * 19595 +\
+                 (crop[:, :, 1] + t) * 38470 +\
+                 (crop[:, :, 0] + t) * 7471) >> 16
 
-            # Crop region of interest:
-            image = image.crop(tuple(map(int,boundingBox)))
+        # By default reverse image to make background black and foreground
+        # white:
+        np.subtract(255, volumeSlice, volumeSlice)
+        if otype[-1] == '1': volumeSlice = volumeSlice[::-1, :]
+        if otype[-2] == '1': volumeSlice = volumeSlice[:, ::-1]
 
-            # By default reverse image to make background black and foreground
-            # white:
-            image = ImageChops.invert(image)
-            if otype[-1] == '1': image = image.transpose(Image.FLIP_TOP_BOTTOM)
-            if otype[-2] == '1': image = image.transpose(Image.FLIP_LEFT_RIGHT)
-            volumeSlice = np.array(image.getdata()).reshape(int(image.size[0]), int(image.size[1]), 1)
-            return volumeSlice
+        # Reshape is applied on the row-major data of (height, width) image
+        return np.ascontiguousarray(volumeSlice).reshape(x2 - x1, y2 - y1, 1)
+
+    @staticmethod
+    def _getLabelSlice(bgra, boundingBox, otype):
+        """
+        Crop and flip rendered image the way L{_getVolumeSlice} does, but
+        instead of desaturating the image decode colour of every pixel as
+        C{0xRRGGBB} integer. White pixels as well as parts of the cropping box
+        laying outside the image are set to 0.
+
+        @type  bgra: numpy.ndarray
+        @param bgra: (height, width, 4) array of premultiplied [B,G,R,A] pixels
+
+        @type  boundingBox: (int, int, int, int)
+        @param boundingBox: cropping coordinates (left, top, right, bottom)
+
+        @type  otype: str
+        @param otype: C{'lbl'} protocol string with optional flipping flags
+
+        @rtype: numpy.ndarray
+        @return: uint32 array of (cropped width, cropped height, 1) shape
+                 holding cropped image data in row-major order.
+        """
+        height, width = bgra.shape[:2]
+        x1, y1, x2, y2 = map(int, boundingBox)
+
+        labelSlice = np.zeros((y2 - y1, x2 - x1), dtype=np.uint32)
+
+        cx1, cy1 = max(x1, 0), max(y1, 0)
+        cx2, cy2 = min(x2, width), min(y2, height)
+        if cx1 < cx2 and cy1 < cy2:
+            crop = bgra[cy1:cy2, cx1:cx2]
+            t = 255 - crop[:, :, 3].astype(np.uint32)
+            colour = ((crop[:, :, 2] + t) << 16) |\
+                     ((crop[:, :, 1] + t) << 8) |\
+                      (crop[:, :, 0] + t)
+            colour[colour == 0xffffff] = 0
+            labelSlice[cy1-y1:cy2-y1, cx1-x1:cx2-x1] = colour
+
+        if otype[-1] == '1': labelSlice = labelSlice[::-1, :]
+        if otype[-2] == '1': labelSlice = labelSlice[:, ::-1]
+
+        return np.ascontiguousarray(labelSlice).reshape(x2 - x1, y2 - y1, 1)
 
     def values(self):
         """
@@ -3069,10 +3299,19 @@ class barPretracedSlide(barSlideRenderer):
         @type M: numpy 3x3 array
         """
         barVectorSlide.affineTransform(self, M)
-        map(lambda x: x.affineTransform(M),  self.markers)
-        for pathElem in self._svgPaths:
-            pathElem.setAttribute('d',\
-                    svgfix.fixPathDefinition(pathElem.getAttribute('d'),  M))
+
+        if self.markers:
+            locations = np.array([m.svgLocation for m in self.markers])
+            locations = svgfix.transformPoints(locations, M).tolist()
+            for (marker, location) in zip(self.markers, locations):
+                marker.svgLocation = tuple(location)
+
+        pathArrays = [parsePathArrays(pathElem.getAttribute('d'))\
+                      for pathElem in self._svgPaths]
+        transformed = svgfix.transformPathArrays(pathArrays, M)
+        for (pathElem, (commands, parameters), newParameters) in\
+                            zip(self._svgPaths, pathArrays, transformed):
+            pathElem.setAttribute('d', formatPathArrays(commands, newParameters))
 
     def parseMarkers(self):
         """
@@ -3192,6 +3431,10 @@ class barTracedSlide(barSlideRenderer):
         """
         Create object representing given SVG slide.
 
+        Slides given as filenames or file handlers are loaded with a streaming
+        parser (see L{_fromXML_Stream}) unless the XML parsing subroutine is
+        customised in the class or C{svgfix} has to be applied to the slide.
+
         @param svgDocument: SVG slide (DOM XML or filename or file handler)
         @type svgDocument: xml.dom.minidom.Document or str or file
 
@@ -3202,6 +3445,15 @@ class barTracedSlide(barSlideRenderer):
         @rtype: cls
         @return: created object
         """
+        if not svgDocument.__class__.__name__ == 'Document' and\
+           cls._fromXML_IsStreamable():
+            slide = cls._fromXML_Stream(svgDocument, fixDrawing)
+            if slide != None:
+                return slide
+
+            # The slide has to be fixed with svgfix: parse it again
+            if hasattr(svgDocument, 'seek'):
+                svgDocument.seek(0)
 
         # Initialize empty slide with dummy tracing and rendering configuration,
         # slide number empty
@@ -3238,16 +3490,107 @@ class barTracedSlide(barSlideRenderer):
         """
         for pathElement in svgdom.getElementsByTagName('path'):
             newPath = cls._clsPath.fromXML(pathElement)
+            cls._fromXML_AddPath(slide, newPath)
 
-            # TODO: Replace with try: except: clause
-            if slide.has_key(newPath.structName):
-                slide.__getitem__(newPath.structName).addPaths(newPath)
-            else:
-                strName = newPath.structName
-                strColor= newPath.color
+    @classmethod
+    def _fromXML_AddPath(cls, slide, newPath):
+        """
+        Add loaded path to the structure of the slide it belongs to. Create
+        the structure if necessary.
+
+        @type  slide: L{barTracedSlide}
+        @param slide: Slide to which the path will be assigned
+
+        @type  newPath: L{barPath}
+        @param newPath: loaded path
+
+        @rtype: None
+        @return: None
+        """
+        # TODO: Replace with try: except: clause
+        if slide.has_key(newPath.structName):
+            slide.__getitem__(newPath.structName).addPaths(newPath)
+        else:
+            strName = newPath.structName
+            strColor= newPath.color
+
+            newStrc = cls._clsGenericStructure(strName, strColor, [newPath])
+            slide.addStructures(newStrc)
 
-                newStrc = cls._clsGenericStructure(strName, strColor, [newPath])
-                slide.addStructures(newStrc)
+    @classmethod
+    def _fromXML_IsStreamable(cls):
+        """
+        @return: True if none of the DOM based steps of the XML parsing
+                 subroutine is overriden in the class, so the slide can be
+                 loaded with L{_fromXML_Stream}, False otherwise
+        @rtype: bool
+        """
+        for methodName in ['_fromXML_ParseXML', '_fromXML_LoadMetadata',
+                           '_fromXML_LoadStructures', '_fromXML_LoadLabels',
+                           '_fromXML_BeforeCleanUpHook', '_fromXML_Cleanup',
+                           '_fromXML_AfterCleanUpHook']:
+            if getattr(cls, methodName).im_func is not\
+               getattr(barTracedSlide, methodName).im_func:
+                return False
+        return True
+
+    @classmethod
+    def _fromXML_Stream(cls, svgDocument, fixDrawing=False):
+        """
+        Create object representing given SVG slide without building the DOM
+        of the slide. Paths, labels and metadata are created directly from
+        attributes collected by L{_barSlideStreamParser}.
+
+        CAF slides are clean (have no C{transform} attributes) so C{svgfix}
+        is not necessary to load them. In such case C{fixDrawing} only
+        requires definitions of paths being children of C{g} elements to be
+        redefined with absolute coordinates, which is done without C{svgfix}.
+
+        @param svgDocument: SVG slide (filename or file handler)
+        @type svgDocument: str or file
+
+        @param fixDrawing: indicates if path definitions has to be redefined
+                           with absolute coordinates
+        @type fixDrawing: bool
+
+        @rtype: cls
+        @return: created object or None if C{fixDrawing} is requested and
+                 the slide contains transformations
+        """
+        stream = _barSlideStreamParser().parse(svgDocument)
+        if fixDrawing and stream.transformed:
+            return None
+
+        slide = cls()
+
+        for attributes in stream.metadata:
+            try:
+                metadata = cls._clsMetadataElement.fromAttributes(attributes)
+                slide._setMetadata(metadata)
+            except:
+                pass
+        cls._fromXML_LoadConfiguration(slide)
+
+        for (attributes, isGroupChild) in stream.paths:
+            newPath = cls._clsPath.fromAttributes(attributes)
+            if fixDrawing and isGroupChild:
+                try:
+                    newPath.pathArrays = parsePathArrays(newPath.pathDef)
+                except:
+                    pass
+            cls._fromXML_AddPath(slide, newPath)
+
+        for (attributes, labelCaption) in stream.labels:
+            try:
+                label = cls._clsStructureLabel.fromAttributes(attributes,
+                                                              labelCaption)
+                slide.addLabel(label)
+            except ValueError:
+                _printRed("Error while reading labels: %s %s\nSkipping." %\
+                        (attributes, labelCaption))
+
+        slide._setSlideTemplate(stream.getTemplate())
+        return slide
 
     @classmethod
     def _fromXML_LoadLabels(cls, slide, svgdom):
@@ -3615,7 +3958,7 @@ class barTracedSlide(barSlideRenderer):
         @type M: numpy 3x3 array
         """
         barVectorSlide.affineTransform(self, M)
-        map(lambda x: x.affineTransform(M),  self.paths)
+        self._clsPath.affineTransformPaths(self.paths, M)
 
     def findDuplicatedRegions(self, Options = None, Apply = True):
         """
@@ -3792,22 +4135,42 @@ class barTracedSlideRenderer(barTracedSlide):
     """
     L{barTracedSlide} class extension with method necessary to render CAF slide.
     """
-    def __generateLabelLocation(self, path):
+    def __generateLabelLocations(self, paths):
         """
-        Generate best label localtion for given path representation. The optimal
-        position of the label is determined using maximum value of distance
-        transform.
+        Generate best label localtions for given path representations. The
+        optimal position of the label is determined using maximum value of
+        distance transform.
 
-        @type  path: L{barPath}
-        @param path: path for which best label location is determined
+        Paths are not rendered: polygons approximating all paths are
+        rasterised at once within bounding boxes of the paths (see
+        L{getPolygonsLabelLocations}). Labels of degenerate paths (without
+        any area) are placed in the centre of their bounding boxes.
 
-        @rtype: (float, float)
-        @return: optimal coordinates (x, y) of the label in SVG coords
+        @type  paths: [L{barPath}, ...]
+        @param paths: paths for which best label locations are determined
+
+        @rtype: [(float, float), ...]
+        @return: optimal coordinates (x, y) of the labels in SVG coords
         """
-        slideRendering = self.renderPath(path)
-        (x,y) = getBestLabelLocation(slideRendering)
-        (x,y) = self._toSVGCoordinates((x,y))
-        return (x, y)
+        # Just create few aliases
+        imSize    = self._rendererConf['imageSize']
+        refWidth  = self._rendererConf['ReferenceWidth' ]
+        refHeight = self._rendererConf['ReferenceHeight']
+        scale = np.array([float(imSize[0]) / refWidth,\
+                          float(imSize[1]) / refHeight])
+
+        polygonsList = [[p * scale for p in flattenPathArrays(*path.pathArrays)]\
+                        for path in paths]
+
+        locations = []
+        for (path, location) in\
+                zip(paths, getPolygonsLabelLocations(polygonsList)):
+            if location == None:
+                (x1, y1, x2, y2) = path.boundingBox
+                locations.append(((x1 + x2) / 2., (y1 + y2) / 2.))
+            else:
+                locations.append(self._toSVGCoordinates(location))
+        return locations
 
     def getSlideMassCenter(self):
         """
@@ -3856,16 +4219,17 @@ class barTracedSlideRenderer(barTracedSlide):
         pathIndex = self.pathIndex
         print pathIndex
 
+        # Skip processing labels if requested
+        paths = filter(lambda x: x.structName not in skipLabels,\
+                       pathIndex.values())
+
         # Iterate over all paths and generating new regular label for each
         # path
-        #for (pathNo, pathID) in enumerate(pathIndex.keys()):
-        for path in pathIndex.values():
+        for (path, newLabelCoords) in\
+                zip(paths, self.__generateLabelLocations(paths)):
             newLabelID      = path.relLabelID
             newLabelCaption = path.structName
             print newLabelID,newLabelCaption
-            # Skip processing this label if requested
-            if newLabelCaption in skipLabels: continue
-            newLabelCoords = self.__generateLabelLocation(path)
             print newLabelCoords
             # Generate new label and append it into the slide
             newLabel = self._clsRegularLabel(newLabelCoords, newLabelCaption, newLabelID)
@@ -4017,6 +4381,22 @@ class barPretracedSlideRenderer(barPretracedSlide):
     @ivar __imageCache: images representing slide; consecutive elements have
                         thicker contours due to gap filling algorithm
 
+    @type __floodFillEngines: [L{floodFillEngine}, ...]
+    @ivar __floodFillEngines: flood fill engines of consecutive elements of
+                              L{__imageCache}; removed after tracing
+
+    @type __contourErosion: L{greyErosionEngine}
+    @ivar __contourErosion: erosion engine of the first element of
+                            L{__imageCache}; consecutive elements of the cache
+                            as well as regions extended after flooding are
+                            its erosions; removed after tracing
+
+    @type __coveredAreas: {str : [int, ...], ...}
+    @ivar __coveredAreas: label ID to areas of floodfills (from the label) of
+                          consecutive elements of L{__imageCache} mapping for
+                          labels with automatically selected grow level;
+                          removed after tracing
+
     @type __brainOutline: PIL.Image.Image
     @ivar __brainOutline: whole brain outline; image is generated in moment
                           of provedding vBrain labels; during tracing consecutive
@@ -4072,6 +4452,7 @@ class barPretracedSlideRenderer(barPretracedSlide):
         self.__imageCache = []
         self.__loadImage()
         self.__createCache()
+        self.__floodFillEngines = map(floodFillEngine, self.__imageCache)
 
         # Create empty traced slide
         retSlide = barTracedSlideRenderer(
@@ -4100,6 +4481,10 @@ class barPretracedSlideRenderer(barPretracedSlide):
         map(lambda x: self.__labelCache.__setitem__(x.ID, x), labelsRejected)
         map(retSlide.addLabel, labelsRejected)
 
+        # Areas covered by floodfills are computed for all labels at once
+        self.__coveredAreas = self.__getCoveredAreasTable(\
+                [label for label in self.__labelsLeft if label.growlevel == -1])
+
         # Processing correctly placed regular labels - main part of the script.
         if __debug__: _printRed("Processing labels...")
         map(retSlide.addPath, self.__processLabels())
@@ -4160,16 +4545,29 @@ class barPretracedSlideRenderer(barPretracedSlide):
         """
         Create image cache (C{self.L{__imageCache}}). First cached image is
         an original image. All other images (up to cacheLevel) are images with
-        succesive grows (applications of MinFilter).
+        succesive grows (applications of MinFilter). All grows are obtained
+        from a single distance transform of the original image
+        (C{self.L{__contourErosion}}).
         """
         # Just aliases:
-        intensity  = self._tracingConf['MinFiterTimesApplication']
         cacheLevel = self._tracingConf['CacheLevel']
+        mode       = self.__imageCache[0].mode
 
-        filter = ImageFilter.MinFilter(intensity)
-        for l in range(cacheLevel):
-            self.__imageCache.append(\
-                    self.__imageCache[-1].filter(filter))
+        self.__contourErosion = greyErosionEngine(self.__imageCache[0])
+        for l in range(1, cacheLevel + 1):
+            self.__imageCache.append(Image.fromarray(\
+                    self.__contourErosion.erode(self.__getGrowRadius(l)), mode))
+
+    def __getGrowRadius(self, growLevel):
+        """
+        @type  growLevel: int
+        @param growLevel: index of image in C{self.L{__imageCache}}
+
+        @rtype: int
+        @return: total radius of MinFilter applications resulting in the image
+                 of given grow level
+        """
+        return growLevel * (self._tracingConf['MinFiterTimesApplication'] // 2)
 
     def __processVbrain(self):
         """
@@ -4223,15 +4621,99 @@ class barPretracedSlideRenderer(barPretracedSlide):
         @rtype: [L{barPath}, ...]
         @return: paths created by tracing individual labels
         """
+        tracingProcesses = self._tracingConf.get('TracingProcesses', 1)
+
+        # Daemonic processes (e.g. workers of parsers processing slides in
+        # parallel) are not allowed to create a pool of worker processes.
+        if tracingProcesses != 1 and\
+           not multiprocessing.current_process().daemon:
+            return self.__processLabelsInParallel(tracingProcesses)
+
         paths = []
         noLabels = len(self.__labelsLeft)
         for i, seedLabel in enumerate(self.__labelsLeft):
-            print >>sys.stderr, "\nProcessing label %d of %d" % (i, noLabels)
-            print >>sys.stderr, "\tStructure: %s, Id: %s" % (seedLabel.Caption, seedLabel.ID)
-            print >>sys.stderr, "\tLocation: %3.1f,%3.1f" % seedLabel.Location
+            self.__printLabelInfo(i, noLabels, seedLabel)
             paths.append(self.__processSingleLabel(seedLabel))
         return flatten(paths)
 
+    def __processLabelsInParallel(self, processes):
+        """
+        Parallel version of L{__processLabels}.
+
+        At first images of all labels are created and substracted from the
+        brain outline (in the label order, consumed lazily). Then the images
+        are traced by a pool of potrace processes (see L{performTracingBatch})
+        and the tracing results are cleaned by a pool of worker processes (see
+        L{_cleanPotraceOutputToXML}). Finally paths are created in the label
+        order.
+
+        Resulting paths are the same as the ones created by L{__processLabels}
+        as floodfilling does not depend on tracing of other labels.
+
+        @type  processes: int
+        @param processes: number of worker processes; number of CPUs if
+                          C{None}
+
+        @rtype: [L{barPath}, ...]
+        @return: paths created by tracing individual labels
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        tracedLabels = []
+        noLabels = len(self.__labelsLeft)
+
+        def getImagesToTrace():
+            for i, seedLabel in enumerate(self.__labelsLeft):
+                self.__printLabelInfo(i, noLabels, seedLabel)
+                imageToTrace = self.__getImageToTrace(seedLabel)
+                if not imageToTrace:
+                    continue
+
+                self.__substractFromBrainOutline(imageToTrace)
+                if __debug__ and self._tracingConf['DumpEachStepPNG']:
+                    self.__dumpImageToTrace(imageToTrace, seedLabel)
+
+                tracedLabels.append(seedLabel)
+                yield imageToTrace
+
+        tracingProperties = dict(self._tracingConf['PoTraceConf'])
+        tracingProperties['potrace_processes'] = processes
+        tracerOutputs = performTracingBatch(getImagesToTrace(), tracingProperties)
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            cleanedOutputs = pool.map(_cleanPotraceOutputToXML, tracerOutputs)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        paths = map(lambda seedLabel, cleanedOutput:\
+                        self.__svgToPaths(dom.parseString(cleanedOutput),\
+                                          seedLabel, clearPathDef = False),\
+                    tracedLabels, cleanedOutputs)
+        return flatten(paths)
+
+    def __printLabelInfo(self, i, noLabels, seedLabel):
+        """
+        Print information about the label being processed.
+
+        @type  i: int
+        @param i: index of the label
+
+        @type  noLabels: int
+        @param noLabels: number of labels to process
+
+        @type  seedLabel: L{barRegularLabel}
+        @param seedLabel: seed label
+        """
+        print >>sys.stderr, "\nProcessing label %d of %d" % (i, noLabels)
+        print >>sys.stderr, "\tStructure: %s, Id: %s" % (seedLabel.Caption, seedLabel.ID)
+        print >>sys.stderr, "\tLocation: %3.1f,%3.1f" % seedLabel.Location
+
     def __getUnlabeled(self):
         """
         Create list of paths and corresponding labels by tracing areas that
@@ -4241,15 +4723,15 @@ class barPretracedSlideRenderer(barPretracedSlide):
             1. We look for patches of N or more pixels. Only such areas
                are considered as unlabelled areas. Smaller areas are most
                probably residual white pixels and should be ommited.
-            2. Every group of two or more adjacent white pixels is flooded
-               on "1".
+            2. All patches of white pixels are found at once (see
+               L{__getUnlabeledAreas}).
             3. Patch of N or more white pixels is flooded with value "2"
                after tracing.
 
-        After fiding unlabelled areas we can find 4 values of pixels:
+        After fiding unlabelled areas we can find 3 values of pixels:
 
             1. "0": areas outside brain
-            2. "1": pixels of more than one adjacent pixels but less than N
+            2. "255": patches of less than N white pixels
             3. "2": patches of N or more white pixels
 
         @rtype: ([L{barPath}, ...], [L{barRegularLabel}, ...])
@@ -4262,56 +4744,36 @@ class barPretracedSlideRenderer(barPretracedSlide):
 
         unlabeledAreasLabelsList= []   # Here we hold all newly generated labels
         unlabeledPathList       = []   # and here all newly generated labels
-        whiteCoordList=[]              # List of coordinates white pixels. Coordinates
-                                       # are corrected in on order to avoid analyzing
-                                       # the same coordinates twice.
-
-        #coords = self.__getUnlabeledAreas()# Get initial white pixel coordinate and start loop
-
-        #while coords and (coords not in whiteCoordList):
-        unlabelledTreshold = self._tracingConf['UnlabelledTreshold']
-        for coords in self.__getUnlabeledAreas():
-
-            # Flood image at give coordinates. "1" index is used, not "0". Also get number
-            # number of flooded pixels.
-            numberOfFloodedPixels = floodFillScanlineStack(self.__brainOutline, coords, 1)
-
-            whiteCoordList.append(coords) # Append coordinates to list in order
-                                          # to avoid duplication
-
-            # When more than N pixels is flooded we should consider this area as
-            # an actual unlabelled area (not some residual single white pixels)
-            # and we should start tracing procedure.
-            if numberOfFloodedPixels > unlabelledTreshold:
-
-                # Replace colors to get image suitable for tracing:
-                # all colors are converted to white. Values "1" are converted to "0"
-                # so the structure is black and surroundings are white
-                ImageForTracing = self.__brainOutline.point([255]+[0]+254*[255])
-                newLabelLocation = getBestLabelLocation(ImageForTracing)
-
-                newLabel = self._clsRegularLabel(\
-                            self._toSVGCoordinates(newLabelLocation),\
-                            'Unlabelled',\
-                            'Unlabelled-%d-%d' % coords,\
-                            growlevel = 0)
-                unlabeledAreasLabelsList.append(newLabel)
-
-                # Apply minimum filter to slightly increase size of trace structures.
-                #ImageForTracing = ImageForTracing.filter(ImageFilter.MaxFilter(3))
-                map(unlabeledPathList.append, self.__bitmapToPaths(ImageForTracing, newLabel))
-                if __debug__ and self._tracingConf['DumpEachStepPNG']:
-                    self.__brainOutline.save("%d_detected_ublabelled_%d_%d.png"%\
-                            (self.slideNumber, coords[0], coords[1]), "PNG")
 
-            # Finally, do some trick: replace all pixels with value "1" to "2",
-            # which prevents from accumulating consecutive areas.
+        for (coords, mask) in self.__getUnlabeledAreas():
             print "Unlabelled area found at location %d, %d (img.)" % coords
             print "\tcreating Unlabelled label\n"
-            numberOfFloodedPixels = floodFillScanlineStack(self.__brainOutline, coords, 2)
 
-            # Get new coordinates and cotinue loop
-            #coords = self.__getUnlabeledAreas()
+            # Create image suitable for tracing: the structure is black and
+            # surroundings are white
+            ImageForTracing = np.empty(mask.shape, dtype=np.uint8)
+            ImageForTracing.fill(255)
+            ImageForTracing[mask] = 0
+            ImageForTracing = Image.fromarray(ImageForTracing, 'L')
+            newLabelLocation = getBestLabelLocation(ImageForTracing)
+
+            newLabel = self._clsRegularLabel(\
+                        self._toSVGCoordinates(newLabelLocation),\
+                        'Unlabelled',\
+                        'Unlabelled-%d-%d' % coords,\
+                        growlevel = 0)
+            unlabeledAreasLabelsList.append(newLabel)
+
+            # Apply minimum filter to slightly increase size of trace structures.
+            #ImageForTracing = ImageForTracing.filter(ImageFilter.MaxFilter(3))
+            map(unlabeledPathList.append, self.__bitmapToPaths(ImageForTracing, newLabel))
+
+            # Mark the patch as traced
+            self.__brainOutline.paste(2,\
+                    mask = Image.fromarray(mask.astype(np.uint8) * 255, 'L'))
+            if __debug__ and self._tracingConf['DumpEachStepPNG']:
+                self.__brainOutline.save("%d_detected_ublabelled_%d_%d.png"%\
+                        (self.slideNumber, coords[0], coords[1]), "PNG")
 
         # Dump image after tracing unlabelled areas to show what we have done! :)
         if __debug__ and self._tracingConf['DumpEachStepPNG']:
@@ -4329,6 +4791,9 @@ class barPretracedSlideRenderer(barPretracedSlide):
         del self.__labelsLeft
         del self.__vBrainLabels
         del self.__imageCache
+        del self.__floodFillEngines
+        del self.__contourErosion
+        del self.__coveredAreas
         del self.__brainOutline
         del self.__labelsToPassComment
         del self.__labelsToPassSpot
@@ -4348,6 +4813,29 @@ class barPretracedSlideRenderer(barPretracedSlide):
         @rtype: [L{barPath}, ...]
         @return: list of paths resulting from tracing of the given source image
                  and provided L{seed label<seedLabel>}.
+        """
+        imageToTrace = self.__getImageToTrace(seedLabel)
+        if not imageToTrace:
+            return
+
+        # Substract traced structure from brain outline to mark that given area
+        # is already traced.
+        self.__substractFromBrainOutline(imageToTrace)
+        return self.__bitmapToPaths(imageToTrace, seedLabel)
+
+    def __getImageToTrace(self, seedLabel):
+        """
+        Flood the image with the given seed label.
+
+        If grow level for given seed label is not provided, perform automatic
+        grow level selection.
+
+        @type  seedLabel: L{barRegularLabel}
+        @param seedLabel: seed label
+
+        @rtype: PIL.Image.Image
+        @return: image of the structure to be traced or C{None} if the image
+                 cannot be created
 
         @note: Function for determinating best grow level may be changed by
                assigning to C{self._tracingConf['BestFillAlgorithm']} reference
@@ -4357,14 +4845,14 @@ class barPretracedSlideRenderer(barPretracedSlide):
         # If growlevel is unassigned, select best growlevel automatically:
         if seedLabel.growlevel == -1:
             # Get area covered by each fill then choose best growlevel
-            imgs, area    = self.__getCoveredAreasList(seedLabel)
-            # Detect 'None' images and do not include them in automatic grow
-            # level selection:
-            if area.count(None)>0: area = area[0:area.index(None)]
+            area = self.__getCoveredAreasList(seedLabel)
 
             # Determine BestGrowLevel using provied BestFillAlgorithm
+            # and flood only the image of the selected level
             BestGrowLevel = selectBestGapFillingLevel(area)
-            imageToTrace  = imgs[BestGrowLevel]
+            imageToTrace  = self.__applyFill(\
+                              self.__imageCache[BestGrowLevel],\
+                              seedLabel)
             seedLabel.growlevel = BestGrowLevel
             print >>sys.stderr, "\tAssigned growlevel %d" % (BestGrowLevel,)
 
@@ -4380,7 +4868,7 @@ class barPretracedSlideRenderer(barPretracedSlide):
             if not imageToTrace:
                 #TODO: Provide error handling here
                 print seedLabel
-                return
+                return None
 
             print >>sys.stderr, "\tUsing growlevel %d" % (seedLabel.growlevel,)
 
@@ -4389,11 +4877,9 @@ class barPretracedSlideRenderer(barPretracedSlide):
         else:
             print >>sys.stderr, "Growlevel %d out of allowed range - \
                                 skipping" % (seedLabel.growlevel,)
+            return None
 
-        # Substract traced structure from brain outline to mark that given area
-        # is already traced.
-        self.__substractFromBrainOutline(imageToTrace)
-        return self.__bitmapToPaths(imageToTrace, seedLabel)
+        return imageToTrace
 
     def __bitmapToPaths(self, sourceImage, seedLabel, invert = False):
         """
@@ -4426,26 +4912,58 @@ class barPretracedSlideRenderer(barPretracedSlide):
                            self._tracingConf['PoTraceConf'])
         svgdom = cleanPotraceOutput(tracerOutput)
 
+        # If debuging procedures are enabled save source image (PNG file)
+        if __debug__ and self._tracingConf['DumpEachStepPNG']:
+            self.__dumpImageToTrace(sourceImage, seedLabel)
+
+        return self.__svgToPaths(svgdom, seedLabel)
+
+    def __svgToPaths(self, svgdom, seedLabel, clearPathDef = True):
+        """
+        Convert cleaned tracing results into list of paths.
+
+        @type  svgdom: xml.dom.minidom.Document
+        @param svgdom: SVG document created by L{cleanPotraceOutput}
+
+        @type  seedLabel: L{barRegularLabel}
+        @param seedLabel: seed label
+
+        @type  clearPathDef: bool
+        @param clearPathDef: indicates if definitions of paths have to be
+                             simplified (see L{barPath.simplifyPathDef})
+
+        @rtype: [L{barPath}, ...]
+        @return: paths resulting from tracing of the provided
+                 L{seed label<seedLabel>}.
+        """
         # Convert resulting svg document into set of barPaths
         newPathList = map(lambda x:\
-                self._getPath(x, seedLabel),\
+                self._getPath(x, seedLabel, clearPathDef),\
                 svgdom.getElementsByTagName('path'))
 
-        # If debuging procedures are enabled save tracing results (SVG file) and
-        # source image (PNG file)
+        # If debuging procedures are enabled save tracing results (SVG file)
         if __debug__ and self._tracingConf['DumpEachStepSVG']:
             OutputFilename = "%d_%s_%s.svg" % (self.slideNumber,\
                     seedLabel.ID, seedLabel.Caption)
             self._saveSVG(svgdom, OutputFilename)
 
-        if __debug__ and self._tracingConf['DumpEachStepPNG']:
-            OutputFilename = "%d_%s_%s.png" % (self.slideNumber,\
-                    seedLabel.ID, seedLabel.Caption)
-            self._saveBitmap(sourceImage, OutputFilename)
-
         return newPathList
 
-    def _getPath(self, pathElem, seedLabel):
+    def __dumpImageToTrace(self, sourceImage, seedLabel):
+        """
+        Save image traced for the given seed label as PNG file.
+
+        @type  sourceImage: PIL.Image.Image
+        @param sourceImage: image for tracing
+
+        @type  seedLabel: L{barRegularLabel}
+        @param seedLabel: seed label
+        """
+        OutputFilename = "%d_%s_%s.png" % (self.slideNumber,\
+                seedLabel.ID, seedLabel.Caption)
+        self._saveBitmap(sourceImage, OutputFilename)
+
+    def _getPath(self, pathElem, seedLabel, clearPathDef = True):
         """
         Create L{barPath} from provided SVG path element (result of tracing)
         and seed label. Resulting path has proper identifier and structure name,
@@ -4457,6 +4975,12 @@ class barPretracedSlideRenderer(barPretracedSlide):
         @param seedLabel: L{barRegularLabel}
         @type  seedLabel: seed label
 
+        @type  clearPathDef: bool
+        @param clearPathDef: indicates if the path definition has to be
+                             simplified (see L{barPath.simplifyPathDef});
+                             already simplified definition is validated
+                             anyway
+
         @rtype: L{barPath}
         @return: path representation created from provided SVG path element
         """
@@ -4465,7 +4989,13 @@ class barPretracedSlideRenderer(barPretracedSlide):
         pathElem.setAttribute('fill','#000000')
 
         # Create new path element
-        newPath = self._clsPath.fromXML(pathElem, clearPathDef = True)
+        newPath = self._clsPath.fromXML(pathElem, clearPathDef = clearPathDef)
+
+        # Definitions simplified by L{_cleanPotraceOutputToXML} have to be
+        # validated the same way as in L{barPath._setPathDefinition}
+        if not clearPathDef and\
+           not newPath._validatePath(newPath.pathDef, newPath.pathArrays[0]):
+            raise ValueError, "Invalid path definition provided"
         newPath.id = self._getNewPathID(seedLabel)
         newPath.structName = seedLabel.Caption
 
@@ -4525,6 +5055,8 @@ class barPretracedSlideRenderer(barPretracedSlide):
             2. Rescale SVG coordinates to rendered image coordinates
             3. Fill given image with black color
             4. Extend filled region by applying C{MinFilter} filter. Do it C{l+1} times
+               (for images from C{self.L{__imageCache}} it is done with
+               a single thresholding of distances).
             5. Return flooded image or return number of black pixels depending
                on C{retNPIX} value.
 
@@ -4548,10 +5080,6 @@ class barPretracedSlideRenderer(barPretracedSlide):
         if not self.__isAllowedForFilling(sourceImage, seedLabel):
             return None
 
-        # Copy input image in order to preserve original
-        ImToFlood=sourceImage.copy()
-        npix = floodFillScanlineStack(ImToFlood, coords, 0)
-
         # Extend flooded area in order to preserve initial structure area
         # Index of image C{im} in L{ImageCache<ImageCache>} list.
         # Used in extending grow region - MIN filter is applied to flooded
@@ -4559,12 +5087,56 @@ class barPretracedSlideRenderer(barPretracedSlide):
         # in order to preserve area of the original structure (as initial edge
         # growing reduces it).
         # Factor 1 is arbitraty.
-        for j in range(seedLabel.growlevel + 1):
-            ImToFlood = ImToFlood.filter(ImageFilter.MinFilter(3))
+        growLevel = self.__getCacheLevel(sourceImage)
+        mask, npix = self.__getFloodFillEngine(sourceImage).getMask(coords)
+
+        if growLevel is not None:
+            # Flooding and extending at once: the flooded image is an erosion
+            # of the original image
+            ImToFlood = self.__contourErosion.erode(\
+                    self.__getGrowRadius(growLevel) + seedLabel.growlevel + 1,\
+                    mask, seedLabel.growlevel + 1, 0)
+            ImToFlood = Image.fromarray(ImToFlood, sourceImage.mode)
+
+        else:
+            # Flood a copy of the input image in order to preserve original
+            ImToFlood = np.array(sourceImage)
+            ImToFlood[mask] = 0
+            ImToFlood = Image.fromarray(ImToFlood, sourceImage.mode)
+            for j in range(seedLabel.growlevel + 1):
+                ImToFlood = ImToFlood.filter(ImageFilter.MinFilter(3))
 
         if retNPIX: return (ImToFlood, npix)
         else: return ImToFlood
 
+    def __getFloodFillEngine(self, sourceImage):
+        """
+        @type  sourceImage: PIL.Image.Image
+        @param sourceImage: image to be floodfilled
+
+        @rtype: L{floodFillEngine}
+        @return: flood fill engine of the image; engines of images from
+                 C{self.L{__imageCache}} are reused
+        """
+        growLevel = self.__getCacheLevel(sourceImage)
+        if growLevel is not None:
+            return self.__floodFillEngines[growLevel]
+        return floodFillEngine(sourceImage)
+
+    def __getCacheLevel(self, sourceImage):
+        """
+        @type  sourceImage: PIL.Image.Image
+        @param sourceImage: image to be floodfilled
+
+        @rtype: int or None
+        @return: index of the image in C{self.L{__imageCache}} or C{None} if
+                 the image is not cached
+        """
+        for (growLevel, image) in enumerate(self.__imageCache):
+            if image is sourceImage:
+                return growLevel
+        return None
+
     def __isAllowedForFilling(self, im, seedLabel):
         """
         Determine if bitmap with given seed label is suitable for tracing.
@@ -4595,44 +5167,21 @@ class barPretracedSlideRenderer(barPretracedSlide):
 
     def __getUnlabeledAreas(self):
         """
-        Find white pixels in the image. If found pixel has white neighbourhood,
-        its coordinates are returned, otherwise iteration continues
-        until all white pixels are spotted.
+        Find patches of white pixels in C{self.L{__brainOutline}} large enough
+        to be considered as unlabelled areas (more than
+        C{self.L{_tracingConf}['UnlabelledTreshold']} pixels). All patches are
+        found in a single connected components labelling.
 
-        Current algorithm is rather ineffective. Main reason is that function
-        has to exit if patch of white pixels is spotted. Then function is
-        invoked again and iteration starts from beginning which is extremely
-        ineffective. What should be done in such case?  Perhaps implementation
-        should include iterator. The problem is that we need to change array
-        while we iterate over this array.
+        Only patches with at least one white pixel with white neighbourhood are
+        considered.
 
-        @rtype: (int, int)
-        @return: (x, y) image coordinates of first spotted pixel that belongs
-                 to patch (two or more adjecent pixeles) of white pixels;
-                 if there is no such pixel, C{None}
-        """
-        # Access image pixel by pixel
-        pix = self.__brainOutline.load()
-
-        # Holds current pixel number
-        pn=0
-
-        # Iterate over all image
-        for i in self.__brainOutline.getdata():
-            pn+=1
-            # If white pixel is spotted, check if it belongs to group of adjacent white pixels.
-            # If it belongs, return coordinates of the pixel. If not, continue iteration.
-            if i==255:
-                x = pn % self.__brainOutline.size[0]-1
-                y = pn //self.__brainOutline.size[0]
-                #print "White pixel found at coords %d,%d" % (x,y)#,\
-                #self.__brainOutline.size, pn
-                if pix[x-1,y]==255 and pix[x+1,y]==255 and pix[x,y+1]==255 and pix[x,y-1]==255:
-                    #self.__brainOutline.save("%d_%d.png"% (y,x), "PNG")
-                    #return (x,y)
-                    print (x,y)
-                    yield (x,y)
-        #return None
+        @rtype: [((int, int), numpy.ndarray), ...]
+        @return: (x, y) image coordinates of the first spotted pixel (with
+                 white neighbourhood) and boolean mask of every unlabelled area
+        """
+        return [(coords, mask) for (coords, mask, area)\
+                in getPatches(self.__brainOutline, 255,\
+                              self._tracingConf['UnlabelledTreshold'])]
     #}
 
     #{ Auxiliary functions
@@ -4714,28 +5263,57 @@ class barPretracedSlideRenderer(barPretracedSlide):
         svgdom.writexml(f, indent="\n", addindent="\n", newl="\n")
         f.close()
 
+    def __getCoveredAreasTable(self, seedLabels):
+        """
+        For images from C{self.L{__imageCache}} calculate areas of floodfills
+        for all given seed labels at once. Only a single labelling of every
+        image is performed.
+
+        @type  seedLabels: [L{barRegularLabel}, ...]
+        @param seedLabels: seed labels
+
+        @rtype: {str : [int, ...], ...}
+        @return: label ID to areas of floodfills (in pixels) of consecutive
+                 images of C{self.L{__imageCache}} mapping
+        """
+        # Seeds placed outside the image are skipped
+        width, height = self.__imageCache[0].size
+        seedLabels = filter(lambda x: 0 <= x[1][0] < width and\
+                                      0 <= x[1][1] < height,
+                            map(lambda x: (x, self._toImageCoordinates(x.Location)),
+                                seedLabels))
+        coords = map(lambda x: x[1], seedLabels)
+        areas  = map(lambda x: x.getAreas(coords), self.__floodFillEngines)
+
+        return dict((seedLabel.ID, [levelAreas[i] for levelAreas in areas])\
+                    for (i, (seedLabel, xy)) in enumerate(seedLabels))
+
     def __getCoveredAreasList(self, seedLabel):
         """
-        For images from C{self.L{__imageCache}} perform floodfilling with
+        For images from C{self.L{__imageCache}} get area of floodfilling with
         seed label.
 
         @type  seedLabel: L{barRegularLabel}
         @param seedLabel: seed label
 
-        @rtype: ([PIL.Image.Image, ...], [int, ...])
-        @return: pair of lists of floodfilled images and area of floodfill
-                 in pixels (both lists have the same length and are
-                 corresponding to some prefix of C{self.L{__imageCache}})
+        @rtype: [int, ...]
+        @return: list of areas of floodfill in pixels (corresponding to some
+                 prefix of C{self.L{__imageCache}} - the list ends before
+                 the first image which cannot be floodfilled)
         """
-        # List of calculated areas
-        result=[]
-
         # Save information about areas covered in each grow step
         # This data is usefull when it comes to define some heuristics about
         # number of grows that gives best recoinstruction accuracy.
-        result = map(lambda x:\
-                self.__applyFill(x, seedLabel, retNPIX = True),\
-                self.__imageCache)
+        result = map(lambda x: self.__isAllowedForFilling(x, seedLabel),\
+                     self.__imageCache)
+        if any(result):
+            if seedLabel.ID not in self.__coveredAreas:
+                self.__coveredAreas.update(\
+                        self.__getCoveredAreasTable([seedLabel]))
+            areas  = self.__coveredAreas[seedLabel.ID]
+            result = map(lambda x, y: x if y else None, areas, result)
+        else:
+            result = [None] * len(result)
 
         # Dump rebug information if required
         if __debug__: print\
@@ -4749,9 +5327,7 @@ class barPretracedSlideRenderer(barPretracedSlide):
             print result.index(None)
             result = result[0:result.index(None)]
 
-        #TODO: refactoring with unzip...
-        images, areas = map(lambda x: x[0], result), map(lambda x: x[1], result)
-        return (images, areas)
+        return result
 
     def __dumpWrongSeed(self, im, seedLabel):
         """
@@ -4908,6 +5484,24 @@ def cleanPotraceOutput(tracerOutput):
     svgfix.fixSvgImage(svgdom, pagenumber=None, fixHeader=False)
     return svgdom
 
+def _cleanPotraceOutputToXML(tracerOutput):
+    """
+    Clean PoTrace output (see L{cleanPotraceOutput}) and simplify definitions
+    of its paths (see L{barPath.simplifyPathDef}). Used by worker processes of
+    L{barPretracedSlideRenderer}.
+
+    @type  tracerOutput: str
+    @param tracerOutput: string produced by PoTrace
+
+    @rtype: str
+    @return: XML representation of the fixed SVG document
+    """
+    svgdom = cleanPotraceOutput(tracerOutput)
+    for pathElem in svgdom.getElementsByTagName('path'):
+        pathElem.setAttribute('d',\
+                barPath.simplifyPathDef(pathElem.getAttribute('d')))
+    return svgdom.toxml()
+
 def CleanFilename(filename):
     """
     Strip filename from prohibited characters.
@@ -4981,3 +5575,173 @@ def _recurseTextNodeExtract(tspanElement):
         retval += strip(_recurseTextNodeExtract(t))
     return retval
 
+class _barSlideStreamParser(object):
+    """
+    Streaming (expat based) parser of CAF slides. Instead of building the DOM
+    of the whole slide it collects attributes of metadata, path and label
+    elements and serialises all the remaining elements as the slide template
+    (the same content as the DOM left by
+    L{barVectorSlide._fromXML_Cleanup}).
+
+    @cvar _skippedElements: names of elements excluded (together with their
+                            content) from the slide template
+    @type _skippedElements: [str, ...]
+
+    @ivar metadata: attributes of children elements of the first
+                    L{BAR_DATA_LOCATION_ELEMENT} element
+    @type metadata: [{str : str, ...}, ...]
+
+    @ivar paths: attributes of all C{path} elements and flags indicating if
+                 the parent of the path is a C{g} element
+    @type paths: [({str : str, ...}, bool), ...]
+
+    @ivar labels: attributes and merged text of all C{text} elements
+    @type labels: [({str : str, ...}, str), ...]
+
+    @ivar transformed: indicates if any element of the slide has
+                       a C{transform} attribute
+    @type transformed: bool
+    """
+    _skippedElements = ['text', 'path', 'bar:data', 'image']
+
+    def __init__(self):
+        self.metadata = []
+        self.paths = []
+        self.labels = []
+        self.transformed = False
+
+        self._template = ['<?xml version="1.0" ?>']
+        self._path = []
+        self._skipDepth = 0
+        self._metadataDepth = None
+        self._metadataDone = False
+        self._svgFound = False
+        self._openLabels = []
+        self._text = []
+        self._cdata = None
+
+    def parse(self, svgDocument):
+        """
+        Parse the slide.
+
+        @param svgDocument: SVG slide (filename or file handler)
+        @type svgDocument: str or file
+
+        @return: self
+        @rtype: L{_barSlideStreamParser}
+        """
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = self._startElement
+        parser.EndElementHandler = self._endElement
+        parser.CharacterDataHandler = self._characterData
+        parser.CommentHandler = self._comment
+        parser.StartCdataSectionHandler = self._startCdata
+        parser.EndCdataSectionHandler = self._endCdata
+
+        if isinstance(svgDocument, basestring):
+            svgFile = open(svgDocument, 'rb')
+            try:
+                parser.ParseFile(svgFile)
+            finally:
+                svgFile.close()
+        else:
+            parser.ParseFile(svgDocument)
+        return self
+
+    def getTemplate(self):
+        """
+        @return: serialised slide template
+        @rtype: str
+        """
+        return ''.join(self._template)
+
+    def _flushText(self):
+        """
+        Dispatch the text collected since the last markup: the text is
+        stripped (as in L{_removeWhitespacesXML}) and appended to the captions
+        of all open labels and to the template.
+        """
+        if not self._text:
+            return
+        text = strip(''.join(self._text))
+        self._text = []
+        if not text:
+            return
+
+        for caption in self._openLabels:
+            caption[1].append(text)
+        if not self._skipDepth:
+            self._template.append(escape(text))
+
+    def _startElement(self, name, attributes):
+        self._flushText()
+        depth = len(self._path)
+        self._path.append(name)
+
+        if attributes.has_key('transform'):
+            self.transformed = True
+
+        # Metadata are children of the first metadata location element
+        if self._metadataDepth == depth - 1:
+            self.metadata.append(attributes)
+        if name == BAR_DATA_LOCATION_ELEMENT and not self._metadataDone:
+            self._metadataDone = True
+            self._metadataDepth = depth
+
+        if name == 'path':
+            self.paths.append((attributes, depth > 0 and self._path[-2] == 'g'))
+        elif name == 'text':
+            self.labels.append(None)
+            self._openLabels.append((len(self.labels) - 1, [], attributes))
+
+        if self._skipDepth or name in self._skippedElements:
+            self._skipDepth += 1
+            return
+
+        if name == 'svg' and not self._svgFound:
+            # In case, when 3dBAR namespace is not defined, we declare it.
+            self._svgFound = True
+            attributes['xmlns:bar'] = BAR_XML_NAMESPACE
+
+        self._template.append('<' + name)
+        for (attribName, attribValue) in attributes.iteritems():
+            self._template.append(' %s=%s' % (attribName, quoteattr(attribValue)))
+        self._template.append('>')
+
+    def _endElement(self, name):
+        self._flushText()
+        self._path.pop()
+
+        if self._metadataDepth == len(self._path):
+            self._metadataDepth = None
+
+        if name == 'text':
+            (index, caption, attributes) = self._openLabels.pop()
+            self.labels[index] = (attributes, ''.join(caption))
+
+        if self._skipDepth:
+            self._skipDepth -= 1
+        else:
+            self._template.append('</%s>' % name)
+
+    def _characterData(self, data):
+        if self._cdata == None:
+            self._text.append(data)
+        else:
+            self._cdata.append(data)
+
+    def _comment(self, data):
+        self._flushText()
+        if not self._skipDepth:
+            self._template.append('<!--%s-->' % data)
+
+    def _startCdata(self):
+        self._flushText()
+        self._cdata = []
+
+    def _endCdata(self):
+        # CDATA sections are neither stripped nor included in labels captions
+        if not self._skipDepth:
+            self._template.append('<![CDATA[%s]]>' % ''.join(self._cdata))
+        self._cdata = None
+
@@ -26,7 +26,26 @@
 The module provides functions to handle basic image processing.
 
 G{importgraph}
+
+@type TRACING_BATCH_SIZE: int
+@var  TRACING_BATCH_SIZE: default number of masks traced by a single potrace
+                          process in L{performTracingBatch}
+
+@type POTRACE_DIMENSION_UNITS: {str : float, ...}
+@var  POTRACE_DIMENSION_UNITS: size of potrace dimension units in points;
+                               dimensions without unit are in inches
+
+@type TRACING_STATISTICS: {str : ?, ...}
+@var  TRACING_STATISTICS: counters of tracing performed by the module; see
+                          L{getTracingStatistics} for details
 """
+import os
+import re
+import time
+import shutil
+import tempfile
+import multiprocessing
+from fractions import gcd
 import numpy as np
 from PIL import Image,ImageOps,ImageDraw
 import cStringIO,  subprocess
@@ -34,6 +53,19 @@ from scipy.ndimage.morphology import distance_transform_edt as dtransform
 import scipy.ndimage as ndimage
 import colorsys
 
+TRACING_BATCH_SIZE = 64
+
+POTRACE_DIMENSION_UNITS = {'pt': 1.0,
+                           'in': 72.0,
+                           'cm': 72.0 / 2.54,
+                           'mm': 72.0 / 25.4,
+                           '': 72.0}
+
+TRACING_STATISTICS = {'masks': 0,
+                      'processes': 0,
+                      'spawnTime': 0.0,
+                      'encodingTime': 0.0}
+
 def tonpArray(PILImage):
     """
     @type  PILImage: PIL image instance
@@ -94,6 +126,274 @@ def getBestLabelLocation(ImageForTracing):
 
     return (x,y)
 
+def getColourLabels(image):
+    """
+    Assign consecutive integer label to every colour of provided image in
+    a single vectorised pass.
+
+    @type  image: PIL.Image.Image or numpy.ndarray
+    @param image: RGB or single channel image
+
+    @return: label of every pixel of the image and colour corresponding to
+             every label; colours are (r, g, b) tuples for RGB images and
+             integers for single channel images
+    @rtype: (numpy.ndarray, [(int, int, int) or int, ...])
+    """
+    image = np.asarray(image)
+
+    if image.ndim == 3:
+        channels = image.astype(np.uint32)
+        colourKeys = (channels[:,:,0] << 16) | (channels[:,:,1] << 8) |\
+                      channels[:,:,2]
+    else:
+        colourKeys = image
+
+    colours, labels = np.unique(colourKeys, return_inverse=True)
+    labels = labels.reshape(colourKeys.shape)
+
+    if image.ndim == 3:
+        colours = map(lambda x: (int(x) >> 16, (int(x) >> 8) & 255, int(x) & 255),
+                      colours)
+    else:
+        colours = colours.tolist()
+
+    return labels, colours
+
+def getLabelBoundingBoxes(labels, numberOfLabels):
+    """
+    Find bounding box of every label of the labelled image in a single pass.
+
+    @type  labels: numpy.ndarray
+    @param labels: labelled image (labels are consecutive integers starting
+                   from 0)
+
+    @type  numberOfLabels: int
+    @param numberOfLabels: number of labels in the image
+
+    @return: bounding box (a tuple of slices) of every label, C{None} for
+             labels not present in the image
+    @rtype: [(slice, slice) or None, ...]
+    """
+    return ndimage.find_objects(labels + 1, numberOfLabels)
+
+def getLabelMask(labels, label, boundingBox, cropBox = None):
+    """
+    Create black and white mask of given label of the labelled image. Pixels
+    of the label are black (0) while other pixels are white (255). Only the
+    bounding box of the label is compared with the label.
+
+    @type  labels: numpy.ndarray
+    @param labels: labelled image
+
+    @type  label: int
+    @param label: label to extract
+
+    @type  boundingBox: (slice, slice)
+    @param boundingBox: bounding box of the label
+
+    @type  cropBox: (int, int, int, int)
+    @param cropBox: (x1, y1, x2, y2) area of the labelled image covered by the
+                    mask; has to contain C{boundingBox}; whole image by
+                    default
+
+    @rtype: PIL.Image.Image
+    @return: mask of the label
+    """
+    if cropBox is None:
+        cropBox = (0, 0, labels.shape[1], labels.shape[0])
+    x1, y1, x2, y2 = cropBox
+
+    mask = np.empty((y2 - y1, x2 - x1), dtype=np.uint8)
+    mask.fill(255)
+
+    rows, cols = boundingBox
+    maskBox = (slice(rows.start - y1, rows.stop - y1),
+               slice(cols.start - x1, cols.stop - x1))
+    mask[maskBox][labels[boundingBox] == label] = 0
+    return Image.fromarray(mask, 'L')
+
+def getAlignedCropBox(boundingBox, size, targetSize, margin):
+    """
+    Find area of the image covering given bounding box enlarged by the margin
+    which corresponds to an integer area of the image rescaled to
+    C{targetSize}.
+
+    Thanks to such alignment, rescaling of the cropped area gives the same
+    pixels (up to the rounding of resampling coefficients) as cropping the
+    rescaled image, provided that the margin is not smaller than the support
+    of the resampling filter.
+
+    @type  boundingBox: (slice, slice)
+    @param boundingBox: (rows, columns) bounding box to cover
+
+    @type  size: (int, int)
+    @param size: (width, height) of the image
+
+    @type  targetSize: (int, int)
+    @param targetSize: (width, height) of the rescaled image
+
+    @type  margin: int
+    @param margin: margin (in image pixels) added to the bounding box
+
+    @return: (x1, y1, x2, y2) crop box in image pixels and corresponding crop
+             box in rescaled image pixels
+    @rtype: ((int, int, int, int), (int, int, int, int))
+    """
+    cropBox, targetBox = [], []
+
+    for (span, length, targetLength) in\
+            zip(boundingBox[::-1], size, targetSize):
+        step = length // gcd(length, targetLength)
+        start = max(0, span.start - margin) // step * step
+        stop = min(length, -(-(span.stop + margin) // step) * step)
+        cropBox.append((start, stop))
+        targetBox.append((start * targetLength // length,
+                          stop  * targetLength // length))
+
+    (x1, x2), (y1, y2) = cropBox
+    (tx1, tx2), (ty1, ty2) = targetBox
+    return (x1, y1, x2, y2), (tx1, ty1, tx2, ty2)
+
+def rasterisePolygons(polygons, shape, offset = (0, 0)):
+    """
+    Rasterise polygons using the even-odd rule. A pixel belongs to the
+    rasterised area if its centre lies inside the polygons.
+
+    @type  polygons: [numpy.ndarray, ...]
+    @param polygons: vertices of polygons (arrays of shape (n, 2)) in image
+                     coordinates
+
+    @type  shape: (int, int)
+    @param shape: shape (height, width) of the resulting array
+
+    @type  offset: (int, int)
+    @param offset: image coordinates (x, y) of the top-left corner of the
+                   resulting array
+
+    @rtype: numpy.ndarray
+    @return: boolean mask of the rasterised polygons
+    """
+    height, width = shape
+    toggles = np.zeros(height * (width + 1), dtype=np.int32)
+
+    for polygon in polygons:
+        start = np.asarray(polygon, dtype=np.float64) - offset
+        end = np.roll(start, -1, axis=0)
+
+        # Rows which centres are crossed by consecutive edges
+        yMin = np.minimum(start[:, 1], end[:, 1])
+        yMax = np.maximum(start[:, 1], end[:, 1])
+        firstRow = np.clip(np.ceil(yMin - 0.5).astype(int), 0, height)
+        lastRow = np.clip(np.ceil(yMax - 0.5).astype(int), 0, height)
+        crossings = np.maximum(lastRow - firstRow, 0)
+        if crossings.sum() == 0:
+            continue
+
+        edges = np.repeat(np.arange(len(start)), crossings)
+        rows = np.arange(len(edges)) -\
+               np.repeat(np.cumsum(crossings) - crossings, crossings) +\
+               firstRow[edges]
+
+        # Every crossing toggles pixels which centres are on its right side
+        (x0, y0), (x1, y1) = start[edges].T, end[edges].T
+        x = x0 + (rows + 0.5 - y0) * (x1 - x0) / (y1 - y0)
+        columns = np.clip(np.floor(x - 0.5).astype(int) + 1, 0, width)
+        toggles += np.bincount(rows * (width + 1) + columns,
+                               minlength = len(toggles)).astype(np.int32)
+
+    toggles = toggles.reshape(height, width + 1)[:, :width]
+    return np.cumsum(toggles, axis=1) % 2 == 1
+
+def getPolygonsLabelLocation(polygons):
+    """
+    Vector counterpart of L{getBestLabelLocation}. Polygons are rasterised
+    (see L{rasterisePolygons}) only within their bounding box and the location
+    of maximum of the distance transform of the rasterised area is returned.
+
+    @type  polygons: [numpy.ndarray, ...]
+    @param polygons: vertices of polygons (arrays of shape (n, 2)) in image
+                     coordinates
+
+    @return: tuple of two integers (x,y): image coordinates of best-placed
+             label; centre of the bounding box if the polygons cover no pixel
+             centre; C{None} if there are no polygons (degenerate path)
+    """
+    if len(polygons) == 0:
+        return None
+
+    vertices = np.concatenate(polygons)
+    x1, y1 = np.floor(vertices.min(axis=0)).astype(int) - 1
+    x2, y2 = np.ceil(vertices.max(axis=0)).astype(int) + 1
+
+    # Margin of background pixels is required for proper results
+    mask = rasterisePolygons(polygons, (y2 - y1, x2 - x1), (x1, y1))
+    if not mask.any():
+        return ((x1 + x2) // 2, (y1 + y2) // 2)
+
+    distanceTransform = dtransform(mask)
+    (y, x) = np.unravel_index(distanceTransform.argmax(), mask.shape)
+    return (int(x + x1), int(y + y1))
+
+def getPolygonsLabelLocations(polygonsList):
+    """
+    Batch version of L{getPolygonsLabelLocation}. Bounding boxes of all sets
+    of polygons (with their background margins) are packed side by side into
+    a single array, so polygons are rasterised and the distance transform is
+    computed only once. As boxes are separated by their margins, results are
+    the same as the ones of L{getPolygonsLabelLocation}.
+
+    @type  polygonsList: [[numpy.ndarray, ...], ...]
+    @param polygonsList: sets of polygons (see L{getPolygonsLabelLocation})
+
+    @return: image coordinates of best-placed labels (or C{None}) for every
+             set of polygons (see L{getPolygonsLabelLocation})
+    @rtype: [(int, int), ...]
+    """
+    locations = [None] * len(polygonsList)
+
+    boxes = []
+    for (i, polygons) in enumerate(polygonsList):
+        if len(polygons) == 0:
+            continue
+        vertices = np.concatenate(polygons)
+        x1, y1 = np.floor(vertices.min(axis=0)).astype(int) - 1
+        x2, y2 = np.ceil(vertices.max(axis=0)).astype(int) + 1
+        boxes.append((i, x1, y1, x2, y2))
+
+    if len(boxes) == 0:
+        return locations
+
+    # Shelf packing: the highest boxes first, row after row
+    area = sum((x2 - x1) * (y2 - y1) for (i, x1, y1, x2, y2) in boxes)
+    width = max([int(np.sqrt(area))] +\
+                [x2 - x1 for (i, x1, y1, x2, y2) in boxes])
+    boxes.sort(key = lambda box: box[2] - box[4])
+
+    placement = {}
+    (px, py, shelfHeight) = (0, 0, 0)
+    for (i, x1, y1, x2, y2) in boxes:
+        if px + x2 - x1 > width:
+            (px, py, shelfHeight) = (0, py + shelfHeight, 0)
+        placement[i] = (px, py)
+        px += x2 - x1
+        shelfHeight = max(shelfHeight, y2 - y1)
+
+    shifted = [polygon - (x1 - placement[i][0], y1 - placement[i][1])\
+               for (i, x1, y1, x2, y2) in boxes for polygon in polygonsList[i]]
+    mask = rasterisePolygons(shifted, (py + shelfHeight, width))
+    distanceTransform = dtransform(mask)
+
+    for (i, x1, y1, x2, y2) in boxes:
+        (px, py) = placement[i]
+        region = distanceTransform[py:py + y2 - y1, px:px + x2 - x1]
+        if not region.any():
+            locations[i] = ((x1 + x2) // 2, (y1 + y2) // 2)
+        else:
+            (y, x) = np.unravel_index(region.argmax(), region.shape)
+            locations[i] = (int(x + x1), int(y + y1))
+
+    return locations
+
 def massCentre(bitmap):
     """
     the bitmap should be binary image
@@ -198,38 +498,581 @@ def performTracing(binaryImage, tracingProperties, dumpName = None):
     ImageString = cStringIO.StringIO()
 
     # Save image to this file-like object
+    encodingStart = time.time()
     binaryImage.save(ImageString, "BMP")
+    TRACING_STATISTICS['encodingTime'] += time.time() - encodingStart
     if dumpName: binaryImage.save(dumpName, "BMP")
 
     # Create process pipes
+    # -o - - Input and output via pipes
+    commandLineParams = _getPotraceCommandLine(tracingProperties) +\
+            ['-o','-','-']
+
+    process = _spawnTracer(commandLineParams, 1,\
+              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    # Pass bmp string to pipe, close image string.
+    process.stdin.write(ImageString.getvalue())
+    ImageString.close()
+
+    # Read and return tracing output
+    return  process.stdout.read()
+
+def performTracingBatch(binaryImages, tracingProperties):
+    """
+    Perform tracing of many images using a bounded pool of potrace processes.
+
+    Instead of starting one potrace process per image (as L{performTracing}
+    does), images are grouped into batches. Every batch is stored as a set of
+    PBM files in a temporary directory and traced by a single potrace
+    invocation (potrace traces every file given in the command line and
+    saves the result next to the input file). At most C{processes} potrace
+    invocations are run at the same time.
+
+    Besides the keys used by L{performTracing}, C{tracingProperties} may
+    contain the following optional keys:
+        1. C{potrace_batch_size}: (C{int}) number of images traced by
+           a single potrace process, L{TRACING_BATCH_SIZE} by default,
+        2. C{potrace_processes}: (C{int}) maximum number of concurrently
+           running potrace processes, number of CPUs by default.
+
+    The images are consumed lazily, so a generator may be passed in order to
+    keep only a single batch of full-size images in memory.
+
+    @type  binaryImages: iterable([PIL.Image.Image, ...])
+    @param binaryImages: images for tracing (see L{performTracing} for
+                         requirements)
+
+    @type  tracingProperties: {str : ?, ...}
+    @param tracingProperties: potrace properties
+
+    @return: raw tracing outputs, in the order of C{binaryImages}
+    @rtype: [str, ...]
+    """
+    batchSize = tracingProperties.get('potrace_batch_size', TRACING_BATCH_SIZE)
+    processes = tracingProperties.get('potrace_processes',\
+                                      multiprocessing.cpu_count())
+    commandLineParams = _getPotraceCommandLine(tracingProperties)
+
+    results = []
+    runningTracers = []
+    batch = []
+    binaryImages = iter(binaryImages)
+
+    while True:
+        binaryImage = next(binaryImages, None)
+        if binaryImage is not None:
+            batch.append(binaryImage)
+            if len(batch) < batchSize:
+                continue
+
+        if batch:
+            # Do not exceed the number of concurrently running tracers
+            if len(runningTracers) >= processes:
+                results.extend(_collectTracerBatch(*runningTracers.pop(0)))
+            runningTracers.append(_startTracerBatch(batch, commandLineParams))
+            batch = []
+
+        if binaryImage is None:
+            break
+
+    while runningTracers:
+        results.extend(_collectTracerBatch(*runningTracers.pop(0)))
+
+    return results
+
+def _getPotraceCommandLine(tracingProperties):
+    """
+    Build potrace command line (without input and output specification) from
+    provided tracing properties.
+
+    @type  tracingProperties: {str : ?, ...}
+    @param tracingProperties: potrace properties
+
+    @rtype: [str, ...]
+    @return: potrace command line
+    """
     # potrace parameters:
     # -s for settring SVG output
     # -O Optimization parameter
     # -r SVG Image resolution in DPI
-    # -W,H Output dimensions of SVG drawing
-    # -o - - Input and output via pipes
+    # -W,H Output dimensions of SVG drawing (optional, when not given,
+    #      dimensions are determined by the resolution)
     commandLineParams = ['potrace',\
             '-s',\
             '-O', tracingProperties['potrace_accuracy_parameter'],\
-            '-r', tracingProperties['potrace_svg_resolution_string'],\
-            '-W', tracingProperties['potrace_width_string'],\
-            '-H', tracingProperties['potrace_height_string'],\
-            '-o','-','-']
+            '-r', tracingProperties['potrace_svg_resolution_string']]
+
+    if 'potrace_width_string' in tracingProperties:
+        commandLineParams += ['-W', tracingProperties['potrace_width_string']]
+    if 'potrace_height_string' in tracingProperties:
+        commandLineParams += ['-H', tracingProperties['potrace_height_string']]
 
     # potrace_turdsize is an optional parameter
     if 'potrace_turdsize' in tracingProperties:
         commandLineParams.insert(2, str(tracingProperties['potrace_turdsize']))
         commandLineParams.insert(2, '-t')
 
-    process = subprocess.Popen(commandLineParams,\
-              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    return commandLineParams
 
-    # Pass bmp string to pipe, close image string.
-    process.stdin.write(ImageString.getvalue())
-    ImageString.close()
+def getPotraceDimension(dimensionString):
+    """
+    Convert potrace dimension (eg. C{'1200pt'}, C{'4.5cm'}) to points.
 
-    # Read and return tracing output
-    return  process.stdout.read()
+    @type  dimensionString: str
+    @param dimensionString: potrace dimension
+
+    @rtype: float
+    @return: dimension in points
+    """
+    value, unit = re.match(r"^\s*([0-9.eE+-]+)\s*([a-z]*)\s*$",
+                           dimensionString).groups()
+    return float(value) * POTRACE_DIMENSION_UNITS[unit]
+
+def getTracingScale(tracingProperties, imageSize):
+    """
+    Calculate size of a pixel of the traced image in the units of potrace
+    output (points).
+
+    @type  tracingProperties: {str : ?, ...}
+    @param tracingProperties: potrace properties
+
+    @type  imageSize: (int, int)
+    @param imageSize: (width, height) of the traced images
+
+    @return: horizontal and vertical size of a pixel
+    @rtype: (float, float)
+    """
+    return (getPotraceDimension(tracingProperties['potrace_width_string'])\
+                / imageSize[0],
+            getPotraceDimension(tracingProperties['potrace_height_string'])\
+                / imageSize[1])
+
+def getCropTracingProperties(tracingProperties, imageSize):
+    """
+    Create potrace properties for tracing crops of images of size
+    C{imageSize}. Output dimensions of the crops are not fixed but determined
+    by the resolution. The resolution is selected in such way that a pixel of
+    a crop has the same size as a pixel of the whole image traced with
+    C{tracingProperties}.
+
+    @type  tracingProperties: {str : ?, ...}
+    @param tracingProperties: potrace properties for tracing whole images
+
+    @type  imageSize: (int, int)
+    @param imageSize: (width, height) of the whole image
+
+    @rtype: {str : ?, ...}
+    @return: potrace properties for tracing crops
+    """
+    sx, sy = getTracingScale(tracingProperties, imageSize)
+
+    cropProperties = dict(tracingProperties)
+    del cropProperties['potrace_width_string']
+    del cropProperties['potrace_height_string']
+    cropProperties['potrace_svg_resolution_string'] = "%.12gx%.12g" %\
+            (72.0 / sx, 72.0 / sy)
+    return cropProperties
+
+def _spawnTracer(commandLineParams, numberOfMasks, **kwargs):
+    """
+    Start potrace process and update L{TRACING_STATISTICS}. As C{Popen}
+    returns after successful C{exec}, time spent in the constructor is the
+    fork and exec overhead of the tracer.
+
+    @type  commandLineParams: [str, ...]
+    @param commandLineParams: potrace command line
+
+    @type  numberOfMasks: int
+    @param numberOfMasks: number of images traced by the process
+
+    @return: started process
+    @rtype: subprocess.Popen
+    """
+    spawnStart = time.time()
+    process = subprocess.Popen(commandLineParams, **kwargs)
+    TRACING_STATISTICS['spawnTime'] += time.time() - spawnStart
+    TRACING_STATISTICS['processes'] += 1
+    TRACING_STATISTICS['masks'] += numberOfMasks
+    return process
+
+def _encodePBM(binaryImage):
+    """
+    Encode image as a binary PBM (P4) string. Pixels darker than 128 are
+    considered as foreground which is equivalent to default potrace
+    thresholding of grayscale images.
+
+    @type  binaryImage: PIL.Image.Image
+    @param binaryImage: image to encode
+
+    @rtype: str
+    @return: PBM representation of the image
+    """
+    if binaryImage.mode != 'L':
+        binaryImage = binaryImage.convert('L')
+    w, h = binaryImage.size
+    bits = np.packbits(tonpArray(binaryImage) < 128, axis=1)
+    return "P4\n%d %d\n" % (w, h) + bits.tostring()
+
+def _startTracerBatch(batch, commandLineParams):
+    """
+    Save batch of images into a temporary directory and start potrace
+    process tracing all of them.
+
+    @type  batch: [PIL.Image.Image, ...]
+    @param batch: images to trace
+
+    @type  commandLineParams: [str, ...]
+    @param commandLineParams: potrace command line
+
+    @return: tracing process, temporary directory and names of traced files
+             (without extension)
+    @rtype: (subprocess.Popen, str, [str, ...])
+    """
+    workDirectory = tempfile.mkdtemp(prefix='bar_potrace_')
+    fileNames = []
+
+    encodingStart = time.time()
+    for (imageNumber, binaryImage) in enumerate(batch):
+        fileName = os.path.join(workDirectory, '%06d' % imageNumber)
+        pbmFile = open(fileName + '.pbm', 'wb')
+        pbmFile.write(_encodePBM(binaryImage))
+        pbmFile.close()
+        fileNames.append(fileName)
+    TRACING_STATISTICS['encodingTime'] += time.time() - encodingStart
+
+    process = _spawnTracer(commandLineParams +\
+                           map(lambda x: x + '.pbm', fileNames), len(batch))
+    return (process, workDirectory, fileNames)
+
+def _collectTracerBatch(process, workDirectory, fileNames):
+    """
+    Wait for the potrace process to finish and read the tracing results.
+    Remove the temporary directory.
+
+    @return: raw tracing outputs
+    @rtype: [str, ...]
+    """
+    try:
+        if process.wait() != 0:
+            raise IOError, "potrace failed with exit code %d" %\
+                                (process.returncode,)
+
+        results = []
+        for fileName in fileNames:
+            svgFile = open(fileName + '.svg')
+            results.append(svgFile.read())
+            svgFile.close()
+        return results
+
+    finally:
+        shutil.rmtree(workDirectory, ignore_errors=True)
+
+def getTracingStatistics():
+    """
+    Summarize tracing performed by the module so far.
+
+    Returned dictionary contains following keys:
+        1. C{masks}: number of traced images,
+        2. C{processes}: number of started potrace processes,
+        3. C{spawnTime}: total time (in seconds) of potrace fork and exec,
+        4. C{encodingTime}: total time (in seconds) of image encoding,
+        5. C{savedProcesses}: number of potrace processes which were not
+           started thanks to batching,
+        6. C{savedSpawnTime}: estimated fork and exec time (in seconds) saved
+           thanks to batching.
+
+    @rtype: {str : ?, ...}
+    @return: tracing statistics
+    """
+    stats = dict(TRACING_STATISTICS)
+    stats['savedProcesses'] = stats['masks'] - stats['processes']
+
+    if stats['processes']:
+        stats['savedSpawnTime'] = stats['savedProcesses'] *\
+                stats['spawnTime'] / stats['processes']
+    else:
+        stats['savedSpawnTime'] = 0.0
+
+    return stats
+
+def resetTracingStatistics():
+    """
+    Reset L{TRACING_STATISTICS} counters.
+    """
+    TRACING_STATISTICS.update({'masks': 0,
+                               'processes': 0,
+                               'spawnTime': 0.0,
+                               'encodingTime': 0.0})
+
+def mergeTracingStatistics(counters):
+    """
+    Add counters of tracing performed by another process (e.g. a worker
+    process) to L{TRACING_STATISTICS}.
+
+    @type  counters: {str : ?, ...}
+    @param counters: copy of L{TRACING_STATISTICS} of the other process
+    """
+    for (key, value) in counters.iteritems():
+        TRACING_STATISTICS[key] += value
+
+# Pixels are connected only by their edges - the same way as in
+# L{floodFillScanlineStack}
+FLOOD_FILL_CONNECTIVITY = ndimage.generate_binary_structure(2, 1)
+
+class floodFillEngine(object):
+    """
+    Vectorised flood fill of the image. Pixels of the same colour are
+    labelled as connected components (once per colour, on demand), so
+    consecutive fills of the same image starting from different seeds reduce
+    to lookups of the component of the seed.
+
+    Flooded regions are identical to the ones of L{floodFillScanlineStack}.
+
+    @type array: numpy.ndarray
+    @ivar array: flooded image; never modified
+    """
+    def __init__(self, image):
+        """
+        @type  image: PIL.Image.Image or numpy.ndarray
+        @param image: image to be flooded (in indexed colour or grayscale mode)
+        """
+        self.array = np.asarray(image)
+        self.__labellings = {}
+
+    def getMask(self, xy):
+        """
+        @type  xy: (int, int)
+        @param xy: coordinates of floodfill seed
+
+        @rtype: (numpy.ndarray, int)
+        @return: boolean mask of flooded pixels and number of flooded pixels
+        """
+        x, y = xy
+        h, w = self.array.shape
+        if not (0 <= x < w and 0 <= y < h):
+            raise IndexError, "Seed %s outside the image." % (xy,)
+
+        labels, boundingBoxes, areas = self.__getLabelling(self.array[y, x])
+        label = labels[y, x]
+        boundingBox = boundingBoxes[label - 1]
+
+        mask = np.zeros(self.array.shape, dtype=bool)
+        mask[boundingBox] = labels[boundingBox] == label
+        return (mask, int(areas[label]))
+
+    def getAreas(self, seeds):
+        """
+        Calculate areas of floodfills for many seeds at once without creating
+        masks.
+
+        @type  seeds: [(int, int), ...]
+        @param seeds: coordinates of floodfill seeds
+
+        @rtype: [int, ...]
+        @return: number of pixels which would be flooded from every seed
+        """
+        if len(seeds) == 0:
+            return []
+
+        xs, ys = map(np.array, zip(*seeds))
+        h, w = self.array.shape
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= w or ys.max() >= h:
+            raise IndexError, "Seed outside the image."
+
+        colours = self.array[ys, xs]
+        result = np.zeros(len(seeds), dtype=int)
+        for colour in np.unique(colours):
+            labels, boundingBoxes, areas = self.__getLabelling(colour)
+            selected = colours == colour
+            result[selected] = areas[labels[ys[selected], xs[selected]]]
+        return map(int, result)
+
+    def fill(self, xy, value):
+        """
+        @type  xy: (int, int)
+        @param xy: coordinates of floodfill seed
+
+        @type  value: int
+        @param value: fill colour
+
+        @rtype: (numpy.ndarray, int)
+        @return: flooded copy of the image and number of flooded pixels
+        """
+        mask, npix = self.getMask(xy)
+        flooded = self.array.copy()
+        flooded[mask] = value
+        return (flooded, npix)
+
+    def __getLabelling(self, colour):
+        """
+        @return: connected components of pixels of given colour: labels,
+                 bounding boxes of labels and areas of labels
+        @rtype: (numpy.ndarray, [(slice, slice), ...], numpy.ndarray)
+        """
+        if colour not in self.__labellings:
+            labels, n = ndimage.label(self.array == colour,
+                                      FLOOD_FILL_CONNECTIVITY)
+            self.__labellings[colour] = (labels,
+                                         ndimage.find_objects(labels),
+                                         np.bincount(labels.ravel()))
+        return self.__labellings[colour]
+
+def getChessboardDistance(mask):
+    """
+    @type  mask: numpy.ndarray
+    @param mask: boolean mask
+
+    @rtype: numpy.ndarray
+    @return: chessboard distance from every pixel to the nearest C{True} pixel
+             of the mask (sum of the mask dimensions if there is no such pixel)
+    """
+    distance = ndimage.distance_transform_cdt(~mask, metric='chessboard')
+    if not mask.any():
+        distance.fill(sum(mask.shape))
+    return distance
+
+class greyErosionEngine(object):
+    """
+    Grey erosion of the image with square structuring elements of any size.
+
+    Eroding an image by a square of radius M{r} (what C{r} consecutive
+    applications of C{ImageFilter.MinFilter(3)} do) is equivalent to
+    thresholding at M{r} the chessboard distances from pixels not brighter than
+    each grey level of the image. The distances are calculated once, so
+    erosions by any radius cost a single pass over the image.
+
+    Borders of the image are handled the same way as by
+    C{ImageFilter.MinFilter}.
+
+    @type array: numpy.ndarray
+    @ivar array: eroded image; never modified
+    """
+    def __init__(self, image):
+        """
+        @type  image: PIL.Image.Image or numpy.ndarray
+        @param image: image to be eroded (in grayscale mode)
+        """
+        self.array = np.asarray(image)
+        levels = np.unique(self.array)
+        self.__background = levels[-1]
+        self.__distances = [(level, getChessboardDistance(self.array <= level))\
+                            for level in levels[:-1]]
+
+    def erode(self, radius, mask = None, maskRadius = 0, value = 0):
+        """
+        Erode the image by C{radius - maskRadius}, replace masked pixels with
+        C{value} and erode the result by C{maskRadius}.
+
+        @type  radius: int
+        @param radius: radius of the square structuring element
+
+        @type  mask: numpy.ndarray
+        @param mask: boolean mask of replaced pixels; the image is eroded as
+                     it is if not given
+
+        @type  maskRadius: int
+        @param maskRadius: radius of erosion following the replacement
+
+        @type  value: int
+        @param value: colour of masked pixels
+
+        @rtype: numpy.ndarray
+        @return: eroded image
+        """
+        result = np.empty_like(self.array)
+        result.fill(self.__background)
+
+        # The darkest grey level within the radius wins
+        for (level, distance) in reversed(self.__distances):
+            result[distance <= radius] = level
+
+        if mask is not None:
+            rows, cols = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+            if len(rows) == 0:
+                return result
+
+            # Pixels far from the mask are not affected
+            h, w = mask.shape
+            box = (slice(max(rows[0] - maskRadius, 0),
+                         min(rows[-1] + maskRadius + 1, h)),
+                   slice(max(cols[0] - maskRadius, 0),
+                         min(cols[-1] + maskRadius + 1, w)))
+            near = getChessboardDistance(mask[box]) <= maskRadius
+            cropped = result[box]
+            cropped[near] = np.minimum(cropped[near], value)
+
+        return result
+
+def floodFill(image, xy, value):
+    """
+    Vectorised replacement of L{floodFillScanlineStack}.
+
+    @type  image: PIL.Image.Image
+    @param image: image on which floodfill will be performed (in place)
+
+    @type  xy: (int, int)
+    @param xy: coordinates of floodfill seed
+
+    @type  value: int
+    @param value: fill colour
+
+    @rtype: int
+    @return: number of pixels with changed color (area of floodfill)
+    """
+    flooded, npix = floodFillEngine(image).fill(xy, value)
+    image.paste(Image.fromarray(flooded, image.mode))
+    return npix
+
+def getPatches(image, colour, threshold):
+    """
+    Find all patches (connected components) of pixels of given colour larger
+    than given threshold in a single labelling pass.
+
+    Only patches containing at least one pixel which has all its neighbours
+    of the same colour are considered (patches of isolated pixels or one pixel
+    wide lines are ommited regardless of their size). Every patch is
+    represented by its first such pixel (in the raster order).
+
+    @type  image: PIL.Image.Image or numpy.ndarray
+    @param image: image to search (in indexed colour or grayscale mode)
+
+    @type  colour: int
+    @param colour: colour of patches
+
+    @type  threshold: int
+    @param threshold: patches of C{threshold} or less pixels are ommited
+
+    @rtype: [((int, int), numpy.ndarray, int), ...]
+    @return: (x, y) image coordinates of the representing pixel, boolean mask
+             and number of pixels for every found patch in the raster order of
+             representing pixels
+    """
+    array  = np.asarray(image) == colour
+    labels, n = ndimage.label(array, FLOOD_FILL_CONNECTIVITY)
+    areas  = np.bincount(labels.ravel())
+    boundingBoxes = ndimage.find_objects(labels)
+
+    # Pixels surrounded by pixels of the same colour (pixels outside the image
+    # are of different colour)
+    interior = ndimage.binary_erosion(array, FLOOD_FILL_CONNECTIVITY)
+    interiorIndices = np.flatnonzero(interior)
+    patches, first = np.unique(labels.flat[interiorIndices], return_index = True)
+
+    result = []
+    width = array.shape[1]
+    for (label, index) in sorted(zip(patches, interiorIndices[first]),
+                                 key = lambda x: x[1]):
+        if areas[label] <= threshold:
+            continue
+
+        boundingBox = boundingBoxes[label - 1]
+        mask = np.zeros(array.shape, dtype=bool)
+        mask[boundingBox] = labels[boundingBox] == label
+        result.append(((int(index % width), int(index // width)),
+                       mask, int(areas[label])))
+
+    return result
 
 def floodFillScanlineStack(image, xy, value):
     """
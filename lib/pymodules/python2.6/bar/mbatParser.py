@@ -35,6 +35,7 @@ import os
 import re
 
 import nifti
+import numpy as np
 from PIL import Image,ImageChops
 from parsers import barBitmapParser
 
@@ -128,6 +129,9 @@ class barMBATParser(barBitmapParser):
     _requiredInternalData = barBitmapParser._requiredInternalData +\
             ['_volume','_pathNumber']
 
+    # Masks created by _createMask may be extracted with labelled image
+    useLabelledImage = True
+
     def __init__(self, inputAtlasFile, outputDirectory, **kwargs):
         """
         @type  inputAtlasFile: C{str}
@@ -35,13 +35,20 @@ import os
 import sys
 import cStringIO
 import subprocess
+import multiprocessing
 import xml.dom.minidom as dom
 from string import strip, split
 
+import numpy as np
 from PIL import Image, ImageChops
 import atlas_indexer
+from image_process import getColourLabels, getLabelBoundingBoxes,\
+    getLabelMask, getAlignedCropBox, getTracingScale,\
+    getCropTracingProperties, getTracingStatistics, resetTracingStatistics,\
+    mergeTracingStatistics, TRACING_STATISTICS
 
-from base import performTracing, barPath, barTransfMatrixMetadataElement,\
+from base import performTracing, performTracingBatch, barPath,\
+    barTransfMatrixMetadataElement,\
     barBregmaMetadataElement, cleanPotraceOutput,\
     barTracedSlide, barTracedSlideRenderer,\
     barPretracedSlideRenderer, _printRed
@@ -91,6 +98,15 @@ class barGenericParser(object):
     L{CONF_POTRACE_WIDTH_STRING<base.CONF_POTRACE_WIDTH_STRING>},
     L{CONF_POTRACE_HEIGHT_STRING<base.CONF_POTRACE_HEIGHT_STRING>}.
 
+    @type processes: C{int}
+    @ivar processes: Number of worker processes used by
+                     L{parseAll<parseAll>} and L{parseRange<parseRange>}.
+                     When C{None} or C{1} (default) slides are parsed one
+                     after another in the current process. Otherwise slides are
+                     distributed across a process pool and the results are
+                     merged in the slide order (see
+                     L{_parseSlides<_parseSlides>}).
+
     @change: pią, 21 sty 2011, 11:40:31 CET, Creating index without parsing all
     nlides again: L{<reindex>} method introduced.
     """
@@ -98,6 +114,8 @@ class barGenericParser(object):
                              'slideRange', 'tracingProperties',
                              'renderingProperties']
 
+    processes = None
+
     def __init__(self, **kwargs):
         for k, v in kwargs.iteritems():
             self.__setattr__(k, v)
@@ -131,7 +149,7 @@ class barGenericParser(object):
         @rtype: C{None}
         @return: C{None}
         """
-        return map(self.parse, self.slideRange)
+        return self._parseSlides(self.slideRange)
 
     def parseRange(self, firstSlide, lastSlide):
         """
@@ -149,7 +167,212 @@ class barGenericParser(object):
         Parses slides starting from C{firstSlide} up to C{lastSlide}.
         """
         #TODO: Implement checking if range is within the limits.
-        return map(self.parse, range(firstSlide, lastSlide + 1))
+        return self._parseSlides(range(firstSlide, lastSlide + 1))
+
+    def _parseSlides(self, slideList):
+        """
+        @type  slideList: C{[int, ...]}
+        @param slideList: numbers of slides to parse
+
+        @rtype: C{[barTracedSlideRenderer, ...]}
+        @return: Traced slides in the order of C{slideList}.
+
+        Parses given slides either serially or, when
+        L{processes<processes>} is greater than one, using a pool of worker
+        processes.
+
+        Every worker invokes unmodified L{parse<parse>} method (thus the slide
+        is traced and saved by the worker) and sends the traced slide back. The
+        parent process merges the slides strictly in the order of
+        C{slideList}:
+
+            1. Path identifiers are regenerated with the parent's
+               L{_getNewPathID<barBitmapParser._getNewPathID>} (if the parser
+               defines one) exactly in the order in which they would be
+               requested by a serial run. Slides, which identifiers changed,
+               are saved again.
+            2. Slides indexed by the worker are indexed with the parent's
+               L{indexer<atlas_indexer.barIndexer>}.
+
+        Thanks to that, the CAF slides and the CAF index are identical to the
+        ones created by serial parsing.
+
+        Tracing statistics of worker processes are merged as well and the
+        summary is printed after parsing (see
+        L{_printTracingStatistics<_printTracingStatistics>}).
+        """
+        resetTracingStatistics()
+
+        if not self.processes or self.processes < 2 or len(slideList) < 2:
+            parsedSlides = map(self.parse, slideList)
+            self._printTracingStatistics()
+            return parsedSlides
+
+        global _parallelParser
+        _parallelParser = self
+
+        pool = multiprocessing.Pool(min(self.processes, len(slideList)))
+        try:
+            parsedSlides = map(self._mergeParsedSlide,
+                      pool.imap(_parseSlideInWorker, slideList))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _parallelParser = None
+
+        self._printTracingStatistics()
+        return parsedSlides
+
+    def _parseSingleSlide(self, slideNumber):
+        """
+        @type  slideNumber: C{int}
+        @param slideNumber: Number of slide to parse
+
+        @rtype: C{(int, barTracedSlideRenderer, list, [int, ...], dict)}
+        @return: Slide number, traced slide, list of path identifiers
+                 requests (C{(pathID, args, kwargs)} tuples), list of
+                 numbers under which the slide was indexed and tracing
+                 statistics counters of the slide (see
+                 L{TRACING_STATISTICS<image_process.TRACING_STATISTICS>}).
+
+        Parses given slide in a worker process. Calls of
+        L{_getNewPathID<barBitmapParser._getNewPathID>} and
+        L{indexSingleSlide<atlas_indexer.barIndexer.indexSingleSlide>} are
+        recorded in order to be replayed by the parent process (see
+        L{_mergeParsedSlide<_mergeParsedSlide>}).
+        """
+        pathIDRequests = []
+        indexer = self.indexer
+        self.indexer = _barIndexingRecorder(indexer)
+
+        if hasattr(self, '_getNewPathID'):
+            getNewPathID = self._getNewPathID
+            def recordPathIDRequest(*args, **kwargs):
+                pathID = getNewPathID(*args, **kwargs)
+                pathIDRequests.append((pathID, args, kwargs))
+                return pathID
+            self._getNewPathID = recordPathIDRequest
+
+        # Worker processes are reused, so count tracing of the slide only
+        resetTracingStatistics()
+
+        try:
+            tracedSlide = self.parse(slideNumber)
+        finally:
+            indexedSlides = self.indexer.indexedSlides
+            self.indexer = indexer
+            self.__dict__.pop('_getNewPathID', None)
+
+        return (slideNumber, tracedSlide, pathIDRequests, indexedSlides,
+                dict(TRACING_STATISTICS))
+
+    def _mergeParsedSlide(self, parsingResult):
+        """
+        @type  parsingResult: C{tuple}
+        @param parsingResult: Result of L{_parseSingleSlide<_parseSingleSlide>}
+                              sent back by a worker process.
+
+        @rtype: L{barTracedSlideRenderer<barTracedSlideRenderer>}
+        @return: Traced slide with path identifiers valid for the serial
+                 parsing.
+
+        Merges slide parsed by a worker process into the parser state. Has to
+        be invoked in the order of parsed slides.
+        """
+        slideNumber, tracedSlide, pathIDRequests, indexedSlides,\
+            tracingCounters = parsingResult
+        mergeTracingStatistics(tracingCounters)
+
+        # Replay path identifiers requests in the order in which they were
+        # issued by the worker.
+        idMapping = []
+        for (workerPathID, args, kwargs) in pathIDRequests:
+            idMapping.append((workerPathID, self._getNewPathID(*args, **kwargs)))
+
+        if filter(lambda (x, y): x != y, idMapping):
+            self._renamePaths(tracedSlide, idMapping)
+            tracedSlide.writeXMLtoFile(self._getOutputFilename(slideNumber))
+
+        for indexedSlideNumber in indexedSlides:
+            self.indexer.indexSingleSlide(tracedSlide, indexedSlideNumber)
+
+        return tracedSlide
+
+    def _printTracingStatistics(self):
+        """
+        @rtype: C{None}
+        @return: C{None}
+
+        Prints summary of tracing performed during parsing (see
+        L{getTracingStatistics<image_process.getTracingStatistics>}). Nothing
+        is printed if no image was traced.
+        """
+        stats = getTracingStatistics()
+        if not stats['masks']:
+            return
+
+        print >>sys.stderr, "Traced %d images using %d potrace processes" %\
+                (stats['masks'], stats['processes'])
+        print >>sys.stderr, "\tSpawn time: %.2fs, encoding time: %.2fs" %\
+                (stats['spawnTime'], stats['encodingTime'])
+        print >>sys.stderr, "\tSaved processes: %d, saved spawn time: %.2fs (estimated)" %\
+                (stats['savedProcesses'], stats['savedSpawnTime'])
+
+    def _renamePaths(self, tracedSlide, idMapping):
+        """
+        @type  tracedSlide: L{barTracedSlideRenderer<barTracedSlideRenderer>}
+        @param tracedSlide: Slide which paths will be renamed.
+
+        @type  idMapping: C{[(str, str), ...]}
+        @param idMapping: Pairs of old and new path identifiers in the order of
+                          path creation.
+
+        @rtype: C{None}
+        @return: C{None}
+
+        Changes identifiers of paths and of regular labels corresponding to
+        them. Paths and labels are put back into the slide in the same order
+        as during serial parsing.
+        """
+        pathIndex = tracedSlide.pathIndex
+        oldLabelIDs = {}
+        renamedPaths = set()
+
+        # Reassign path identifiers structure by structure, preserving the
+        # order in which paths were created.
+        for structure in tracedSlide.structures:
+            structure._paths = {}
+        for (oldID, newID) in idMapping:
+            path = pathIndex.get(oldID)
+            if path is None:
+                continue
+            oldLabelID = path.relLabelID
+            path.id = newID
+            oldLabelIDs[path.relLabelID] = oldLabelID
+            tracedSlide[path.structName][newID] = path
+            renamedPaths.add(oldID)
+
+        # Paths not created by the parser (if any) are left intact.
+        for (oldID, path) in pathIndex.iteritems():
+            if oldID not in renamedPaths:
+                tracedSlide[path.structName][oldID] = path
+
+        # Regular labels are recreated in the way
+        # barTracedSlideRenderer.generateLabels does it.
+        labels = tracedSlide._labels
+        relabeled = set(oldLabelIDs.values())
+        tracedSlide._labels = {}
+        for (labelID, label) in labels.iteritems():
+            if labelID not in relabeled:
+                tracedSlide.addLabel(label)
+        for path in tracedSlide.pathIndex.values():
+            label = labels.get(oldLabelIDs.get(path.relLabelID))
+            if label is not None:
+                label.ID = path.relLabelID
+                tracedSlide.addLabel(label)
 
     def writeIndex(self, rescanSlides=False):
         """
@@ -167,6 +390,8 @@ class barGenericParser(object):
         @todo: Check if all required data is set.
         """
         #TODO: Check if all required data is set
+        if rescanSlides:
+            barGenericParser.reindex(self)
         self.indexer.writeXMLtoFile(self._getIndexFilename())
 
     def reindex(self):
@@ -177,11 +402,37 @@ class barGenericParser(object):
         Reindexes all slides in L{self.slideRange<self.slideRange>}. This
         option is useful when consecutive slides were not indexed during tracing
         procedure.
+
+        Reindexing is incremental: only CAF slides which files have changed
+        since they were indexed are loaded again. Contribution of other slides
+        to the index is taken from the indexer itself or from the slide records
+        file (see L{_getSlideRecordsFilename<_getSlideRecordsFilename>}) saved
+        by the previous reindexing.
         """
+        recordsFilename = self._getSlideRecordsFilename()
+        records = {}
+        if os.path.exists(recordsFilename):
+            try:
+                records = self.indexer.readSlideRecords(recordsFilename)
+            except Exception, e:
+                print >>sys.stderr, "Unable to load slide records: %s" % e
+
         for slideNumber in self.slideRange:
-            tracedSlide = barTracedSlideRenderer.fromXML(
-                self._getOutputFilename(slideNumber), self.renderingProperties)
-            self.indexer.indexSingleSlide(tracedSlide, slideNumber)
+            slideFilename = self._getOutputFilename(slideNumber)
+            digest = self.indexer._getFileDigest(slideFilename)
+
+            if self.indexer.getSlideDigest(slideNumber) == digest:
+                continue
+
+            record = records.get(slideNumber)
+            if record != None and record[0] == digest:
+                self.indexer.restoreSlide(slideNumber, record)
+            else:
+                tracedSlide = barTracedSlideRenderer.fromXML(
+                    slideFilename, self.renderingProperties)
+                self.indexer.indexSingleSlide(tracedSlide, slideNumber, digest)
+
+        self.indexer.writeSlideRecords(recordsFilename)
 
     def __setInternalData(self, name, value):
         self.__setattr__(name, value)
@@ -261,6 +512,16 @@ class barGenericParser(object):
         """
         return os.path.join(self.outputDirectory, "index.xml")
 
+    def _getSlideRecordsFilename(self):
+        """
+        @rtype: C{str}
+        @return: Path of the file with digests of CAF slides and their
+                 contributions to the CAF index (see
+                 L{writeSlideRecords<atlas_indexer.barIndexer.writeSlideRecords>}).
+        """
+        return os.path.join(self.outputDirectory,
+                            atlas_indexer.barIndexer._slideRecordsFilename)
+
     def RGBToHTMLColor(self, rgb_tuple):
         """ convert an (R, G, B) tuple to #RRGGBB """
         hexcolor = '#%02x%02x%02x' % rgb_tuple
@@ -279,6 +540,84 @@ class barGenericParser(object):
         """
         return performTracing(binaryImage, self.tracingProperties['PoTraceConf'])
 
+    def _performTracingBatch(self, binaryImages, cropped=False):
+        """
+        @type  binaryImages: iterable([PIL image, ...])
+        @param binaryImages: Images for tracing.
+
+        @type  cropped: C{bool}
+        @param cropped: Determines if images are crops of images of size
+                        C{renderingProperties['imageSize']} (see
+                        L{getCropTracingProperties<getCropTracingProperties>}).
+
+        Preforms tracing of many images using pool of tracer processes. Alias
+        for L{performTracingBatch<performTracingBatch>}.
+
+        @rtype: C{[str, ...]}
+        @return: Raw tracing output strings.
+        """
+        tracingProperties = self.tracingProperties['PoTraceConf']
+        if cropped:
+            tracingProperties = getCropTracingProperties(tracingProperties,
+                                    self.renderingProperties['imageSize'])
+        return performTracingBatch(binaryImages, tracingProperties)
+
+    def _translatePaths(self, paths, offset):
+        """
+        @type  paths: C{[barPath, ...]}
+        @param paths: Paths traced from a crop of the image.
+
+        @type  offset: C{(int, int)}
+        @param offset: Location of the top-left corner of the crop in the image
+                       (in pixels of image of size
+                       C{renderingProperties['imageSize']}).
+
+        @rtype: C{[barPath, ...]}
+        @return: C{paths} shifted to the image coordinates.
+        """
+        if offset == (0, 0):
+            return paths
+
+        sx, sy = getTracingScale(self.tracingProperties['PoTraceConf'],
+                                 self.renderingProperties['imageSize'])
+        M = np.array([[1., 0., offset[0] * sx],
+                      [0., 1., offset[1] * sy],
+                      [0., 0., 1.]])
+        barPath.affineTransformPaths(paths, M)
+        return paths
+
+class _barIndexingRecorder(object):
+    """
+    Proxy of L{barIndexer<atlas_indexer.barIndexer>} used by worker processes
+    of parallel parsing. Instead of indexing the slides it only records which
+    slides would be indexed. All other attributes are taken from the proxied
+    indexer.
+
+    @type indexedSlides: C{[int, ...]}
+    @ivar indexedSlides: Numbers under which slides were requested to be
+                         indexed.
+    """
+    def __init__(self, indexer):
+        self._indexer = indexer
+        self.indexedSlides = []
+
+    def indexSingleSlide(self, tracedSlide, slideNumber, digest=None):
+        self.indexedSlides.append(slideNumber)
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+
+_parallelParser = None
+
+
+def _parseSlideInWorker(slideNumber):
+    """
+    Worker process entry point of parallel parsing. The parser is inherited
+    from the parent process (see L{barGenericParser._parseSlides}).
+    """
+    return _parallelParser._parseSingleSlide(slideNumber)
+
 
 class barVectorParser(barGenericParser):
     """
@@ -324,7 +663,7 @@ class barVectorParser(barGenericParser):
         pass
 
     def parseAll(self):
-        return map(lambda x: self.parse(x), self.slideRange)
+        return barGenericParser.parseAll(self)
 
     def parse(self, slideNumber,
               useIndexer=True,
@@ -391,11 +730,36 @@ class barBitmapParser(barGenericParser):
                             and translating them into path colous in CAF traced
                             file (values).
 
+    @type useLabelledImage: C{bool}
+    @cvar useLabelledImage: Determines if masks are extracted from the source
+                            image with the labelled image engine (see
+                            L{_processLabelledImage<_processLabelledImage>})
+                            instead of L{_createMask<_createMask>}. The
+                            engine may be used only when the source image is
+                            an RGB or a single channel image and the mask of
+                            a colour is the upscaled (antialiased) image with
+                            all pixels of the colour black and other pixels
+                            white. C{False} by default.
+
+    @type tracingCropMargin: C{int}
+    @cvar tracingCropMargin: Margin (in pixels) of the crops of masks sent for
+                             tracing. Instead of the whole slide, only the
+                             bounding box of the structure extended by the
+                             margin is traced and resulting paths are shifted
+                             back with L{barPath.affineTransformPaths}. With the
+                             labelled image engine only the crop is upscaled,
+                             thus the margin (given in source image pixels)
+                             should not be smaller than the support of the
+                             resampling filter. C{None} disables cropping.
     """
     _requiredInternalData = barGenericParser._requiredInternalData +\
         ['imageToStructure', 'structureColours',
          'backgroundColor']
 
+    useLabelledImage = False
+
+    tracingCropMargin = 4
+
     def __init__(self, **kwargs):
         barGenericParser.__init__(self, **kwargs)
 
@@ -456,9 +820,13 @@ class barBitmapParser(barGenericParser):
 
         # Iterate over all uniqe colours and create set of paths basing on
         # every uniqe colour:
-        for imageColour in uniqeColours:
-            map(retSlide.addPath, self._processStructure(
-                sourceImage, imageColour))
+        if self.useLabelledImage:
+            pathLists = self._processLabelledImage(sourceImage, uniqeColours)
+        else:
+            pathLists = self._processStructures(sourceImage, uniqeColours)
+
+        for pathList in pathLists:
+            map(retSlide.addPath, pathList)
 
         # Append metadata to newly created slide:
         spatialLocation = [
@@ -484,23 +852,144 @@ class barBitmapParser(barGenericParser):
         @return: DOM object holding SVG document created by tracing masked
                  image generated by L{_parseTracerOutput<_parseTracerOutput>}.
         """
+        return self._processStructures(sourceImage, [imageColour])[0]
+
+    def _processStructures(self, sourceImage, imageColours):
+        """
+        @type  sourceImage: PIL image
+        @param sourceImage: raw image from file or volumetric dataset
+
+        @type  imageColours: C{[(int,int,int), ...]}
+        @param imageColours: colours of structures to extract
+
+        @rtype: C{[[barPath, ...], ...]}
+        @return: Lists of paths, one list for every colour from
+                 C{imageColours}.
+
+        Batch version of L{_processStructure<_processStructure>}. Masks are
+        generated lazily and traced by a pool of tracer processes (see
+        L{_performTracingBatch<_performTracingBatch>}) instead of starting
+        separate tracer for every colour.
+        """
+        masks = (self._createMask(sourceImage, imageColour)\
+                 for imageColour in imageColours)
+
+        if self.tracingCropMargin is None:
+            tracedImages = self._performTracingBatch(masks)
+            offsets = [(0, 0)] * len(imageColours)
+        else:
+            offsets = []
+            tracedImages = self._performTracingBatch(
+                    self._cropMasks(masks, offsets), cropped=True)
+
+        return map(lambda imageColour, tracedImage, offset:\
+                   self._translatePaths(self._parseTracerOutput(tracedImage,
+                                           self._getHTMLColour(imageColour)),
+                                        offset),
+                   imageColours, tracedImages, offsets)
+
+    def _cropMasks(self, masks, offsets):
+        """
+        @type  masks: iterable([PIL image, ...])
+        @param masks: Masks created by L{_createMask<_createMask>}.
+
+        @type  offsets: C{list}
+        @param offsets: List to which location of the top-left corner of every
+                        crop is appended.
+
+        @return: Masks cropped to the bounding box of the structure extended
+                 by L{tracingCropMargin<tracingCropMargin>}.
+        @rtype: generator([PIL image, ...])
+        """
+        for mask in masks:
+            if mask.mode != 'L':
+                mask = mask.convert('L')
+            boundingBox = ImageChops.invert(mask).getbbox()
+
+            if boundingBox is None:
+                offsets.append((0, 0))
+                yield mask
+                continue
+
+            m = self.tracingCropMargin
+            x1, y1, x2, y2 = boundingBox
+            x1, y1 = max(0, x1 - m), max(0, y1 - m)
+            x2, y2 = min(mask.size[0], x2 + m), min(mask.size[1], y2 + m)
+
+            offsets.append((x1, y1))
+            yield mask.crop((x1, y1, x2, y2))
+
+    def _processLabelledImage(self, sourceImage, imageColours):
+        """
+        @type  sourceImage: PIL image or C{numpy.ndarray}
+        @param sourceImage: raw image from file or volumetric dataset
+
+        @type  imageColours: C{[(int,int,int), ...]}
+        @param imageColours: colours of structures to extract
+
+        @rtype: C{[[barPath, ...], ...]}
+        @return: Lists of paths, one list for every colour from
+                 C{imageColours}.
+
+        Equivalent of L{_processStructures<_processStructures>} which does not
+        use L{_createMask<_createMask>}. Every colour of the source image is
+        labelled and bounding boxes of all labels are found in a single pass
+        over the image. Then mask of each colour is created by comparing only
+        the bounding box of the colour instead of the whole image. Unless
+        L{tracingCropMargin<tracingCropMargin>} is C{None}, only the bounding
+        box (extended by the margin and aligned, see
+        L{getAlignedCropBox<getAlignedCropBox>}) is upscaled and traced.
+        """
+        labels, colours = getColourLabels(sourceImage)
+        boundingBoxes = getLabelBoundingBoxes(labels, len(colours))
+        colourLabels = dict(map(lambda x: (x[1], x[0]), enumerate(colours)))
+        sourceSize = (labels.shape[1], labels.shape[0])
+        resizeTuple = self.renderingProperties['imageSize']
+
+        if self.tracingCropMargin is None:
+            crops = [((0, 0) + sourceSize, (0, 0) + resizeTuple)] *\
+                    len(imageColours)
+        else:
+            crops = map(lambda imageColour: getAlignedCropBox(
+                            boundingBoxes[colourLabels[imageColour]],
+                            sourceSize, resizeTuple, self.tracingCropMargin),
+                        imageColours)
+
+        # Only the crop of the mask is upscaled
+        masks = (getLabelMask(labels, colourLabels[imageColour],
+                              boundingBoxes[colourLabels[imageColour]],
+                              cropBox).\
+                 resize((tx2 - tx1, ty2 - ty1), Image.ANTIALIAS)\
+                 for (imageColour, (cropBox, (tx1, ty1, tx2, ty2)))\
+                 in zip(imageColours, crops))
+        tracedImages = self._performTracingBatch(masks,
+                            cropped=self.tracingCropMargin is not None)
+
+        return map(lambda imageColour, tracedImage, crop:\
+                   self._translatePaths(self._parseTracerOutput(tracedImage,
+                                           self._getHTMLColour(imageColour)),
+                                        crop[1][:2]),
+                   imageColours, tracedImages, crops)
+
+    def _getHTMLColour(self, imageColour):
+        """
+        @type  imageColour: C{(int,int,int)} or C{int}
+        @param imageColour: colour tuple in r,g,b format or an index of the
+                            colour
+
+        @rtype: C{str} or C{int}
+        @return: Colour used as a key of
+                 L{imageToStructure<imageToStructure>} mapping.
+        """
         # Note that image colour is provied in form of (r,g,b) tuple
         # and all bar* object use colour in form of html colour denotation:
         # #%x%x%x. Conversion if performed by RGBToHTMLColor.
 
-        # Get binary mask and put it for tracing
-        imageForTracing = self._createMask(sourceImage, imageColour)
-        tracedImage = self._performTracing(imageForTracing)
-
         # Generate html colour denotation: Handle case, when indexed image was
         # provided thus we have a sigle int instead of RGB tuple
         if type(imageColour) == type(0):
-            htmlColour = imageColour
-        else:
-            htmlColour = self.RGBToHTMLColor(imageColour)
-
-        # Append all paths
-        return self._parseTracerOutput(tracedImage, htmlColour)
+            return imageColour
+        return self.RGBToHTMLColor(imageColour)
 
     def _getUniqeColours(self, sourceImage):
         """
@@ -38,6 +38,7 @@ import sys
 import vtk
 import numpy as np
 import nifti
+from vtk.util import numpy_support
 
 from bar.rec.pipeline import barPipeline, VTK_PIPELINE
 
@@ -57,6 +58,9 @@ BAR_RECONSTRUCTOR_VERSION = "ver. 0.2"
 BAR_DEFAULT_RECONSTRUCTION_DIR = '../reconstructions'
 BAR_ATLAS_INDEX_FILENAME = 'index.xml'
 
+# Default memory limit (in MB) of the rasterised slides cache
+BAR_RASTER_CACHE_MEMORY = 256
+
 
 # Defines property of the whole brain outline
 # when it is appended along with regular reconstructions.
@@ -68,34 +72,20 @@ BAR_RENDERER_BACKGROUND = (1.0, 1.0, 1.0)
 
 def VTKtoNumpy(vol):
     """
-    Implemented from:
-    http://public.kitware.com/pipermail/vtkusers/2002-September/062934.html
-    """
-
-    exporter = vtk.vtkImageExport()
-    exporter.SetInput(vol)
-    dims = exporter.GetDataDimensions()
+    Wrap scalars of the vtkImageData as a NumPy array. The memory is shared
+    with the vtkImageData (no copy is made) and the array keeps a reference to
+    the VTK scalars array.
 
-    # Define Numpy data type depending on the vtkImageData scalar type
-    if (exporter.GetDataScalarType() == 3):
-       type = np.uint8
-    if (exporter.GetDataScalarType() == 4):
-       type = np.short
-    if (exporter.GetDataScalarType() == 11):
-       type = np.double
+    @param vol: image data
+    @type vol: vtk.vtkImageData
 
-    # Create empty Numpy array of length equal to size of vtkImage data
-    # then convert it into string and pass the pointer to the beginning of the
-    # string into vtkExporter so the image data could be rewritten to the
-    # string.
-    a = np.zeros(reduce(np.multiply,dims), type)
-    s = a.tostring()
-    exporter.SetExportVoidPointer(s)
-    exporter.Export()
-
-    # Recreate nympy array from the string and return the result.
-    a = np.reshape(np.fromstring(s,type),(dims[2],dims[1],dims[0]))
-    return a
+    @return: array of (z, y, x) shape
+    @rtype: numpy.ndarray
+    """
+    vol.Update()
+    dims = vol.GetDimensions()
+    a = numpy_support.vtk_to_numpy(vol.GetPointData().GetScalars())
+    return a.reshape((dims[2], dims[1], dims[0]))
 
 
 def HTMLColorToRGB(colorstring):
@@ -115,15 +105,17 @@ class dataImporterFromNumpy(vtk.vtkImageImport):
     def __init__(self, structVol):
         # For VTK to be able to use the data, it must be stored as a VTK-image. This can be done by the vtkImageImport-class which
         # imports raw data and stores it.
-        # The preaviusly created array is converted to a string of chars and imported.
+        # VTK expects the x index to change the fastest (Fortran order). If
+        # the volume is already stored that way (as L{VTKStructuredPoints}
+        # does) its memory is shared with VTK, otherwise a single copy is made.
+        # The reference is kept as long as the importer exists, as VTK does
+        # not own the memory.
         volExtent = structVol.size
         volSpacing = structVol.spacing
         volOrigin = structVol.origin
 
-        data_string = structVol.vol.tostring('F')
-        self.CopyImportVoidPointer(data_string, len(data_string))
-
-        del data_string
+        self.__volume = np.asfortranarray(structVol.vol, dtype=np.uint8)
+        self.SetImportVoidPointer(self.__volume, 1)
 
         # The type of the newly imported data is set to unsigned char (uint8)
         self.SetDataScalarTypeToUnsignedChar()
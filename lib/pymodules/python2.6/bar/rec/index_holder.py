@@ -32,6 +32,7 @@ G{importgraph}
 from string import *
 import sys
 import os.path
+import numpy
 
 from bar import barIndexer, barIndexerSlideElement
 from bar.base import flatten
@@ -193,6 +194,17 @@ class barReconstructorIndexer(barIndexer):
         self.structureBoundingBoxes =\
              dict(map(lambda (k,v): (k, v.bbx.boundaries), self.structures.iteritems()))
         
+        # Slide spans (the lowest and the highest slide number) of all
+        # structures as rows of an array; structures not present on any slide
+        # have an empty span (sys.maxint, -1)
+        structureNames = sorted(self.structures.keys())
+        self._structureRows = dict((name, i) for (i, name) in enumerate(structureNames))
+        self._structureSpans = numpy.array([self.structures[x].slideSpan\
+                                            if self.structures[x].slideList\
+                                            else (sys.maxint, -1)\
+                                            for x in structureNames],
+                                           dtype=int).reshape(-1, 2)
+        
         # Initialize easy-and-fast-to-access aliases to slide elements
         # self.s[n] --> slide of index n
         skeys = sorted(self.slides.keys())
@@ -222,6 +234,7 @@ class barReconstructorIndexer(barIndexer):
         @return: None
         """
         map(lambda x: x.defineSpan(), self.s)
+        self._slideSpans = numpy.array([x.span for x in self.s], dtype=float)
         
         # Check if the spacing between slides is constant
         if len(set(map(lambda x: round(x.getThickness(None),5), self.s[1:-1]))) == 1:
@@ -264,7 +277,7 @@ class barReconstructorIndexer(barIndexer):
         topstructure GID -> list of substructures UIDs for C{topStructureID} and
         its child.
         """
-        return self.uidList[topStructureName]
+        return self.hierarchyIntervals.getUidList(topStructureName)
     
     def getHierarchyTree(self, root, depth = 100):
         return self.groups[root].getNameFullNameUid(depth = depth)
@@ -280,7 +293,7 @@ class barReconstructorIndexer(barIndexer):
         element.
         """
         structureList = map(lambda x: self.uidToName[x],\
-                self.groups[HierarchyRootElementName].uidList)
+                self.hierarchyIntervals.getUidList(HierarchyRootElementName))
         return structureList
     
     def getSlidesSpan(self, HierarchyRootElementName):
@@ -292,8 +305,10 @@ class barReconstructorIndexer(barIndexer):
         @return:Returns tuple if integers containing first and last containing
         structures covered by given hierarhy elemnt.
         """
-        structureList = self.getStructureList(HierarchyRootElementName)
-        return self._structList2SlideSpan(structureList)
+        retSpan = self.hierarchyIntervals.getSlideSpan(HierarchyRootElementName)
+        if retSpan == None:
+            retSpan = ("Structure not defined on any slide")
+        return retSpan
     
     def _structList2SlideSpan(self, structuresList, rawIndexes = False):
         """
@@ -306,16 +321,13 @@ class barReconstructorIndexer(barIndexer):
         Function has self explaining name :). Purpose of this function is to
         define slide span (indexes of slides) for set of passed structures.
         """
-        # Initialize results set
-        returnSet = set()
-        
-        # Iterate over all names and for each structure extract slides on which
-        # this structure appears
-        for structureName in structuresList:
-            returnSet |= set(self.structures[structureName].slideSpan)
-        try:
-            retSpan = ( min(returnSet), max(returnSet) )
-        except ValueError:
+        # Reduce precomputed slide spans of all structures from the list
+        rows = [self._structureRows[x] for x in structuresList]
+        spans = self._structureSpans[rows]
+        
+        if len(rows) and spans[:,1].max() >= 0:
+            retSpan = (int(spans[:,0].min()), int(spans[:,1].max()))
+        else:
             retSpan = ("Structure not defined on any slide")
         
         if rawIndexes:
@@ -350,11 +362,10 @@ class barReconstructorIndexer(barIndexer):
             rZcoord = self.s[n[1]].z
             zOrig = min(self.s[n[0]].z, self.s[n[1]].z)
         else:
-            chList = [self.s[n[0]].span[1], self.s[n[0]].span[0],\
-                      self.s[n[1]].span[1], self.s[n[1]].span[0]]
-            zOrig   = min(chList)
-            lZcoord = min(chList)
-            rZcoord = max(chList)
+            chList  = self._slideSpans[[n[0], n[1]]]
+            zOrig   = float(chList.min())
+            lZcoord = float(chList.min())
+            rZcoord = float(chList.max())
         
         # We assume that the origin is located on the point having the lowest
         # coordinates! That is required by the vtkImageData class.
@@ -374,6 +385,58 @@ class barReconstructorIndexer(barIndexer):
         
         return zOrigin, zExtent
     
+    def getSlidesPlanes(self, z):
+        """
+        Assign planes of the reconstructed volume to the slides. A plane is
+        assigned to the slide if its coordinate (rounded to 5 decimal places)
+        lies within the span of the slide.
+        
+        @param z: coordinates of the planes in ascending order
+        @type  z: numpy.ndarray
+        
+        @return: for every slide (in the order of C{self.s}) index of the
+                 first plane assigned to the slide and index following the last
+                 plane assigned to the slide
+        @rtype: (numpy.ndarray, numpy.ndarray)
+        
+        Planes are the same as the ones selected with a mask of rounded
+        differences; planes closer than 5e-6 to the boundary of two slides
+        are assigned to both of them:
+        
+        >>> index = barReconstructorIndexer()
+        >>> index._slideSpans = numpy.array([[0.250006, 0.3],
+        ...                                  [0.149996, 0.250006],
+        ...                                  [0.050004, 0.149996],
+        ...                                  [-0.025, 0.050004]])
+        >>> z = 0.025 * numpy.arange(16) - 0.075
+        >>> (first, last) = index.getSlidesPlanes(z)
+        >>> [range(f, l) for (f, l) in zip(first, last)]
+        [[14, 15], [9, 10, 11, 12, 13], [5, 6, 7, 8, 9], [2, 3, 4, 5]]
+        >>> [numpy.flatnonzero((numpy.round(low - z, 5) <= 0) &
+        ...                    (numpy.round(high - z, 5) >= 0)).tolist()
+        ...  for (low, high) in index._slideSpans]
+        [[14, 15], [9, 10, 11, 12, 13], [5, 6, 7, 8, 9], [2, 3, 4, 5]]
+        """
+        low, high = self._slideSpans[:,0], self._slideSpans[:,1]
+        nPlanes = len(z)
+        if nPlanes == 0:
+            empty = numpy.zeros(len(self._slideSpans), dtype=int)
+            return empty, empty
+        
+        def firstTrue(guess, condition):
+            # Conditions are monotonic along z, so the approximate boundary
+            # found with searchsorted is at most one plane off the exact one.
+            prev = numpy.clip(guess - 1, 0, nPlanes - 1)
+            guess = numpy.where((guess > 0) & condition(prev), guess - 1, guess)
+            curr = numpy.clip(guess, 0, nPlanes - 1)
+            return numpy.where((guess < nPlanes) & ~condition(curr), guess + 1, guess)
+        
+        first = firstTrue(numpy.searchsorted(z, low - 5e-6, side='right'),
+                          lambda i: numpy.round(low - z[i], 5) <= 0)
+        last  = firstTrue(numpy.searchsorted(z, high + 5e-6, side='left'),
+                          lambda i: numpy.round(high - z[i], 5) < 0)
+        return first, numpy.maximum(first, last)
+    
     def getStructuresListBbx(self, structuresList):
         """
         @param structuresList: List of structure names for which global bounding
@@ -33,6 +33,8 @@ import os
 import numpy
 import zipfile
 import tempfile
+import hashlib
+import collections
 import xml.dom.minidom as dom
 
 import bar.rec.index_holder as index_holder
@@ -42,14 +44,31 @@ from bar import barCafSlide
 from bar import barBoundingBox
 
 
-class VTKStructuredPoints():
-    def __init__(self, (nx, ny, nz)):
+class VTKStructuredPoints(object):
+    """
+    Volume of the reconstructed structure.
+
+    Slices put into the volume are stored sparsely: only the part of the slice
+    within its tight bounding box is kept and empty slices are not stored at
+    all. The volume may be cropped to the stored slices (see L{crop}) before
+    the dense volume (L{vol}) is created on the first access, only once.
+
+    @note: Slices are row-major images of (C{size[1]}, C{size[0]}) shape
+           (as returned by L{barSlideRenderer._renderSvgDrawing} for the
+           C{'rec'} protocol) so C{size[0]} is the image width.
+
+    @ivar size: dimensions of the volume (before L{prepareVolume})
+    @type size: (int, int, int)
+    """
+    def __init__(self, (nx, ny, nz), dtype=numpy.uint8):
         # The ugly convertion to int is for the purpose of compatibility with
         # vtk. If casting is not performed, we end up with float64 instead
         # of int.)
-        self.vol = \
-            numpy.zeros(tuple(map(int, (nx, ny, nz))), dtype=numpy.uint8)
-        self.size=self.vol.shape
+        self.size = tuple(map(int, (nx, ny, nz)))
+        self.dtype = dtype
+
+        self.__vol = None
+        self.__slices = {}
 
     def setOrigin(self, (x, y, z)):\
         self.origin=(x, y, z)
@@ -58,12 +77,144 @@ class VTKStructuredPoints():
         self.spacing=(sx, sy, sz)
 
     def setSlices(self, slideIndexList, sliceArray):
-        self.vol[:, :, slideIndexList] = sliceArray
+        if self.__vol is not None:
+            self.__vol[:, :, slideIndexList] = sliceArray
+            return
+
+        image = sliceArray.reshape(self.size[1::-1])
+        ys = numpy.flatnonzero(image.any(axis=1))
+        xs = numpy.flatnonzero(image.any(axis=0))
+
+        if len(xs) == 0:
+            croppedSlice = None
+        else:
+            croppedSlice = (xs[0], ys[0], numpy.array(\
+                    image[ys[0]:ys[-1]+1, xs[0]:xs[-1]+1], dtype=self.dtype))
+
+        # The same slice is shared by all requested planes
+        for z in slideIndexList:
+            if croppedSlice is None:
+                self.__slices.pop(z, None)
+            else:
+                self.__slices[z] = croppedSlice
+
+    def crop(self, (mx, my, mz)):
+        """
+        Crop the volume to the union of bounding boxes of stored slices
+        extended by the margin and shift the origin accordingly. Nothing is
+        done if the dense volume already exists or no slice is stored.
+
+        @param mx: margin (in voxels) along the first axis
+        @type mx: int
+
+        @param my: margin (in voxels) along the second axis
+        @type my: int
+
+        @param mz: margin (in voxels) along the third axis
+        @type mz: int
+
+        Both the sparse volume and the cropped one match the dense volume
+        filled the way it used to be (C{numpy.zeros} and C{swapaxes} in
+        L{prepareVolume}):
+
+        >>> size, origin, spacing = (7, 5, 6), (-1.0, 2.0, 0.5), (0.5, 0.25, 0.1)
+        >>> image = numpy.zeros((5, 7), dtype=numpy.uint8)
+        >>> image[1:3, 2:6] = 255; image[3, 4] = 128
+        >>> shifted = numpy.zeros((5, 7), dtype=numpy.uint8)
+        >>> shifted[2:4, 3:5] = 64
+        >>> slices = [([1, 2], image.reshape(7, 5, 1)),
+        ...           ([3], shifted.reshape(7, 5, 1)),
+        ...           ([4], numpy.zeros((7, 5, 1), dtype=numpy.uint8))]
+        >>> dense = numpy.zeros(size, dtype=numpy.uint8)
+        >>> for (planes, sliceArray) in slices:
+        ...     dense[:, :, planes] = sliceArray
+        >>> dense = numpy.swapaxes(dense, 1, 0)
+        >>> def getVolume(margin):
+        ...     volume = VTKStructuredPoints(size)
+        ...     volume.setOrigin(origin)
+        ...     volume.setSpacing(spacing)
+        ...     for (planes, sliceArray) in slices:
+        ...         volume.setSlices(planes, sliceArray)
+        ...     if margin != None:
+        ...         volume.crop(margin)
+        ...     volume.prepareVolume(None)
+        ...     return volume
+        >>> volume = getVolume(None)
+        >>> volume.size == size, volume.origin == origin
+        (True, True)
+        >>> numpy.array_equal(volume.vol, dense)
+        True
+        >>> volume = getVolume((1, 0, 1))
+        >>> print volume.size, volume.origin
+        (6, 3, 5) (-0.5, 2.25, 0.5)
+        >>> (x0, y0, z0) = [int(round((o - o0) / s)) for (o, o0, s)\\
+        ...                 in zip(volume.origin, origin, spacing)]
+        >>> (nx, ny, nz) = volume.size
+        >>> images = dense.ravel('F').reshape(size[::-1])
+        >>> cropped = volume.vol.ravel('F').reshape((nz, ny, nx))
+        >>> numpy.array_equal(cropped,
+        ...                   images[z0:z0+nz, y0:y0+ny, x0:x0+nx])
+        True
+        >>> int(images.sum()) == int(cropped.sum())
+        True
+        """
+        if self.__vol is not None or not self.__slices:
+            return
+
+        lower = numpy.array([(x, y, z) for (z, (x, y, croppedSlice))\
+                             in self.__slices.iteritems()]).min(axis=0)
+        upper = numpy.array([(x + croppedSlice.shape[1],
+                              y + croppedSlice.shape[0], z + 1)\
+                             for (z, (x, y, croppedSlice))\
+                             in self.__slices.iteritems()]).max(axis=0)
+        lower = numpy.maximum(lower - (mx, my, mz), 0)
+        upper = numpy.minimum(upper + (mx, my, mz), self.size)
+
+        (x0, y0, z0) = map(int, lower)
+        self.__slices = dict((z - z0, (x - x0, y - y0, croppedSlice))\
+                for (z, (x, y, croppedSlice)) in self.__slices.iteritems())
+        self.size = tuple(map(int, upper - lower))
+        self.origin = tuple(o + l * s for (o, l, s)\
+                            in zip(self.origin, lower, self.spacing))
 
     def prepareVolume(self, indexholderReference):
         # Obligatory (required by vtk):
         self.vol= numpy.swapaxes(self.vol, 1,0)
 
+    def __getVolume(self):
+        """
+        Getter for the L{vol} property. Creates the dense volume if necessary.
+        """
+        if self.__vol is None:
+            # Voxels are stored in the order expected by VTK after
+            # L{prepareVolume} (Fortran order), so the volume is passed to VTK
+            # without copying.
+            (nx, ny, nz) = self.size
+            images = numpy.zeros((nz, ny, nx), dtype=self.dtype)
+
+            for (z, (x, y, croppedSlice)) in self.__slices.iteritems():
+                (cy, cx) = croppedSlice.shape
+                images[z, y:y+cy, x:x+cx] = croppedSlice
+            self.__slices = {}
+
+            self.__vol = images.reshape((nz, nx, ny)).transpose(1, 2, 0)
+
+        return self.__vol
+
+    def __setVolume(self, vol):
+        """
+        Setter for the L{vol} property.
+        """
+        self.__vol = vol
+        self.__slices = {}
+
+    vol = property(__getVolume, __setVolume)
+    """
+    The dense volume.
+
+    @type: numpy.ndarray
+    """
+
     def saveVolume(self, filename):
         # create a compressed zip archive instead
         zip = zipfile.ZipFile(filename, mode="w", compression=zipfile.ZIP_DEFLATED)
@@ -100,14 +251,303 @@ class VTKStructuredPoints():
         return result
 
 
+class slideRasterCache(object):
+    """
+    Least recently used cache of rasterised CAF slide structures.
+
+    Every structure of every slide is rendered (according to reconstruction
+    module requirements) separately and stored as a binary mask keyed by the
+    slide, the rendering size, the bounding box and the flipping flags. A volume
+    slice of any set of structures is then a union of cached masks, so slides
+    are neither parsed nor rendered again when the same slide is required by
+    different reconstructions. As paths are rendered with crisp edges the union
+    is identical to the rendering of the whole structure subset.
+
+    Masks are packed (one bit per pixel) and kept in memory until
+    L{maxMemory} is exceeded; then the least recently used ones are dropped.
+    If L{cacheDirectory} is given, masks are also stored on the disk and are
+    reused by subsequent reconstructions (also by other processes).
+
+    @cvar clsSlide: class of the loaded slides
+    @type clsSlide: class
+
+    @ivar maxMemory: maximum size (in bytes) of masks held in memory
+    @type maxMemory: int
+
+    @ivar cacheDirectory: directory for masks stored on the disk or C{None}
+    @type cacheDirectory: str
+
+    @ivar hits: number of masks found in the cache
+    @type hits: int
+
+    @ivar misses: number of masks which had to be rendered
+    @type misses: int
+    """
+    clsSlide = barCafSlide
+
+    def __init__(self, maxMemory = 256 * 1024 ** 2, cacheDirectory = None):
+        """
+        @param maxMemory: C{self.L{maxMemory}} value
+        @type maxMemory: int
+
+        @param cacheDirectory: C{self.L{cacheDirectory}} value; created if
+                               does not exist
+        @type cacheDirectory: str
+        """
+        self.maxMemory = maxMemory
+        self.cacheDirectory = cacheDirectory
+        if cacheDirectory != None and not os.path.isdir(cacheDirectory):
+            os.makedirs(cacheDirectory)
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__masks = {}
+        self.__lastUse = {}
+        self.__order = collections.deque()
+        self.__clock = 0
+        self.__memory = 0
+        self.__slideStructures = {}
+
+    def getVolumeSlice(self, slideFilename, structureNames,
+                       renderingSize, boundingBox, otype):
+        """
+        Compose volume slice of given structures from cached masks rendering
+        and caching missing ones.
+
+        @param slideFilename: path to the CAF slide
+        @type slideFilename: str
+
+        @param structureNames: names of structures to be included in the slice
+        @type structureNames: [str, ...]
+
+        @param renderingSize: dimensions (in pixels) of the rendered slide
+        @type renderingSize: (float, float)
+
+        @param boundingBox: cropping coordinates (left, top, right, bottom)
+        @type boundingBox: (float, float, float, float)
+
+        @param otype: C{'rec'} rendering protocol with optional flipping flags
+
+        @return: volume slice; the same as returned by
+                 L{barSlideRenderer._renderSvgDrawing} for the C{'rec'} protocol
+        @rtype: numpy.ndarray
+        """
+        x1, y1, x2, y2 = map(int, boundingBox)
+        shape = (x2 - x1, y2 - y1)
+        key = self.__getKey(slideFilename, renderingSize, boundingBox, otype)
+
+        slide = None
+        slideStructures = self.__slideStructures.get(key)
+        if slideStructures == None:
+            slideStructures = self.__loadStructureNames(key)
+        if slideStructures == None:
+            slide = self.clsSlide.fromXML(slideFilename)
+            slideStructures = self.__storeStructureNames(key,
+                                  map(lambda x: x.name, slide.values()))
+
+        volumeSlice = self.__getBackground(renderingSize, boundingBox, otype)
+        for name in set(structureNames) & slideStructures:
+            mask = self.__getMask(key, name, shape)
+            if mask is None:
+                if slide == None:
+                    slide = self.clsSlide.fromXML(slideFilename)
+                mask = self.__renderMask(slide, name, renderingSize,
+                                         boundingBox, otype)
+                self.__storeMask(key, name, mask)
+            volumeSlice |= mask
+
+        return (volumeSlice.astype(numpy.uint8) * 255).reshape(shape + (1,))
+
+    def clear(self):
+        """
+        Remove all masks held in memory. Masks stored on the disk are preserved.
+        """
+        self.__masks = {}
+        self.__lastUse = {}
+        self.__order = collections.deque()
+        self.__clock = 0
+        self.__memory = 0
+        self.__slideStructures = {}
+
+    def __getKey(self, slideFilename, renderingSize, boundingBox, otype):
+        """
+        @return: digest identifying the rendering of given slide; modification
+                 time of the slide file is included so outdated masks are
+                 never used.
+        @rtype: str
+        """
+        slideFilename = os.path.abspath(slideFilename)
+        key = (slideFilename, os.path.getmtime(slideFilename),
+               tuple(map(float, renderingSize)),
+               tuple(map(float, boundingBox)), otype)
+        return hashlib.md5(repr(key)).hexdigest()
+
+    def __getBackground(self, renderingSize, boundingBox, otype):
+        """
+        @return: binary volume slice of an empty slide (parts of the bounding
+                 box outside the rendered slide are set)
+        @rtype: numpy.ndarray
+        """
+        width, height = map(int, renderingSize)
+        # A single transparent pixel "stretched" over the whole slide
+        emptySlide = numpy.lib.stride_tricks.as_strided(
+                         numpy.zeros(4, dtype=numpy.uint8),
+                         shape = (height, width, 4), strides = (0, 0, 1))
+        volumeSlice = barCafSlide._getVolumeSlice(emptySlide, boundingBox, otype)
+        return volumeSlice[:, :, 0] > 127
+
+    def __renderMask(self, slide, structureName,
+                     renderingSize, boundingBox, otype):
+        """
+        @return: binary volume slice of a single structure
+        @rtype: numpy.ndarray
+        """
+        self.misses += 1
+        maskedSlide = slide.getStructuresSubset([structureName])
+        map(lambda x: setattr(x, 'crispEdges', True), maskedSlide.values())
+        maskedSlide.getMask()
+
+        volumeSlice = maskedSlide._renderSvgDrawing(\
+                                maskedSlide.getXMLelement(),
+                                renderingSize=renderingSize,
+                                boundingBox=boundingBox,
+                                otype=otype)
+        return volumeSlice[:, :, 0] > 127
+
+    def __getMask(self, key, structureName, shape):
+        """
+        @return: cached binary mask of the structure or C{None} if not cached
+        @rtype: numpy.ndarray
+        """
+        packed = self.__masks.get((key, structureName))
+        if packed is not None:
+            self.__touch((key, structureName))
+
+        elif self.cacheDirectory != None:
+            filename = self.__getFilename(key, structureName + '.npy')
+            if os.path.exists(filename):
+                packed = numpy.load(filename)
+                self.__putMask(key, structureName, packed)
+
+        if packed is None:
+            return None
+
+        self.hits += 1
+        size = shape[0] * shape[1]
+        return numpy.unpackbits(packed)[:size].reshape(shape).astype(bool)
+
+    def __storeMask(self, key, structureName, mask):
+        """
+        Put binary mask of the structure into the cache.
+        """
+        packed = numpy.packbits(mask.ravel())
+        self.__putMask(key, structureName, packed)
+
+        if self.cacheDirectory != None:
+            self.__writeFile(self.__getFilename(key, structureName + '.npy'),
+                             lambda fh: numpy.save(fh, packed))
+
+    def __putMask(self, key, structureName, packed):
+        """
+        Put packed mask into memory dropping the least recently used masks
+        if necessary.
+        """
+        self.__masks[(key, structureName)] = packed
+        self.__touch((key, structureName))
+        self.__memory += packed.nbytes
+
+        while self.__memory > self.maxMemory and len(self.__masks) > 1:
+            (used, item) = self.__order.popleft()
+            # skip outdated entries of masks used again later (or dropped)
+            if self.__lastUse.get(item) != used:
+                continue
+
+            del self.__lastUse[item]
+            dropped = self.__masks.pop(item)
+            self.__memory -= dropped.nbytes
+
+    def __touch(self, item):
+        """
+        Mark the mask as the most recently used one.
+
+        The usage order is a queue of (time of use, mask) entries; entries
+        outdated by subsequent uses of masks are left in the queue (and
+        skipped when masks are dropped) until they dominate it.
+        """
+        self.__clock += 1
+        self.__lastUse[item] = self.__clock
+        self.__order.append((self.__clock, item))
+
+        if len(self.__order) > 2 * len(self.__lastUse) + 16:
+            self.__order = collections.deque((used, x)\
+                    for (used, x) in self.__order if self.__lastUse.get(x) == used)
+
+    def __loadStructureNames(self, key):
+        """
+        @return: names of structures defined in the slide read from the disk
+                 or C{None} if not cached
+        @rtype: set([str, ...])
+        """
+        if self.cacheDirectory == None:
+            return None
+
+        filename = self.__getFilename(key, 'txt')
+        if not os.path.exists(filename):
+            return None
+
+        names = open(filename).read().split()
+        self.__slideStructures[key] = set(names)
+        return self.__slideStructures[key]
+
+    def __storeStructureNames(self, key, names):
+        """
+        Put names of structures defined in the slide into the cache.
+
+        @rtype: set([str, ...])
+        """
+        self.__slideStructures[key] = set(names)
+        if self.cacheDirectory != None:
+            self.__writeFile(self.__getFilename(key, 'txt'),
+                             lambda fh: fh.write('\n'.join(sorted(names))))
+        return self.__slideStructures[key]
+
+    def __getFilename(self, key, suffix):
+        return os.path.join(self.cacheDirectory, "%s_%s" % (key, suffix))
+
+    def __writeFile(self, filename, writer):
+        """
+        Write file using temporary file so concurrent reconstructions never
+        read incomplete data.
+        """
+        (fh, tmpFilename) = tempfile.mkstemp(dir=self.cacheDirectory)
+        fh = os.fdopen(fh, 'wb')
+        writer(fh)
+        fh.close()
+        os.rename(tmpFilename, filename)
+
+
 class structureHolder():
     """
     Main class for generating and processing slides.
+
+    @ivar LabelledVol: labelled volume of all structures of the atlas (see
+                       L{handleLabelledVolumeGeneration}) or C{None}
+    @type LabelledVol: L{VTKStructuredPoints}
+
+    @ivar labelMapping: structure name to label (in L{LabelledVol}) mapping
+    @type labelMapping: {str : int, ...}
     """
     clsIndexHolder = index_holder.barReconstructorIndexer
     clsSlide = barCafSlide
 
-    def __init__(self, indexFilename, tracedFilesDirectory):
+    def __init__(self, indexFilename, tracedFilesDirectory, rasterCache = None):
+        """
+        @param rasterCache: cache of rasterised slides shared between
+                            reconstructions; if C{None} every slide is loaded
+                            and rendered for every reconstruction
+        @type rasterCache: L{slideRasterCache}
+        """
 
         self.ih = self.clsIndexHolder.fromXML(indexFilename)
         self.tracedFilesDirectory =\
@@ -120,12 +560,17 @@ class structureHolder():
 
         self.recSettings = {}
         self.StructVol = None
+        self.rasterCache = rasterCache
+        self.LabelledVol = None
+        self.labelMapping = {}
 
-    def __initializeVolume(self):
+    def __initializeVolume(self, dtype=numpy.uint8):
         """
         Calculates dimenstions, allocates memory of volume and creates
         vtkStructure for managing defined volume.
 
+        @param dtype: type of volume elements
+
         @return: None.
         """
         zExtent = self.recSettings['zExtent']
@@ -136,7 +581,7 @@ class structureHolder():
         print >>sys.stderr, "\tDimensions: (%d, %d, %d)" % volumeDimensions
 
         # Create class for managing defined volume
-        self.StructVol = VTKStructuredPoints(volumeDimensions)
+        self.StructVol = VTKStructuredPoints(volumeDimensions, dtype)
 
         # Define origin and spacing for created volume
         origin, spacing = self.__defineOriginAndSpacing()
@@ -266,7 +711,7 @@ class structureHolder():
 
         return (origin, spacing)
 
-    def __processModelGeneration(self):
+    def __processModelGeneration(self, labelled = False):
         """
         Performs all operation related to rasterizing slides and
         putting this rasterized data into volume:
@@ -275,9 +720,17 @@ class structureHolder():
             2. Define indexes of slides that will be parsed
             3. Parse all slides one by one
 
+        @param labelled: if C{True}, labelled uint16 volume of all structures
+                         is generated instead of the structure mask
+
         @return: None
         """
-        self.__initializeVolume()
+        if labelled:
+            self.__initializeVolume(numpy.uint16)
+            processSlide = self.__processLabelledSlide
+        else:
+            self.__initializeVolume()
+            processSlide = self.__processSingleSlide
 
         self.tempCentralPlanes = []   # For collecting central planes indexes
 
@@ -289,19 +742,20 @@ class structureHolder():
         ez = self.StructVol.size[2]
         sz = self.StructVol.spacing[2]
 
-        z = numpy.array(map(lambda x: sz*(x) + Oz, range(0, ez)))
-        zi= numpy.array(range(0, ez))
+        z = sz*numpy.arange(ez) + Oz
+        (firstPlanes, lastPlanes) = self.ih.getSlidesPlanes(z)
 
         slidePlanes = {}
-        for s in map(lambda x: self.ih.s[x], slideNumbersRange):
-            mask = (0>=numpy.round(s.span[0]-z,5)) & (0<=numpy.round(s.span[1]-z,5))
-            slidePlanes[s.name] = (list(zi[mask]), list(z[mask]))
+        for i in slideNumbersRange:
+            (first, last) = (int(firstPlanes[i]), int(lastPlanes[i]))
+            slidePlanes[self.ih.s[i].name] =\
+                    (range(first, last), list(z[first:last]))
 
         self.recSettings['FlipFlags'] = self.__getFlips()
 
         for (slideNo, (planes,coor)) in slidePlanes.iteritems():
             if planes:
-                self.__processSingleSlide(slideNo, (planes,coor))
+                processSlide(slideNo, (planes,coor))
 
     def __processSingleSlide(self, slideNumber, (planes,coor)):
         print "Processing slide number:\t%d" % slideNumber
@@ -316,16 +770,52 @@ class structureHolder():
         bbo = self.recSettings['BoundingBox']
         otype = self.recSettings['FlipFlags']
 
-        maskedSlide = self._loadSlide(slideNumber, structuresToInclude, version=0)
-        maskedSlide.getMask()
+        if self.rasterCache != None:
+            volumeFromOneSlice = self.rasterCache.getVolumeSlice(\
+                                self.tracedFilesDirectory % (slideNumber, 0),
+                                structuresToInclude, fpd, bbo, otype)
+        else:
+            maskedSlide = self._loadSlide(slideNumber, structuresToInclude, version=0)
+            maskedSlide.getMask()
 
-        volumeFromOneSlice = maskedSlide._renderSvgDrawing(\
-                                maskedSlide.getXMLelement(),
+            volumeFromOneSlice = maskedSlide._renderSvgDrawing(\
+                                    maskedSlide.getXMLelement(),
+                                    renderingSize=fpd,
+                                    boundingBox=bbo,
+                                    otype=otype)
+
+        self.StructVol.setSlices(planes, volumeFromOneSlice)
+
+    def __processLabelledSlide(self, slideNumber, (planes,coor)):
+        print "Processing slide number:\t%d" % slideNumber
+
+        fpd = self.recSettings['ScaledImageSize']
+        bbo = self.recSettings['BoundingBox']
+        otype = 'lbl' + self.recSettings['FlipFlags'][3:]
+        labels = self.recSettings['Labels']
+
+        # Every structure is painted with colour encoding its label. Structures
+        # not included in the mapping are painted black (label 0). Subset of
+        # all structures is taken to get rid of slide labels.
+        testslide = self.clsSlide.fromXML(\
+                self.tracedFilesDirectory % (slideNumber, 0))
+        labelledSlide = testslide.getStructuresSubset(\
+                map(lambda x: x.name, testslide.values()))
+        for structure in labelledSlide.values():
+            structure.crispEdges = True
+            structure.color = '#%06x' % labels.get(structure.name, 0)
+
+        labelsFromOneSlice = labelledSlide._renderSvgDrawing(\
+                                labelledSlide.getXMLelement(),
                                 renderingSize=fpd,
                                 boundingBox=bbo,
                                 otype=otype)
 
-        self.StructVol.setSlices(planes, volumeFromOneSlice)
+        # Colours which are not label codes (e.g. elements of the slide
+        # template) would not fit the volume nor lookup tables of labels
+        labelsFromOneSlice[labelsFromOneSlice > len(labels)] = 0
+
+        self.StructVol.setSlices(planes, labelsFromOneSlice)
 
     def _loadSlide(self, slideNumber, structuresToInclude = None, version = 0):
         tracedSlideFilename = self.tracedFilesDirectory % (slideNumber,version)
@@ -440,6 +930,107 @@ class structureHolder():
         self.__initModelGeneration(xyRes, ignoreBbx = ignoreBoundingBox)
         self.__processModelGeneration()
 
+        # The same margins as the ones of the volume defined for the structure;
+        # volumes generated with ignoreBoundingBox keep their size and origin
+        if not ignoreBoundingBox:
+            self.StructVol.crop((1, 1, VolumeMargin))
+
+    def handleLabelledVolumeGeneration(self, xyRes, zRes, VolumeMargin = 10):
+        """
+        Generate L{LabelledVol} - a single uint16 volume of all structures
+        of the atlas in one sweep over slides. Every voxel holds the label of
+        the structure (see L{labelMapping}) or 0 if the voxel does not belong
+        to any structure. Where structures overlap, the topmost one (in the
+        slide rendering order) is labelled: paths are drawn in the order of
+        L{barTracedSlide.getXMLelement<bar.base.barTracedSlide.getXMLelement>},
+        i.e. paths of the C{vBrain} structure at the bottom, then the other
+        paths sorted by their ids.
+
+        The volume spans the bounding box of the hierarchy root element, so
+        masks of any structure (see L{getLabelledStructureVolume}) have the
+        same size and origin as the ones generated by
+        L{handleAllModelGeneration} with C{ignoreBoundingBox = True}.
+
+        @param xyRes: voxel size in the coronal plane
+        @type xyRes: float
+
+        @param zRes: voxel size along anterior-posterior axis
+        @type zRes: float
+
+        @param VolumeMargin: margin added to the volume in z axis
+        @type VolumeMargin: int
+        """
+        self.__flushCache()
+        self.recSettings['zRes']    = zRes
+        self.recSettings['zMargin'] = VolumeMargin
+        rootElementName = self.ih.hierarchyRootElementName
+        self.__getStructureList(rootElementName, ignoreBbx = True)
+        self.__initModelGeneration(xyRes, ignoreBbx = True)
+
+        structures = sorted(set(self.recSettings['StructuresList']))
+        if len(structures) > numpy.iinfo(numpy.uint16).max:
+            raise ValueError, "Too many structures for uint16 labelled volume."
+        self.labelMapping = dict((name, label + 1) for (label, name)\
+                                  in enumerate(structures))
+        self.recSettings['Labels'] = self.labelMapping
+
+        self.__processModelGeneration(labelled = True)
+        self.LabelledVol = self.StructVol
+
+    def getLabelledStructureVolume(self, rootElementName):
+        """
+        Extract the mask of the hierarchy subtree from L{LabelledVol}.
+
+        @param rootElementName: name of the root element of the subtree
+        @type rootElementName: str
+
+        @return: volume of the structure (255 for voxels of the structure,
+                 0 otherwise)
+        @rtype: L{VTKStructuredPoints}
+        """
+        labels = [self.labelMapping[name] for name in\
+                  self.ih.getStructureList(rootElementName)\
+                  if name in self.labelMapping]
+
+        lookupTable = numpy.zeros(len(self.labelMapping) + 1, dtype=numpy.uint8)
+        lookupTable[labels] = 255
+
+        # Slice by slice in order to avoid large temporary arrays
+        volume = VTKStructuredPoints(self.LabelledVol.size)
+        volume.setOrigin(self.LabelledVol.origin)
+        volume.setSpacing(self.LabelledVol.spacing)
+        for z in xrange(volume.size[2]):
+            volume.setSlices([z], lookupTable[self.LabelledVol.vol[:, :, z]])
+        return volume
+
+    def estimateVolumeSize(self,\
+            rootElementName,\
+            xyRes, zRes,\
+            VolumeMargin = 10,\
+            ignoreBoundingBox = False):
+        """
+        Calculate the number of voxels of the volume which would be generated
+        by L{handleAllModelGeneration} called with the same arguments. No slide
+        is rendered.
+
+        @note: Unless C{ignoreBoundingBox} is set, the generated volume is
+               cropped to the rendered slices (see L{VTKStructuredPoints.crop})
+               so the returned number is the upper bound of its size.
+
+        @return: number of voxels of the volume
+        @rtype: int
+        """
+        self.__flushCache()
+        self.recSettings['zRes']    = zRes
+        self.recSettings['zMargin'] = VolumeMargin
+        self.__getStructureList(rootElementName, ignoreBbx = ignoreBoundingBox)
+        self.__initModelGeneration(xyRes, ignoreBbx = ignoreBoundingBox)
+
+        dm = self.recSettings['CroppedImageSize']
+        size = int(dm[0]) * int(dm[1]) * int(self.recSettings['zExtent'])
+        self.__flushCache()
+        return size
+
     def getSlidesSpan(self, rootElementName):
         return self.ih.getSlidesSpan(rootElementName)
 
@@ -57,7 +57,7 @@ import numpy as np
 import sys
 from string import *
 from defaults import *
-from svgpathparse import parsePath, UnparsePath
+from svgpathparse import parsePathArrays, formatPathArrays
 
 def getTransformMatrix(tr):
     """
@@ -388,12 +388,9 @@ def __fixPathDefinition(pathDefinition, cm):
 
     @return: path difinition transformed using cm matrix
     """
-
-    pathPoints = parsePath(pathDefinition)
-    for i in range(len(pathPoints)):
-        for j in [j for j in range(0, len(pathPoints[i][1:][0]), 2)]:
-            pathPoints[i][1:][0][j:j+2] = __transformPoint(pathPoints[i][1:][0][j:j+2], cm)
-    return UnparsePath(pathPoints)
+    commands, parameters = parsePathArrays(pathDefinition)
+    parameters = transformPathArrays([(commands, parameters)], cm)[0]
+    return formatPathArrays(commands, parameters)
 
 def __transformPoint(point,matrix):
     """
@@ -491,6 +488,53 @@ def transformPoint(point,matrix):
     """
     return tuple(__transformPoint(point,matrix))
 
+def transformPoints(points, matrix):
+    """
+    @type   points: NumPy array
+    @param  points: Array of shape (n, 2) holding coordinates of n points.
+    @type  matrix: NumPy array 3x3
+    @param matrix: Transformation matrix to be applied.
+    @return      : Array of shape (n, 2) of transformated coordinates.
+
+    Vectorised counterpart of L{transformPoint}: all points are transformed
+    with a single matrix multiplication.
+
+    Examples:
+        >>> transformPoints(np.array([[1., 2.], [3., 4.]]),
+        ...                 np.array([[2., 0., 1.], [0., 3., -1.], [0., 0., 1.]])).tolist()
+        [[3.0, 5.0], [7.0, 11.0]]
+    """
+    return np.dot(points, matrix[:2, :2].T) + matrix[:2, 2]
+
+def transformPathArrays(pathArrays, matrix):
+    """
+    @type  pathArrays: list
+    @param pathArrays: List of (commands, parameters) pairs of paths as
+                       returned by L{parsePathArrays<svgpathparse.parsePathArrays>}.
+    @type  matrix: NumPy array 3x3
+    @param matrix: Transformation matrix to be applied.
+    @return      : List of transformed parameter arrays (one array per path).
+
+    Parameters of all paths are concatenated and transformed with a single
+    matrix multiplication (see L{transformPoints}). Commands are not
+    changed.
+
+    @note: Elliptical arcs cannot be transformed this way thus ValueError is
+           raised when any of paths contains C{A} command.
+    """
+    if not pathArrays:
+        return []
+
+    commands = np.concatenate([c for (c, p) in pathArrays])
+    if np.any(commands == 'A'):
+        raise ValueError, "Elliptical arcs cannot be transformed."
+
+    parameters = np.concatenate([p for (c, p) in pathArrays])
+    parameters = transformPoints(parameters.reshape(-1, 2), matrix).ravel()
+
+    splitPoints = np.cumsum([len(p) for (c, p) in pathArrays])[:-1]
+    return np.split(parameters, splitPoints)
+
 def fixSvgImage(svgdoc, pagenumber=None, fixHeader=True):
     """
     @type  svgdoc: DOM object
@@ -52,34 +52,28 @@ import numpy as np
 
 
 
+# Single path data token: command, parameter, delimiter or invalid character
+re_PathToken = re.compile(r'([MLHVCSQTAZmlhvcsqtaz])|' +\
+                          r'((?:[-+]?[0-9]+(?:\.[0-9]*)?|[-+]?\.[0-9]+)(?:[eE][-+]?[0-9]+)?)|' +\
+                          r'[ \t\r\n,]+|(.)', re.S)
+re_PathCommand   = re.compile(r'([MLHVCSQTAZmlhvcsqtaz])')
+re_PathParameter = re.compile(r'(?:[-+]?[0-9]+(?:\.[0-9]*)?|[-+]?\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+re_PathDelimiter = re.compile(r'[ \t\r\n,]+')
+
 def lexPath(d):
     """
     returns and iterator that breaks path data
     identifies command and parameter tokens
     """
-    offset = 0
-    length = len(d)
-    delim = re.compile(r'[ \t\r\n,]+')
-    command = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
-    parameter = re.compile(r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
-    while 1:
-        m = delim.match(d, offset)
-        if m:
-            offset = m.end()
-        if offset >= length:
-            break
-        m = command.match(d, offset)
-        if m:
-            yield [d[offset:m.end()], True]
-            offset = m.end()
-            continue
-        m = parameter.match(d, offset)
-        if m:
-            yield [d[offset:m.end()], False]
-            offset = m.end()
-            continue
-        #TODO: create new exception
-        raise Exception, 'Invalid path data: "%s" .' % d
+    for m in re_PathToken.finditer(d):
+        command, parameter, invalid = m.groups()
+        if command:
+            yield [command, True]
+        elif parameter:
+            yield [parameter, False]
+        elif invalid:
+            #TODO: create new exception
+            raise Exception, 'Invalid path data: "%s" .' % d
 
 
 '''
@@ -105,6 +99,184 @@ pathdefs = {
     'Z':['L', 0, [], []]
     }
 
+# Number of parameters of commands of parsed paths
+PATH_COMMAND_PARAMETERS = {'M': 2, 'L': 2, 'C': 6, 'Q': 4, 'A': 7, 'Z': 0}
+
+# Templates of commands of parsed paths used by L{formatPathArrays}
+PATH_COMMAND_TEMPLATES = {'M': 'M%s,%s ',
+                          'L': 'L%s,%s ',
+                          'C': 'C%s,%s,%s,%s,%s,%s ',
+                          'Q': 'Q%s,%s,%s,%s ',
+                          'A': 'A%s,%s,%s,%d,%d,%s,%s ',
+                          'Z': 'Z '}
+
+def _lexPathParameters(parameters):
+    """
+    @type  parameters: str
+    @param parameters: fragment of path data between two commands
+
+    @return: parameter tokens of the fragment (preceding the first invalid
+             character) and information if the fragment is valid
+    @rtype: ([str, ...], bool)
+    """
+    tokens = re_PathParameter.findall(parameters)
+    if len(re_PathDelimiter.sub('', parameters)) == sum(map(len, tokens)):
+        return (tokens, True)
+
+    tokens = []
+    for m in re_PathToken.finditer(parameters):
+        command, parameter, invalid = m.groups()
+        if invalid:
+            break
+        if parameter:
+            tokens.append(parameter)
+    return (tokens, False)
+
+def parsePathArrays(d):
+    """
+    Parse SVG path and return arrays of commands and their parameters.
+    Array counterpart of L{parsePath}: shorthand notation is removed and
+    coordinates are converted to absolute in exactly the same way (the same
+    exceptions are raised for invalid paths). Every command is followed by
+    L{PATH_COMMAND_PARAMETERS} parameters; flags of elliptical arcs are
+    stored as floats.
+
+    >>> commands, parameters = parsePathArrays('m 10,20 20,0 c 1,1 2,2 3,3 1,1 2,2 3,3 z')
+    >>> print commands.tolist()
+    ['M', 'L', 'C', 'C', 'Z']
+    >>> print parameters.tolist()
+    [10.0, 20.0, 30.0, 20.0, 31.0, 21.0, 32.0, 22.0, 33.0, 23.0, 34.0, 24.0, 35.0, 25.0, 36.0, 26.0]
+
+    @type  d: str
+    @param d: path definition according to SVG 1.1 specification
+
+    @return: commands (array of one character strings) and their parameters
+             (flat array of floats)
+    @rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    parts = re_PathCommand.split(d)
+
+    # Only delimiters are allowed before the first command
+    initial = parts[0].lstrip(' \t\r\n,')
+    if re_PathParameter.match(initial):
+        raise Exception, 'Invalid path, no initial command.'
+    if initial:
+        raise Exception, 'Invalid path data: "%s" .' % d
+    if len(parts) > 1 and parts[1].upper() != 'M':
+        raise Exception, 'Invalid path, must begin with moveto.'
+
+    commands = []
+    parameters = []
+
+    pen = (0.0,0.0)
+    subPathStart = pen
+    lastControl = pen
+    lastGroup = len(parts) // 2 - 1
+
+    for group in xrange(lastGroup + 1):
+        command = parts[2 * group + 1]
+        tokens, valid = _lexPathParameters(parts[2 * group + 2])
+        family = command.upper()
+
+        if family == 'Z':
+            commands.append('Z')
+            pen = subPathStart
+            lastControl = pen
+            if not tokens:
+                if not valid:
+                    raise Exception, 'Invalid path data: "%s" .' % d
+                continue
+
+            # Parameters following closepath belong to its implicit next
+            # command
+            if command.islower():
+                command = pathdefs['Z'][0].lower()
+            else:
+                command = pathdefs['Z'][0]
+            family = command.upper()
+
+        implicit, numParams, casts, coordTypes = pathdefs[family]
+        if family == 'A':
+            values = [casts[i % numParams](token)\
+                      for (i, token) in enumerate(tokens)]
+        else:
+            values = map(float, tokens)
+
+        if not valid:
+            raise Exception, 'Invalid path data: "%s" .' % d
+        if len(values) == 0 or len(values) % numParams:
+            if group < lastGroup:
+                raise Exception, 'Invalid number of parameters'
+            raise Exception, 'Unexpected end of path'
+
+        numSegments = len(values) // numParams
+        relative = command.islower()
+
+        if family in ('M', 'L', 'C', 'Q'):
+            # All segments of the command are converted at once: the pen
+            # moves to ends of consecutive segments.
+            if relative and numSegments == 1:
+                values = [x + pen[i % 2] for (i, x) in enumerate(values)]
+            elif relative:
+                # Overflows are silent, as in the case of Python floats
+                with np.errstate(all='ignore'):
+                    values = np.array(values).reshape(numSegments, numParams)
+                    pens = np.cumsum(np.vstack((pen, values[:, -2:])), axis=0)
+                    values += np.tile(pens[:-1], numParams // 2)
+                values = values.ravel().tolist()
+
+            if family == 'M':
+                subPathStart = tuple(values[:2])
+                commands.extend(['M'] + [implicit] * (numSegments - 1))
+            else:
+                commands.extend([family] * numSegments)
+            parameters.extend(values)
+
+            #current values become "last" values
+            pen = tuple(values[-2:])
+            if family in ('Q', 'C'):
+                lastControl = tuple(values[-4:-2])
+            else:
+                lastControl = pen
+            continue
+
+        for segment in xrange(numSegments):
+            params = values[segment * numParams:(segment + 1) * numParams]
+            if relative:
+                for (i, coordType) in enumerate(coordTypes):
+                    if coordType == 'x':
+                        params[i] += pen[0]
+                    elif coordType == 'y':
+                        params[i] += pen[1]
+            outputCommand = family
+
+            #Flesh out shortcut notation
+            if outputCommand in ('H','V'):
+                if outputCommand == 'H':
+                    params.append(pen[1])
+                if outputCommand == 'V':
+                    params.insert(0,pen[0])
+                outputCommand = 'L'
+            if outputCommand in ('S','T'):
+                params.insert(0,pen[1]+(pen[1]-lastControl[1]))
+                params.insert(0,pen[0]+(pen[0]-lastControl[0]))
+                if outputCommand == 'S':
+                    outputCommand = 'C'
+                if outputCommand == 'T':
+                    outputCommand = 'Q'
+
+            #current values become "last" values
+            pen = tuple(params[-2:])
+            if outputCommand in ('Q','C'):
+                lastControl = tuple(params[-4:-2])
+            else:
+                lastControl = pen
+
+            commands.append(outputCommand)
+            parameters.extend(params)
+
+    return (np.array(commands, dtype='S1'), np.array(parameters, dtype=float))
+
 def parsePath(d):
     """
     Parse SVG path and return an array of segments.
@@ -129,90 +301,41 @@ def parsePath(d):
     >>> print parsePath('M 1000 1000 s100 200 10 10')
     [['M', [1000.0, 1000.0]], ['C', [1000.0, 1000.0, 1100.0, 1200.0, 1010.0, 1010.0]]]
     """
+    commands, parameters = parsePathArrays(d)
+    parameters = parameters.tolist()
+
     retval = []
-    lexer = lexPath(d)
+    offset = 0
+    for command in commands.tolist():
+        numParams = PATH_COMMAND_PARAMETERS[command]
+        params = parameters[offset:offset + numParams]
+        if command == 'A':
+            params[3:5] = map(int, params[3:5])
+        retval.append([command, params])
+        offset += numParams
+    return retval
 
-    pen = (0.0,0.0)
-    subPathStart = pen
-    lastControl = pen
-    lastCommand = ''
+def formatPathArrays(commands, parameters):
+    """
+    Creates string from L{parsePathArrays} function output. The string is the
+    same as the one created by L{UnparsePath} from corresponding
+    L{parsePath} output.
 
-    while 1:
-        try:
-            token, isCommand = lexer.next()
-        except StopIteration:
-            break
-        params = []
-        needParam = True
-        if isCommand:
-            if not lastCommand and token.upper() != 'M':
-                raise Exception, 'Invalid path, must begin with moveto.'
-            else:
-                command = token
-        else:
-            #command was omitted
-            #use last command's implicit next command
-            needParam = False
-            if lastCommand:
-                if lastCommand.isupper():
-                    command = pathdefs[lastCommand.upper()][0]
-                else:
-                    command = pathdefs[lastCommand.upper()][0].lower()
-            else:
-                raise Exception, 'Invalid path, no initial command.'
-        numParams = pathdefs[command.upper()][1]
-        while numParams > 0:
-            if needParam:
-                try:
-                    token, isCommand = lexer.next()
-                    if isCommand:
-                        raise Exception, 'Invalid number of parameters'
-                except StopIteration:
-                                raise Exception, 'Unexpected end of path'
-            cast = pathdefs[command.upper()][2][-numParams]
-            param = cast(token)
-            if command.islower():
-                if pathdefs[command.upper()][3][-numParams]=='x':
-                    param += pen[0]
-                elif pathdefs[command.upper()][3][-numParams]=='y':
-                    param += pen[1]
-            params.append(param)
-            needParam = True
-            numParams -= 1
-        #segment is now absolute so
-        outputCommand = command.upper()
-
-        #Flesh out shortcut notation
-        if outputCommand in ('H','V'):
-            if outputCommand == 'H':
-                params.append(pen[1])
-            if outputCommand == 'V':
-                params.insert(0,pen[0])
-            outputCommand = 'L'
-        if outputCommand in ('S','T'):
-            params.insert(0,pen[1]+(pen[1]-lastControl[1]))
-            params.insert(0,pen[0]+(pen[0]-lastControl[0]))
-            if outputCommand == 'S':
-                outputCommand = 'C'
-            if outputCommand == 'T':
-                outputCommand = 'Q'
-
-        #current values become "last" values
-        if outputCommand == 'M':
-            subPathStart = tuple(params[-2:])
-        if outputCommand == 'Z':
-            pen = subPathStart
-        else:
-            pen = tuple(params[-2:])
+    >>> print formatPathArrays(*parsePathArrays('M0,0 l1,1 1,0 C1.5,2 1.25,3 0,0.1 Z'))
+    M0.0,0.0 L1.0,1.0 L2.0,1.0 C1.5,2.0,1.25,3.0,0.0,0.1 Z 
 
-        if outputCommand in ('Q','C'):
-            lastControl = tuple(params[-4:-2])
-        else:
-            lastControl = pen
-        lastCommand = command
+    @type  commands: numpy.ndarray
+    @param commands: commands of the path
 
-        retval.append([outputCommand,params])
-    return retval
+    @type  parameters: numpy.ndarray
+    @param parameters: parameters of commands of the path
+
+    @return: C{d} attrubute value of given path element.
+    @rtype: str
+    """
+    template = ''.join(map(PATH_COMMAND_TEMPLATES.__getitem__,
+                           commands.tolist()))
+    return template % tuple(parameters.tolist())
 
 def UnparsePath(PathParsePath):
     """
@@ -225,12 +348,93 @@ def UnparsePath(PathParsePath):
 
     @return: C{d} attrubute value of given path element.
     """
-    b=""
-    for s in PathParsePath:
-        b+=s[0]
-        b+=",".join(map(str,s[1]))
-        b+=" "
-    return b
+    return "".join([s[0] + ",".join(map(str,s[1])) + " "\
+                    for s in PathParsePath])
+
+# Number of line segments approximating a single Bezier curve in
+# L{flattenPath}
+BEZIER_FLATTENING_STEPS = 8
+
+def flattenPath(pathList, steps = BEZIER_FLATTENING_STEPS):
+    """
+    @type  pathList: list
+    @param pathList: path segments parsed by
+                     L{svgpathparse.parsePath<svgpathparse.parsePath>}
+
+    @type  steps: int
+    @param steps: number of line segments approximating a single curve
+
+    @return: polygons approximating subpaths of the path; every polygon is an
+             array of its vertices (of shape (n, 2))
+    @rtype: [numpy.ndarray, ...]
+
+    Approximates the path with polygons. Bezier curves are replaced by
+    C{steps} line segments, elliptical arcs are replaced by straight lines to
+    their end points.
+
+    Examples:
+        >>> [p.tolist() for p in flattenPath(parsePath('M0,0 L2,0 Q2,2 0,2 Z M5,5 L6,5 6,6'), 2)]
+        [[[0.0, 0.0], [2.0, 0.0], [1.5, 1.5], [0.0, 2.0]], [[5.0, 5.0], [6.0, 5.0], [6.0, 6.0]]]
+    """
+    t = np.linspace(0., 1., steps + 1)[1:, np.newaxis]
+    bernstein = {'Q': np.hstack(((1 - t) ** 2, 2 * (1 - t) * t, t ** 2)),
+                 'C': np.hstack(((1 - t) ** 3, 3 * (1 - t) ** 2 * t,
+                                 3 * (1 - t) * t ** 2, t ** 3))}
+
+    polygons = []
+    polygon = []
+    for (command, params) in pathList:
+        if command == 'M':
+            if len(polygon) > 1:
+                polygons.append(np.array(polygon))
+            polygon = [params[-2:]]
+
+        elif command in bernstein:
+            controlPoints = np.array([polygon[-1]] + chunks(params, 2))
+            polygon.extend(np.dot(bernstein[command], controlPoints).tolist())
+
+        elif command == 'Z':
+            # Next segments start from the beginning of the subpath
+            if len(polygon) > 1:
+                polygons.append(np.array(polygon))
+            polygon = polygon[:1]
+
+        else:
+            polygon.append(params[-2:])
+
+    if len(polygon) > 1:
+        polygons.append(np.array(polygon))
+    return polygons
+
+def flattenPathArrays(commands, parameters, steps = BEZIER_FLATTENING_STEPS):
+    """
+    Array counterpart of L{flattenPath}.
+
+    @type  commands: numpy.ndarray
+    @param commands: commands of the path (as returned by L{parsePathArrays})
+
+    @type  parameters: numpy.ndarray
+    @param parameters: parameters of commands of the path (as returned by
+                       L{parsePathArrays})
+
+    @type  steps: int
+    @param steps: number of line segments approximating a single curve
+
+    @return: polygons approximating subpaths of the path
+    @rtype: [numpy.ndarray, ...]
+
+    Examples:
+        >>> commands, parameters = parsePathArrays('M0,0 L2,0 Q2,2 0,2 Z M5,5 L6,5 6,6')
+        >>> [p.tolist() for p in flattenPathArrays(commands, parameters, 2)]
+        [[[0.0, 0.0], [2.0, 0.0], [1.5, 1.5], [0.0, 2.0]], [[5.0, 5.0], [6.0, 5.0], [6.0, 6.0]]]
+        >>> flattenPathArrays(*parsePathArrays('M 1,2 Z'))
+        []
+    """
+    counts = [PATH_COMMAND_PARAMETERS[command] for command in commands]
+    starts = np.cumsum([0] + counts)
+    return flattenPath([(command, parameters[start:start + count].tolist())\
+                        for (command, start, count)\
+                        in zip(commands, starts, counts)], steps)
 
 def chunks(l, n):
     """
@@ -257,25 +461,116 @@ def extractBoundingBox(pathString):
     Where x1,y2 are coordinates of top-left corner of bounding box and x2,y2 are
     coordinates of bottom-right corner of bounding box.
 
-    Please note that bounding box is only approximation of actual bounding box
-    and may be slightly larger as it is based on extreme coordinated of control
-    points creating given path. However, the difference is neglectable.
+    Bounding box is based on end points of path segments and extrema of
+    Bezier curves (see L{extractBoundingBoxArrays}). It is extended by one
+    unit in every direction and rounded.
 
     Examples:
         >>> print extractBoundingBox("M100,100 L200,200 C300,300 300,100 100,100 Z")
-        (99.0, 99.0, 301.0, 301.0)
+        (99.0, 99.0, 267.0, 229.0)
+    """
+
+    return extractBoundingBoxArrays(*parsePathArrays(pathString))
+
+def _getSegmentsEndPoints(commands, parameters):
     """
+    @type  commands: numpy.ndarray
+    @param commands: commands of the path (as returned by L{parsePathArrays})
+
+    @type  parameters: numpy.ndarray
+    @param parameters: parameters of commands of the path (as returned by
+                       L{parsePathArrays})
 
-    pathList = parsePath(pathString)
-    pathArr = []
+    @return: current point after every command of the path (for C{Z} command
+             it is the first point of the subpath) and index of first
+             parameter of every command
+    @rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    counts = np.zeros(len(commands), dtype=np.int_)
+    for (command, n) in PATH_COMMAND_PARAMETERS.iteritems():
+        counts[commands == command] = n
+    ends = np.cumsum(counts)
+
+    # Closepath moves the current point to the beginning of the subpath.
+    commandIndex = np.arange(len(commands))
+    subpathStart = np.maximum.accumulate(
+                        np.where(commands == 'M', commandIndex, 0))
+    endIndex = np.where(commands == 'Z', ends[subpathStart], ends) - 2
+
+    endPoints = np.column_stack((parameters[endIndex],
+                                 parameters[endIndex + 1]))
+    return endPoints, ends - counts
+
+def _getBezierExtremePoints(controlPoints):
+    """
+    @type  controlPoints: numpy.ndarray
+    @param controlPoints: array of shape (n, k, 2) of control points of n
+                          Bezier curves of degree k - 1 (k = 3 or 4)
+
+    @return: points of the curves where one of coordinates reaches its local
+             extremum (array of shape (m, 2))
+    @rtype: numpy.ndarray
+    """
+    P = controlPoints
+    with np.errstate(all='ignore'):
+        if P.shape[1] == 4:
+            # B'(t) / 3 = a t^2 + b t + c
+            a = -P[:,0] + 3 * P[:,1] - 3 * P[:,2] + P[:,3]
+            b = 2 * (P[:,0] - 2 * P[:,1] + P[:,2])
+            c = P[:,1] - P[:,0]
+
+            sqrtDelta = np.sqrt(b * b - 4 * a * c)
+            linear = -c / b
+            roots = [np.where(a != 0, (-b + sqrtDelta) / (2 * a), linear),
+                     np.where(a != 0, (-b - sqrtDelta) / (2 * a), linear)]
+        else:
+            # B'(t) / 2 = (P0 - 2 P1 + P2) t + P1 - P0
+            roots = [(P[:,0] - P[:,1]) / (P[:,0] - 2 * P[:,1] + P[:,2])]
+
+        # Parameters of extrema of both coordinates; invalid ones are
+        # replaced by 0 (the starting point of the curve).
+        t = np.concatenate([np.concatenate((r[:,0], r[:,1])) for r in roots])
+        t[~((t > 0) & (t < 1))] = 0
+    P = np.concatenate([P, P] * len(roots))
+
+    # Evaluate the curves with de Casteljau's algorithm.
+    t = t[:, np.newaxis, np.newaxis]
+    while P.shape[1] > 1:
+        P = (1 - t) * P[:,:-1] + t * P[:,1:]
+    return P[:,0]
+
+def extractBoundingBoxArrays(commands, parameters):
+    """
+    Array counterpart of L{extractBoundingBox}. Bounding box covers end
+    points of all segments and extrema of all Bezier curves, so it is the
+    exact bounding box of the path except elliptical arcs which are
+    represented only by their end points.
+
+    @type  commands: numpy.ndarray
+    @param commands: commands of the path (as returned by L{parsePathArrays})
+
+    @type  parameters: numpy.ndarray
+    @param parameters: parameters of commands of the path (as returned by
+                       L{parsePathArrays})
+
+    @return: tuple of four integers: (x1,y1,x2,y2)
+    """
+    endPoints, starts = _getSegmentsEndPoints(commands, parameters)
+    points = [endPoints]
+
+    for (command, degree) in [('C', 3), ('Q', 2)]:
+        selected = np.flatnonzero(commands == command)
+        if len(selected) == 0 or selected[0] == 0:
+            continue
 
-    for pointList in pathList:
-        for point in chunks(pointList[1],2):
-            pathArr.append(point)
+        # First control point is the end point of the previous segment
+        offsets = starts[selected, np.newaxis] + np.arange(2 * degree)
+        controlPoints = np.concatenate(
+                (endPoints[selected - 1, np.newaxis],
+                 parameters[offsets].reshape(-1, degree, 2)), axis=1)
+        points.append(_getBezierExtremePoints(controlPoints))
 
-    # Here we have list of string containing pairs of coordinates separated by
-    # comma: ['1,1', '3,3', ...]. We need to extract numbers from thode strings
-    pathArr = np.array(pathArr)
+    pathArr = np.concatenate(points)
     pathArr = np.concatenate((np.min(pathArr,0), np.max(pathArr,0))) +  np.array([-1,-1,1,1])
     return tuple(np.around(pathArr))
 